@@ -28,6 +28,22 @@ from chipwhisperer.common.utils.tracesource import PassiveTraceObserver
 from chipwhisperer.common.utils.analysissource import AnalysisSource, AnalysisObserver
 
 
+def traceBlocks(tracedata, tstart, tend, blocksize):
+    """
+    Walk traces tstart...tend (inclusive) in blocks of at most blocksize traces, yielding
+    (traces, textins, textouts, knownkeys) for each block. Memory use depends on blocksize only. Blocks
+    are fetched with TraceSource.getTraceBlock(), so unprocessed traces are sliced from the segment data
+    instead of being copied trace by trace.
+    """
+    tnum = tstart
+    while tnum <= tend:
+        stop = min(tnum + blocksize, tend + 1)
+        traces, textins, textouts, knownkeys = tracedata.getTraceBlock(tnum, stop)
+        if len(traces) > 0:
+            yield (traces, textins, textouts, knownkeys)
+        tnum = stop
+
+
 class AttackBaseClass(PassiveTraceObserver, AnalysisSource, Plugin):
     """Generic Attack Interface"""
     _name = "None"
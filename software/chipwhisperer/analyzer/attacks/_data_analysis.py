@@ -27,12 +27,17 @@
 import logging
 
 import numpy as np
+from chipwhisperer.common.results import _resultslog
 
 
 class DataAnalysis(object):
 
     def loadData(self, filename):
-        self.rawdata = np.load(filename)
+        if _resultslog.isResultsLog(filename):
+            self.rawdata = _resultslog.load(filename)
+        else:
+            # Results saved as .npy by older versions
+            self.rawdata = np.load(filename)
 
     def setKnownkey(self, knownkey):
         numsubkeys = len(self.rawdata[0]["diffsmax"])
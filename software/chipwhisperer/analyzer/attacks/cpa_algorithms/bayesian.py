@@ -26,8 +26,9 @@
 #=================================================
 
 import numpy as np
+from .._base import traceBlocks
 from chipwhisperer.common.utils.pluginmanager import Plugin
-from chipwhisperer.common.utils.parameter import Parameterized
+from chipwhisperer.common.utils.parameter import Parameterized, setupSetParam
 
 
 class AttackCPA_Bayesian(Parameterized, Plugin):
@@ -38,11 +39,103 @@ class AttackCPA_Bayesian(Parameterized, Plugin):
 
     def __init__(self, targetModel, leakageFunction):
         self.model = targetModel
+        self._blockSize = 0
+        self.getParams().addChildren([
+            {'name':'Block Size (0=all)', 'key':'blocksize', 'type':'int', 'limits':(0, 1E9), 'get':self.getBlockSize, 'set':self.setBlockSize},
+        ])
+
+    def getBlockSize(self):
+        return self._blockSize
+
+    @setupSetParam('Block Size (0=all)')
+    def setBlockSize(self, blocksize):
+        """Number of traces per streamed block, 0 loads all traces into memory at once"""
+        self._blockSize = blocksize
 
     def setByteList(self, brange):
         self.brange = brange
 
+    def hypothesis(self, pt, ct, key, bnum):
+        keyround=self.keyround
+        modeltype=self.modeltype
+
+        if keyround == "first":
+            ct = None
+        elif keyround == "last":
+            pt = None
+        else:
+            raise ValueError("keyround invalid")
+
+        #Generate the output of the SBOX
+        if modeltype == "Hamming Weight":
+            return self.model.HypHW(pt, ct, key, bnum)
+        elif modeltype == "Hamming Distance":
+            return self.model.HypHD(pt, ct, key, bnum)
+        else:
+            raise ValueError("modeltype invalid")
+
+    def addTracesStreaming(self, tracedata, tracerange, progressBar=None, algo="log"):
+        """
+        Same result as addTraces(), but walks the traces in blocks keeping only running sums. Uses
+        sum((hdiff/stddevh - tdiff/stddevt)^2) = 2*q*(1 - corr(h, t)), so only the CPA sums are needed.
+        """
+        brange=self.brange
+        self.all_diffs = range(0,16)
+
+        if progressBar:
+            progressBar.setStatusMask("Traces done: %d")
+            progressBar.setMaximum(tracerange[1] - tracerange[0])
+
+        sums = {}
+        for bnum in brange:
+            sums[bnum] = {'sumh':np.zeros(256), 'sumhq':np.zeros(256), 'sumht':0, 'sumt':0, 'sumtq':0}
+
+        q = 0
+        for (traces, textins, textouts, _) in traceBlocks(tracedata, tracerange[0], tracerange[1] - 1, self._blockSize):
+            q += len(traces)
+            for bnum in brange:
+                hyp = np.zeros((256, len(traces)), dtype=np.float64)
+                for tnum in range(len(traces)):
+                    pt = textins[tnum] if len(textins) > 0 else None
+                    ct = textouts[tnum] if len(textouts) > 0 else None
+                    for key in range(0, 256):
+                        hyp[key, tnum] = self.hypothesis(pt, ct, key, bnum)
+
+                s = sums[bnum]
+                s['sumh'] += np.sum(hyp, axis=1)
+                s['sumhq'] += np.sum(np.square(hyp), axis=1)
+                s['sumht'] += np.dot(hyp, traces)
+                s['sumt'] += np.sum(traces, axis=0, dtype=np.float64)
+                s['sumtq'] += np.sum(np.square(traces), axis=0, dtype=np.float64)
+
+            if progressBar:
+                progressBar.updateStatus(q, q)
+                if progressBar.wasAborted():
+                    return
+
+        for bnum in brange:
+            s = sums[bnum]
+            sumnum = q * s['sumht'] - np.outer(s['sumh'], s['sumt'])
+            sumden = np.outer(q * s['sumhq'] - np.square(s['sumh']), q * s['sumtq'] - np.square(s['sumt']))
+            sumstd = 2 * q * (1 - sumnum / np.sqrt(sumden))
+
+            if algo == "original":
+                diffs = pow(np.sqrt((sumstd/q)), -q)
+                diffs = diffs / np.sum(diffs, axis=0, dtype=np.float64)
+            elif algo == "log":
+                diffs = -q * ( (0.5*np.log(sumstd)) - np.log(q))
+                summation = np.log(np.sum(np.exp(diffs[1:] - diffs[0]), axis=0) + 1) + diffs[0]
+                diffs = diffs - summation
+            else:
+                raise RuntimeError("algo not defined")
+
+            self.all_diffs[bnum] = list(diffs)
+        self.algo = algo
+
     def addTraces(self, tracedata, tracerange, progressBar=None, pointRange=None, algo="log", tracesLoop=None):
+        if self._blockSize > 0:
+            return self.addTracesStreaming(tracedata, tracerange, progressBar, algo)
+
         keyround=self.keyround
         modeltype=self.modeltype
         brange=self.brange
@@ -61,9 +154,7 @@ class AttackCPA_Bayesian(Parameterized, Plugin):
         textins = []
         textouts = []
         knownkeys = []
-        for i in range(tracerange[0], tracerange[1]):
-            # Handle Offset
-            tnum = i + tracerange[0]
+        for tnum in range(tracerange[0], tracerange[1]):
             try:
                 data.append(tracedata.getTrace(tnum))
                 textins.append(tracedata.getTextin(tnum))
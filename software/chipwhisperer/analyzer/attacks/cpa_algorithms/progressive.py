@@ -39,16 +39,15 @@ class CPAProgressiveOneSubkey(object):
         self.clearStats()
 
     def clearStats(self):
-        self.sumhq = [0]*256
-        self.sumtq = [0]
-        self.sumt = [0]
-        self.sumh = [0]*256
-        self.sumht = [0]*256
+        self.sumhq = np.zeros(256, dtype=np.float64)
+        self.sumtq = 0
+        self.sumt = 0
+        self.sumh = np.zeros(256, dtype=np.float64)
+        self.sumht = 0
         self.totalTraces = 0
         self.modelstate = {'knownkey':None}
 
     def oneSubkey(self, bnum, pointRange, traces_all, numtraces, plaintexts, ciphertexts, knownkeys, progressBar, model, leakagetype, state, pbcnt):
-        diffs = [0]*256
         self.totalTraces += numtraces
 
         if pointRange == None:
@@ -65,92 +64,70 @@ class CPAProgressiveOneSubkey(object):
         self.sumt += np.sum(traces, axis=0)
         sumden2 = (np.square(self.sumt) - self.totalTraces * self.sumtq)
 
-        #For each 0..0xFF possible value of the key byte
-        for key in range(0, 256):
-            #Initialize arrays & variables to zero
-            sumnum = np.zeros(len(traces[0,:]))
-            # sumden1 = np.zeros(len(traces[0,:]))
-            # sumden2 = np.zeros(len(traces[0,:]))
+        #Formula for CPA & description found in "Power Analysis Attacks"
+        # by Mangard et al, page 124, formula 6.2.
+        #
+        # This has been modified to reduce computational requirements such that adding a new waveform
+        # doesn't require you to recalculate everything
 
-            hyp = [0] * numtraces
+        #Generate hypotheticals for all 256 guesses at once (256 x numtraces)
+        hyp = CPAProgressiveOneSubkey.hypotheses(bnum, numtraces, plaintexts, ciphertexts, knownkeys, model, leakagetype, state)
 
-            #Formula for CPA & description found in "Power Analysis Attacks"
-            # by Mangard et al, page 124, formula 6.2.
-            #
-            # This has been modified to reduce computational requirements such that adding a new waveform
-            # doesn't require you to recalculate everything
+        self.sumh += np.sum(hyp, axis=1)
+        self.sumht += np.dot(hyp, traces)
+        self.sumhq += np.sum(np.square(hyp), axis=1, dtype=np.float64)
 
-            #Generate hypotheticals
-            for tnum in range(numtraces):
+        #WARNING: not casting to np.float64 causes algorithm degredation... always be careful
+        sumnum = self.totalTraces * self.sumht - np.outer(self.sumh, self.sumt)
 
-                if len(plaintexts) > 0:
-                    pt = plaintexts[tnum]
+        #Sumden1/Sumden2 are variance of these variables, may be numeric unstability
+        #See http://en.wikipedia.org/wiki/Algorithms_for_calculating_variance for online update
+        #algorithm which might be better
+        sumden1 = (np.square(self.sumh) - self.totalTraces * self.sumhq)
+        sumden = np.outer(sumden1, sumden2)
 
-                if len(ciphertexts) > 0:
-                    ct = ciphertexts[tnum]
+        diffs = sumnum / np.sqrt(sumden)
+        # MARC: avoid NaN/inf results
+        diffs[~np.isfinite(diffs)] = 0
 
-                if knownkeys and len(knownkeys) > 0:
-                    nk = knownkeys[tnum]
-                else:
-                    nk = None
-
-                state['knownkey'] = nk
-
-                hypint = model.leakage(pt, ct, key, bnum, leakagetype, state)
-
-                hyp[tnum] = hypint
-
-            hyp = np.array(hyp)
-
-            self.sumh[key] += np.sum(hyp, axis=0)
-            self.sumht[key] += np.sum(np.multiply(np.transpose(traces), hyp), axis=1)
-
-            #WARNING: not casting to np.float64 causes algorithm degredation... always be careful
-            #meanh = self.sumh[key] / np.float64(self.totalTraces)
-            #meant = self.sumt[key] / np.float64(self.totalTraces)
-
-            #numtraces * meanh * meant = sumh * meant
-            #sumnum =  self.sumht[key] - meant*self.sumh[key] - meanh*self.sumt[key] + (self.sumh[key] * meant)
-            #sumnum =  self.sumht[key] - meanh*self.sumt[key]
-#            sumnum =  self.sumht[key] - meanh*self.sumt[key]
-            #sumnum =  self.sumht[key] - self.sumh[key]*self.sumt[key] / np.float64(self.totalTraces)
-            sumnum = self.totalTraces * self.sumht[key] - self.sumh[key] * self.sumt
-
-            self.sumhq[key] += np.sum(np.square(hyp),axis=0, dtype=np.float64)
+        if progressBar:
+            progressBar.updateStatus(pbcnt, (self.totalTraces-numtraces, self.totalTraces-1, bnum))
+        pbcnt = pbcnt + 256
 
-            #numtraces * meanh * meanh = sumh * meanh
-            #sumden1 = sumhq - (2*meanh*self.sumh) + (numtraces*meanh*meanh)
-            #sumden1 = sumhq - (2*meanh*self.sumh) + (self.sumh * meanh)
-            # sumden1 = sumhq - meanh*self.sumh
-            # similarly for sumden2
-            #sumden1 = self.sumhq[key] - meanh*self.sumh[key]
-            #sumden2 = self.sumtq[key] - meant*self.sumt[key]
-            # sumden = sumden1 * sumden2
+        return (diffs, pbcnt)
 
-            #Sumden1/Sumden2 are variance of these variables, may be numeric unstability
-            #See http://en.wikipedia.org/wiki/Algorithms_for_calculating_variance for online update
-            #algorithm which might be better
-            sumden1 = (np.square(self.sumh[key]) - self.totalTraces * self.sumhq[key])
-            sumden = sumden1 * sumden2
+    @staticmethod
+    def hypotheses(bnum, numtraces, plaintexts, ciphertexts, knownkeys, model, leakagetype, state):
+        """Return the (256 x numtraces) hypothesis matrix, using the batched model API when available"""
+        if hasattr(model, 'leakageMatrix'):
+            state['knownkey'] = knownkeys
+            hyp = model.leakageMatrix(plaintexts, ciphertexts, bnum, leakagetype, state)
+            if hyp is not None:
+                return hyp
 
-            #if sumden.any() < 1E-12:
-            #    print "WARNING: sumden small"
+        hyp = np.zeros((256, numtraces), dtype=np.float64)
+        for tnum in range(numtraces):
+            if len(plaintexts) > 0:
+                pt = plaintexts[tnum]
+            else:
+                pt = []
 
-            diffs[key] = sumnum / np.sqrt(sumden)
-            # MARC: avoid NaN/inf results
-            diffs[key][~np.isfinite(diffs[key])] = 0
+            if len(ciphertexts) > 0:
+                ct = ciphertexts[tnum]
+            else:
+                ct = []
 
-            if progressBar:
-                progressBar.updateStatus(pbcnt, (self.totalTraces-numtraces, self.totalTraces-1, bnum))
-            pbcnt = pbcnt + 1
+            if knownkeys and len(knownkeys) > 0:
+                nk = knownkeys[tnum]
+            else:
+                nk = None
 
-            # if padafter > 0:
-            #    diffs[key] = np.concatenate([diffs[key], np.zeros(padafter)])
+            state['knownkey'] = nk
 
-            # if padbefore > 0:
-            #    diffs[key] = np.concatenate([np.zeros(padbefore), diffs[key]])
+            for key in range(0, 256):
+                hyp[key, tnum] = model.leakage(pt, ct, key, bnum, leakagetype, state)
 
-        return (diffs, pbcnt)
+        return hyp
 
 
 class CPAProgressive(Parameterized, AutoScript, Plugin):
@@ -228,27 +205,11 @@ class CPAProgressive(Parameterized, AutoScript, Plugin):
                 if tstart > numtraces:
                     tstart = numtraces
 
-                data = []
-                textins = []
-                textouts = []
-                knownkeys = []
-                for i in range(tstart, tend):
-                    # Handle Offset
-                    tnum = i + tracerange[0]
-
-                    try:
-                        data.append(tracedata.getTrace(tnum))
-                        textins.append(tracedata.getTextin(tnum))
-                        textouts.append(tracedata.getTextout(tnum))
-                        knownkeys.append(tracedata.getKnownKey(tnum))
-                    except Exception, e:
-                        progressBar.abort(e.message)
-                        return
-
-                traces = np.array(data)
-                textins = np.array(textins)
-                textouts = np.array(textouts)
-                # knownkeys = np.array(knownkeys)
+                try:
+                    (traces, textins, textouts, knownkeys) = tracedata.getTraceBlock(tstart + tracerange[0], tend + tracerange[0])
+                except Exception, e:
+                    progressBar.abort(e.message)
+                    return
 
                 for bnum_bf in brange_bf:
                     if bf:
@@ -262,7 +223,7 @@ class CPAProgressive(Parameterized, AutoScript, Plugin):
                             bptrange = pointRange[bnum]
                         else:
                             bptrange = pointRange
-                        (data, pbcnt) = cpa[bnum].oneSubkey(bnum, bptrange, traces, tend - tstart, textins, textouts, knownkeys, progressBar, self.model, self.leakage, cpa[bnum].modelstate, pbcnt)
+                        (data, pbcnt) = cpa[bnum].oneSubkey(bnum, bptrange, traces, len(traces), textins, textouts, knownkeys, progressBar, self.model, self.leakage, cpa[bnum].modelstate, pbcnt)
                         self.stats.updateSubkey(bnum, data, tnum=tend)
                     else:
                         skip = True
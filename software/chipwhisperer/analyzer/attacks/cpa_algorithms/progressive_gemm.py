@@ -0,0 +1,149 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2014, NewAE Technology Inc
+# All rights reserved.
+#
+# Authors: Colin O'Flynn
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+
+
+import numpy as np
+import math
+from .progressive import CPAProgressive, CPAProgressiveOneSubkey
+
+
+class CPAProgressiveSubkeyGroup(object):
+    """
+    Progressive CPA for a group of subkeys sharing the same point range. The hypotheses of all subkeys
+    and guesses are stacked into one (len(bnums)*256 x N) matrix, so each block of traces needs just
+    a single matrix product to update every sumht.
+    """
+    def __init__(self, bnums, pointRange):
+        self.bnums = bnums
+        self.pointRange = pointRange
+        self.clearStats()
+
+    def clearStats(self):
+        nhyp = len(self.bnums) * 256
+        self.sumhq = np.zeros(nhyp, dtype=np.float64)
+        self.sumtq = 0
+        self.sumt = 0
+        self.sumh = np.zeros(nhyp, dtype=np.float64)
+        self.sumht = 0
+        self.totalTraces = 0
+        self.modelstate = {'knownkey':None}
+
+    def addTraces(self, traces_all, numtraces, plaintexts, ciphertexts, knownkeys, model, leakagetype):
+        """Add a block of traces, return a dictionary with the (256 x points) diffs of each subkey"""
+        self.totalTraces += numtraces
+
+        if self.pointRange is None:
+            traces = traces_all
+        else:
+            traces = traces_all[:, self.pointRange[0] : self.pointRange[1]]
+
+        hyp = np.empty((len(self.bnums) * 256, numtraces), dtype=np.float64)
+        for i, bnum in enumerate(self.bnums):
+            hyp[i*256:(i+1)*256] = CPAProgressiveOneSubkey.hypotheses(bnum, numtraces, plaintexts, ciphertexts, knownkeys, model, leakagetype, self.modelstate)
+
+        self.sumtq += np.sum(np.square(traces), axis=0, dtype=np.float64)
+        self.sumt += np.sum(traces, axis=0)
+        self.sumh += np.sum(hyp, axis=1)
+        self.sumhq += np.sum(np.square(hyp), axis=1, dtype=np.float64)
+        self.sumht += np.dot(hyp, traces)
+
+        # Same formula as CPAProgressiveOneSubkey, but for all rows at once
+        sumnum = self.totalTraces * self.sumht - np.outer(self.sumh, self.sumt)
+        sumden1 = (np.square(self.sumh) - self.totalTraces * self.sumhq)
+        sumden2 = (np.square(self.sumt) - self.totalTraces * self.sumtq)
+
+        diffs = sumnum / np.sqrt(np.outer(sumden1, sumden2))
+        diffs[~np.isfinite(diffs)] = 0
+
+        return dict((bnum, diffs[i*256:(i+1)*256]) for i, bnum in enumerate(self.bnums))
+
+
+class CPAProgressive_GEMM(CPAProgressive):
+    """
+    Progressive CPA attacking all subkeys at once: each reporting interval is read once and correlated
+    against the hypotheses of every subkey with one matrix multiply (per distinct point range).
+    Needs memory for a (#subkeys*256 x #points) accumulator.
+    """
+    _name = "Progressive-All Subkeys"
+
+    def addTraces(self, tracedata, tracerange, progressBar=None, pointRange=None):
+        brange = self.brange
+        numtraces = tracerange[1] - tracerange[0] + 1
+
+        if progressBar:
+            progressBar.setText("Attacking traces subset: from %d to %d (total = %d)" % (tracerange[0], tracerange[1], numtraces))
+            progressBar.setStatusMask("Trace Interval: %d-%d")
+            progressBar.setMaximum(math.ceil(float(numtraces) / self._reportingInterval) - 1)
+
+        # Subkeys with identical point ranges share one hypothesis matrix
+        groups = []
+        for bnum in brange:
+            if isinstance(pointRange, list):
+                bptrange = pointRange[bnum]
+            else:
+                bptrange = pointRange
+
+            for g in groups:
+                if g.pointRange == bptrange:
+                    g.bnums.append(bnum)
+                    break
+            else:
+                groups.append(CPAProgressiveSubkeyGroup([bnum], bptrange))
+
+        for g in groups:
+            g.clearStats()
+
+        pbcnt = 0
+        tstart = 0
+        tend = self._reportingInterval
+
+        while tstart < numtraces:
+            if tend > numtraces:
+                tend = numtraces
+
+            try:
+                (traces, textins, textouts, knownkeys) = tracedata.getTraceBlock(tstart + tracerange[0], tend + tracerange[0])
+            except Exception, e:
+                progressBar.abort(e.message)
+                return
+
+            for g in groups:
+                diffs = g.addTraces(traces, len(traces), textins, textouts, knownkeys, self.model, self.leakage)
+                for bnum in g.bnums:
+                    self.stats.updateSubkey(bnum, diffs[bnum], tnum=tend)
+
+            if progressBar:
+                progressBar.updateStatus(pbcnt, (tstart + tracerange[0], tend - 1 + tracerange[0]))
+                if progressBar.wasAborted():
+                    return
+            pbcnt = pbcnt + 1
+
+            tend += self._reportingInterval
+            tstart += self._reportingInterval
+
+            if self.sr:
+                self.sr()
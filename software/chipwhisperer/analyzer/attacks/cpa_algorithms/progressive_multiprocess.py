@@ -0,0 +1,199 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013-2014, NewAE Technology Inc
+# All rights reserved.
+#
+# Authors: Colin O'Flynn
+#
+# Find this and more at newae.com - this file is part of the chipwhisperer
+# project, http://www.assembla.com/spaces/chipwhisperer
+#
+#    This file is part of chipwhisperer.
+#
+#    chipwhisperer is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    chipwhisperer is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
+#=================================================
+
+
+import importlib
+import math
+import multiprocessing
+import traceback
+from Queue import Empty
+import numpy as np
+from multiprocessing.sharedctypes import RawArray
+from chipwhisperer.common.utils.parameter import setupSetParam
+from .progressive import CPAProgressive, CPAProgressiveOneSubkey
+
+
+# Seconds between checks that the workers are still running while waiting for results
+POLL_TIMEOUT = 1.0
+
+
+def _subkeyWorker(bnums, pointRanges, modelName, leakagetype, traceBuffer, diffsBuffer, maxPoints, jobs, results):
+    """
+    Worker process: owns the CPAProgressiveOneSubkey state of the subkeys in bnums. Each job is one block of
+    traces published by the parent in traceBuffer, the diffs are written into this worker's rows of diffsBuffer.
+    """
+    model = importlib.import_module(modelName)
+    cpa = dict((bnum, CPAProgressiveOneSubkey()) for bnum in bnums)
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+
+        (numtraces, npoints, textins, textouts, knownkeys) = job
+        try:
+            traces = np.frombuffer(traceBuffer, dtype=np.float64, count=numtraces*npoints).reshape(numtraces, npoints)
+            for bnum in bnums:
+                (diffs, _) = cpa[bnum].oneSubkey(bnum, pointRanges[bnum], traces, numtraces, textins, textouts, knownkeys,
+                                                 None, model, leakagetype, cpa[bnum].modelstate, 0)
+                out = np.frombuffer(diffsBuffer, dtype=np.float64, count=256*maxPoints, offset=bnum*256*maxPoints*8)
+                out = out.reshape(256, maxPoints)
+                out[:, 0:diffs.shape[1]] = diffs
+                results.put((bnum, diffs.shape[1]))
+        except Exception:
+            results.put((None, traceback.format_exc()))
+
+
+class CPAProgressive_MultiProcess(CPAProgressive):
+    """
+    Progressive CPA with the subkeys split over several worker processes. Each reporting interval is copied once
+    into shared memory, workers own disjoint subkeys and write their diffs back into a shared result buffer.
+    """
+    _name = "Progressive-Multiprocess"
+
+    def __init__(self, targetModel, leakageFunction):
+        self._processes = multiprocessing.cpu_count()
+        CPAProgressive.__init__(self, targetModel, leakageFunction)
+        self.getParams().addChildren([
+            {'name':'Processes', 'key':'processes', 'type':'int', 'limits':(1, 256), 'get':self.getProcesses, 'set':self.setProcesses},
+        ])
+        self.updateScript()
+
+    def updateScript(self, ignored=None):
+        CPAProgressive.updateScript(self, ignored)
+        self.addFunction('init', 'setProcesses', '%d' % self._processes)
+
+    def getProcesses(self):
+        return self._processes
+
+    @setupSetParam('Processes')
+    def setProcesses(self, processes):
+        self._processes = processes
+        self.updateScript()
+
+    @staticmethod
+    def _terminate(workers):
+        for (p, _) in workers:
+            if p.is_alive():
+                p.terminate()
+
+    def _waitResult(self, results, workers):
+        """Next (bnum, info) from the workers, raises if one of them failed or exited"""
+        while True:
+            try:
+                (bnum, info) = results.get(timeout=POLL_TIMEOUT)
+            except Empty:
+                dead = [p for (p, _) in workers if not p.is_alive()]
+                if dead:
+                    self._terminate(workers)
+                    raise RuntimeError("CPA worker process exited unexpectedly (exit code %s)" % dead[0].exitcode)
+                continue
+
+            if bnum is None:
+                self._terminate(workers)
+                raise RuntimeError("CPA worker process failed:\n%s" % info)
+            return (bnum, info)
+
+    def addTraces(self, tracedata, tracerange, progressBar=None, pointRange=None):
+        brange = self.brange
+        numtraces = tracerange[1] - tracerange[0] + 1
+        numpoints = tracedata.numPoints()
+
+        if progressBar:
+            progressBar.setText("Attacking traces subset: from %d to %d (total = %d)" % (tracerange[0], tracerange[1], numtraces))
+            progressBar.setStatusMask("Trace Interval: %d-%d")
+            progressBar.setMaximum(math.ceil(float(numtraces) / self._reportingInterval) - 1)
+
+        pointRanges = {}
+        for bnum in brange:
+            if isinstance(pointRange, list):
+                pointRanges[bnum] = pointRange[bnum]
+            else:
+                pointRanges[bnum] = pointRange
+
+        # Allocated before starting the workers so they inherit it
+        traceBuffer = RawArray('d', self._reportingInterval * numpoints)
+        diffsBuffer = RawArray('d', (max(brange) + 1) * 256 * numpoints)
+        results = multiprocessing.Queue()
+
+        nproc = max(1, min(self._processes, len(brange)))
+        workers = []
+        for i in range(0, nproc):
+            jobs = multiprocessing.Queue()
+            p = multiprocessing.Process(target=_subkeyWorker, args=(brange[i::nproc], pointRanges, self.model.__name__, self.leakage,
+                                                                    traceBuffer, diffsBuffer, numpoints, jobs, results))
+            p.daemon = True
+            p.start()
+            workers.append((p, jobs))
+
+        try:
+            pbcnt = 0
+            tstart = 0
+            tend = self._reportingInterval
+
+            while tstart < numtraces:
+                if tend > numtraces:
+                    tend = numtraces
+
+                try:
+                    (data, textins, textouts, knownkeys) = tracedata.getTraceBlock(tstart + tracerange[0], tend + tracerange[0])
+                except Exception, e:
+                    progressBar.abort(e.message)
+                    return
+
+                traces = np.frombuffer(traceBuffer, dtype=np.float64, count=len(data)*numpoints).reshape(len(data), numpoints)
+                traces[:] = data
+
+                job = (len(data), numpoints, textins, textouts, knownkeys)
+                for (_, jobs) in workers:
+                    jobs.put(job)
+
+                # Wait for every subkey before the trace buffer gets reused
+                for _ in brange:
+                    (bnum, info) = self._waitResult(results, workers)
+                    diffs = np.frombuffer(diffsBuffer, dtype=np.float64, count=256*numpoints, offset=bnum*256*numpoints*8)
+                    diffs = np.array(diffs.reshape(256, numpoints)[:, 0:info])
+                    self.stats.updateSubkey(bnum, diffs, tnum=tend)
+
+                if progressBar:
+                    progressBar.updateStatus(pbcnt, (tstart + tracerange[0], tend - 1 + tracerange[0]))
+                    if progressBar.wasAborted():
+                        return
+                pbcnt = pbcnt + 1
+
+                tend += self._reportingInterval
+                tstart += self._reportingInterval
+
+                if self.sr:
+                    self.sr()
+        finally:
+            for (_, jobs) in workers:
+                jobs.put(None)
+            for (p, _) in workers:
+                p.join(1)
+                if p.is_alive():
+                    p.terminate()
@@ -26,9 +26,11 @@
 #=================================================
 
 import numpy as np
+from .._base import traceBlocks
 from .._stats import DataTypeDiffs
+from .progressive import CPAProgressiveOneSubkey
 from chipwhisperer.common.utils.pluginmanager import Plugin
-from chipwhisperer.common.utils.parameter import Parameterized, Parameter
+from chipwhisperer.common.utils.parameter import Parameterized, Parameter, setupSetParam
 
 
 class CPASimpleLoop(Parameterized, Plugin):
@@ -36,6 +38,9 @@ class CPASimpleLoop(Parameterized, Plugin):
     CPA Attack done as a loop - the 'classic' attack provided for familiarity to textbook samples.
     This attack does not provide trace-by-trace statistics however, you can only gather results once
     all the traces have been run through the attack.
+
+    With a block size set, traces are streamed through online sums in blocks of that many traces
+    instead of being loaded all at once, so memory use no longer depends on the number of traces.
     """
     _name = "Simple"
 
@@ -44,6 +49,18 @@ class CPASimpleLoop(Parameterized, Plugin):
         self.leakage = leakageFunction
         self.stats = DataTypeDiffs()
         self.modelstate = {'knownkey':None}
+        self._blockSize = 0
+        self.getParams().addChildren([
+            {'name':'Block Size (0=all)', 'key':'blocksize', 'type':'int', 'limits':(0, 1E9), 'get':self.getBlockSize, 'set':self.setBlockSize},
+        ])
+
+    def getBlockSize(self):
+        return self._blockSize
+
+    @setupSetParam('Block Size (0=all)')
+    def setBlockSize(self, blocksize):
+        """Number of traces per streamed block, 0 loads all traces into memory at once"""
+        self._blockSize = blocksize
 
     def oneSubkey(self, bnum, pointRange, traces_all, numtraces, plaintexts, ciphertexts, knownkeys, progressBar, model, leakagetype, state, pbcnt):
         diffs = [0]*256
@@ -134,6 +151,9 @@ class CPASimpleLoop(Parameterized, Plugin):
         pass
 
     def addTraces(self, tracedata, tracerange, progressBar=None, pointRange=None, tracesLoop=None):
+        if self._blockSize > 0:
+            return self.addTracesStreaming(tracedata, tracerange, progressBar, pointRange)
+
         brange=self.brange
         self.all_diffs = range(0,16)
         numtraces = tracerange[1] - tracerange[0] + 1
@@ -148,11 +168,7 @@ class CPASimpleLoop(Parameterized, Plugin):
         textins = []
         textouts = []
         knownkeys = []
-        for i in range(tracerange[0], tracerange[1]+1):
-
-            # Handle Offset
-            tnum = i + tracerange[0]
-
+        for tnum in range(tracerange[0], tracerange[1]+1):
             d = tracedata.getTrace(tnum)
             if d is None:
                 continue
@@ -173,6 +189,37 @@ class CPASimpleLoop(Parameterized, Plugin):
             if progressBar:
                 progressBar.updateStatus(pbcnt, bnum)
 
+    def addTracesStreaming(self, tracedata, tracerange, progressBar=None, pointRange=None):
+        """Same result as addTraces(), but walks the traces in blocks and keeps only the running sums"""
+        brange = self.brange
+        numtraces = tracerange[1] - tracerange[0] + 1
+
+        if progressBar:
+            progressBar.setText("Attacking traces: from %d to %d (total = %d)" % (tracerange[0], tracerange[1], numtraces))
+            progressBar.setStatusMask("Traces done: %d")
+            progressBar.setMaximum(numtraces)
+
+        cpa = {}
+        diffs = {}
+        for bnum in brange:
+            cpa[bnum] = CPAProgressiveOneSubkey()
+
+        done = 0
+        for (traces, textins, textouts, knownkeys) in traceBlocks(tracedata, tracerange[0], tracerange[1], self._blockSize):
+            for bnum in brange:
+                (diffs[bnum], _) = cpa[bnum].oneSubkey(bnum, pointRange, traces, len(traces), textins, textouts, knownkeys, None,
+                                                        self.model, self.leakage, cpa[bnum].modelstate, 0)
+
+            done += len(traces)
+            if progressBar:
+                progressBar.updateStatus(done, done)
+                if progressBar.wasAborted():
+                    return
+
+        for bnum in brange:
+            if bnum in diffs:
+                self.stats.updateSubkey(bnum, diffs[bnum], tnum=tracerange[1])
+
     def getStatistics(self):
         return self.stats
 
@@ -15,16 +15,11 @@ from chipwhisperer.common.api.autoscript import AutoScript
 from chipwhisperer.common.utils.pluginmanager import Plugin
 from chipwhisperer.common.utils.parameter import Parameterized, Parameter
 
-from chipwhisperer.analyzer.partition.keeloq import keeloqPartition_CiphertextMSB
 from chipwhisperer.analyzer.models.keeloq import keeloqDecrypt
+from chipwhisperer.analyzer.models.keeloq import keeloqDecryptKeybit
 from chipwhisperer.analyzer.models.keeloq import keeloqFormatKeystream
-
-# TODO: The following two imports are made to avoid duplicating code.  However, those classes are
-#       designed to work in the GUI environment.  Consider separating function from presentation.
-from chipwhisperer.analyzer.utils.Partition import Partition
-from chipwhisperer.analyzer.utils.TraceExplorerScripts.PartitionDisplay import PartitionDisplay
-
-from chipwhisperer.analyzer.utils.TraceExplorerScripts.PartitionDisplay import DifferenceModeTTest
+from chipwhisperer.analyzer.partition.keeloq import keeloqCiphertexts
+from chipwhisperer.analyzer.utils import PartitionStats
 from chipwhisperer.common.api.CWCoreAPI import CWCoreAPI
 
 
@@ -41,6 +36,45 @@ from chipwhisperer.common.api.CWCoreAPI import CWCoreAPI
 #       not satisfying, we can go back to the watchlist and explore the opposite variants.
 
 
+#--- Single-pass engine
+#
+#    Each key bit is attacked with keeloqPartition_CiphertextMSB and keystream "<known> <guess> 0":
+#    the partition is the LSB after decrypting the known keystream, the guessed bit and a dummy bit
+#    (see below why). Instead of partitioning and collecting statistics once per guess, every trace
+#    is put in one of four classes, (LSB with guess 0, LSB with guess 1), and the statistics of both
+#    guesses' partitions are merged from the four classes after a single pass over the traces.
+#    Ciphertexts are decrypted by one round per key bit, for all traces at once.
+
+def keeloqGuessClasses(data):
+    """Class of each trace: 2 * partition with guess bit 0 + partition with guess bit 1"""
+    # The dummybit is necessary because of a property of Keeloq.  The last bit of the stream is
+    # mixed into the attacked data bit with XOR.  This results in exactly complementary partitioning
+    # for values 0 vs 1, making it impossible to pick a "winner".  Therefore we append the dummybit
+    # at this position, so that guessbit is the last input that actually makes a measureable difference.
+    part0 = keeloqDecryptKeybit(keeloqDecryptKeybit(data, 0), 0) & 1
+    part1 = keeloqDecryptKeybit(keeloqDecryptKeybit(data, 1), 0) & 1
+    return (2 * part0 + part1).astype(np.int32)
+
+
+# Classes in partition 0 and 1, for each guess bit
+GUESS_PARTITIONS = (((0, 1), (2, 3)),
+                    ((0, 2), (1, 3)))
+
+
+def keeloqGuessDiffs(tracedata, tnums, classes, pointRange):
+    """T-Test of the partitions of guess bit 0 and 1, from one statistics pass over traces tnums (points in pointRange)"""
+    partData = [[tnums[classes == c] for c in range(0, 4)]]
+    stats = PartitionStats.partitionStats(tracedata, partData, (tnums[0], tnums[-1] + 1), pointRange)
+
+    guessDiffs = []
+    for partitions in GUESS_PARTITIONS:
+        merged = [PartitionStats.mergePartitions(stats["mean"][0], stats["variance"][0], stats["number"][0], members)
+                  for members in partitions]
+        means, variances, numbers = zip(*merged)
+        guessDiffs.append(PartitionStats.ttestSum(means, variances, numbers))
+    return guessDiffs
+
+
 #--- Attack class
 
 class KeeloqDPAEncoderBit(Parameterized, AutoScript, Plugin):
@@ -117,14 +151,16 @@ class KeeloqDPAEncoderBit(Parameterized, AutoScript, Plugin):
 
         #--- prepare environment
 
-        partClass  = keeloqPartition_CiphertextMSB
+        start = tracerange[0]
+        end   = tracerange[1]
+        if end == -1:
+            end = tracedata.numTraces()
 
-        partObject = Partition()
-        partObject.setPartMethod(partClass)
-        partObject.setTraceSource(tracedata)
+        pointStart = max(pointRange[0], 0)
+        pointStop  = pointRange[1] if (pointRange[1] >= 0) else tracedata.numPoints() + 1 + pointRange[1]
 
-        partDisplay = PartitionDisplay(None)
-        partDisplay._traces = tracedata
+        tnums = np.arange(start, end)
+        data  = keeloqCiphertexts(tracedata, start, end)
 
         if progressBar:
             progressBar.setMaximum(64 + 1)
@@ -135,75 +171,36 @@ class KeeloqDPAEncoderBit(Parameterized, AutoScript, Plugin):
 
         for bit in range(0, 64):
 
-            #--- Analize all possible values (0 and 1)
-
-            guessNum   = 2
-            guessDiffs = [] * guessNum
-
-            #--- Partition and find differences using T-Test
-
-            if bit==48:
-                print "\nTODO: Sorry for becoming slower, the cipher implementation has not been optimized yet.\n"
-
-            for guessBit in range (0, guessNum):
-
-                # Probe known keystream + guessbit + dummybit
-                #
-                # The dummybit is necessary because of a property of Keeloq.  The last bit of the stream is
-                # mixed into the attacked data bit with XOR.  This results in exactly complementary partitioning
-                # for values 0 vs 1, making it impossible to pick a "winner".  Therefore we append the dummybit
-                # at this position, so that guessbit is the last input that actually makes a measureable difference.
-
-                partData  = partObject.generatePartitions(partitionClass=None,
-                                         saveFile=False, loadFile=False, tRange=tracerange,
-                                         partitionConfig={"keystream":"%s %d 0" % (keystream, guessBit)})
-
-                partStats = partDisplay.generatePartitionStats(partitionData={"partclass":partClass, "partdata":partData},
-                                         saveFile=False, loadFile=False,  tRange=tracerange, pointRange=pointRange)
-
-                partDiffs = partDisplay.generatePartitionDiffs(DifferenceModeTTest,
-                                         statsInfo={"partclass":partClass, "stats":partStats},
-                                         saveFile=False, loadFile=False, tRange=tracerange)
-
-                guessDiffs.append(partDiffs[0])
-# TODO: since we calculate 0 and 1 anyway we should call the partition mode just once and use a mode that produces 2 keys (0,1)
-
             #--- Determine range in which high correlation is expected
 
-            # TODO: for strict round timing, it is faster to do partStats only for the desired pointRange
-
             if roundwidth <= 0: # look in whole pointRange
-                lookStart = 0
-                lookStop  = len(guessDiffs[0])
+                lookStart = pointStart
+                lookStop  = pointStop
 
             else: # look only at expected position (enforce round timing)
                 round      = 528 - 32 - (bit+1)
-                roundStart = round528 - ((528-round) * roundwidth)
-                roundStop  = roundStart + roundwidth
-
-                lookStart  = roundStart - pointRange[0]
-                lookStop   = roundStop  - pointRange[0]
+                lookStart  = round528 - ((528-round) * roundwidth)
+                lookStop   = lookStart + roundwidth
 
-                # print "Round=%d Pos=%d-%d look=%d-%d" % (round, roundStart, roundStop, lookStart, lookStop)
+                # print "Round=%d Pos=%d-%d" % (round, lookStart, lookStop)
 
-                if (lookStart < 0) or (lookStop > len(guessDiffs[0])):
+                if (lookStart < pointStart) or (lookStop > pointStop):
                     print "Enforced round timing range (%d,%d) is outside of analyzed pointRange(%d,%d). "\
                           "Can't detect key bit %d. Result so far: %s" %\
-                                   (roundStart, roundStop, pointRange[0], pointRange[1], bit, keystream)
+                                   (lookStart, lookStop, pointRange[0], pointRange[1], bit, keystream)
                     return
 
+            #--- Partition into the classes of both guesses, T-Test of both from one pass (only the look range)
+
+            guessDiffs = keeloqGuessDiffs(tracedata, tnums, keeloqGuessClasses(data), (lookStart, lookStop))
+
             #--- Detect highest correlation
- 
-            # print "Looking at range %d-%d of %d" % (lookStart, lookStop, len(guessDiffs[0]))
-            # if bit == 0:
-            #     print guessDiffs[0][lookStart:lookStop]
-            #     print guessDiffs[1][lookStart:lookStop]
 
-            winBit = 0 if (np.nanmax(guessDiffs[0][lookStart:lookStop]) > np.nanmax(guessDiffs[1][lookStart:lookStop])) else 1
+            winBit = 0 if (np.nanmax(guessDiffs[0]) > np.nanmax(guessDiffs[1])) else 1
             badBit = winBit ^ 1
 
-            winOffset     = np.argmax(guessDiffs[winBit][lookStart:lookStop]) + lookStart
-            badOffset     = np.argmax(guessDiffs[badBit][lookStart:lookStop]) + lookStart
+            winOffset     = np.argmax(guessDiffs[winBit])
+            badOffset     = np.argmax(guessDiffs[badBit])
 
             winDiff       =           guessDiffs[winBit][winOffset]
             badDiff       =           guessDiffs[badBit][badOffset]
@@ -211,13 +208,14 @@ class KeeloqDPAEncoderBit(Parameterized, AutoScript, Plugin):
             winRatioTrace = winDiff / badDiff
 
             keystream = "%s%d" % (keystream, winBit)
+            data      = keeloqDecryptKeybit(data, winBit)
 
             #--- report
 
             print "Analysis of keybit #%02d (of 64): %d (diff=%f spot=%f trace=%f pos=%d) vs %d (diff=%f pos=%d)" %\
                                               (bit,
-                                               winBit, winDiff, winRatioSpot, winRatioTrace, winOffset + pointRange[0],
-                                               badBit, badDiff,                              badOffset + pointRange[0])
+                                               winBit, winDiff, winRatioSpot, winRatioTrace, winOffset + lookStart,
+                                               badBit, badDiff,                              badOffset + lookStart)
 
             if progressBar:
                 progressBar.setText("Attacking key bits (%d of 64)" % bit)
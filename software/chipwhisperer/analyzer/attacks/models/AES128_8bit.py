@@ -24,6 +24,7 @@
 #    You should have received a copy of the GNU General Public License
 #    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
 
+import numpy as np
 from chipwhisperer.analyzer.models.aes.funcs import sbox, inv_sbox
 from chipwhisperer.analyzer.models.aes.key_schedule import keyScheduleRounds
 from chipwhisperer.common.utils import util
@@ -67,6 +68,12 @@ SHIFT = []
 
 INVSHIFT = [0, 5, 10, 15, 4, 9, 14, 3, 8, 13, 2, 7, 12, 1, 6, 11]
 
+# Lookup tables used by leakageMatrix(), indexed with whole arrays at once
+HW8BitTable = np.array(HW8Bit, dtype=np.uint8)
+SBoxTable = np.array([sbox(i) for i in range(0, 256)], dtype=np.uint8)
+InvSBoxTable = np.array([inv_sbox(i) for i in range(0, 256)], dtype=np.uint8)
+GuessTable = np.arange(0, 256, dtype=np.uint8).reshape(256, 1)
+
 
 def processKnownKey(setting, inpkey):
 
@@ -109,6 +116,44 @@ def leakage(pt, ct, guess, bnum, setting, state):
         raise ValueError("Invalid setting: %s" % str(setting))
 
 
+def leakageMatrix(pts, cts, bnum, setting, state):
+    """
+    Batched version of leakage(): pts/cts are (N x 16) arrays of all texts of a trace block. Returns the
+    (256 x N) hypothesis matrix (one row per key guess) as float64, or None if the setting has no
+    batched form (callers should then fall back to leakage()).
+    """
+
+    if setting == LEAK_HW_SBOXOUT_FIRSTROUND:
+        st1 = np.asarray(pts, dtype=np.uint8)[:, bnum] ^ GuessTable
+        return HW8BitTable[SBoxTable[st1]].astype(np.float64)
+
+    elif setting == LEAK_HW_INVSBOXOUT_FIRSTROUND:
+        st1 = np.asarray(pts, dtype=np.uint8)[:, bnum] ^ GuessTable
+        return HW8BitTable[InvSBoxTable[st1]].astype(np.float64)
+
+    elif setting == LEAK_HD_LASTROUND_STATE:
+        cts = np.asarray(cts, dtype=np.uint8)
+        st10 = cts[:, INVSHIFT[bnum]]
+        st9 = InvSBoxTable[cts[:, bnum] ^ GuessTable]
+        return HW8BitTable[st9 ^ st10].astype(np.float64)
+
+    elif setting == LEAK_HD_SBOX_IN_OUT:
+        st1 = np.asarray(pts, dtype=np.uint8)[:, bnum] ^ GuessTable
+        st2 = SBoxTable[st1]
+        return HW8BitTable[st1 ^ st2].astype(np.float64)
+
+    elif setting == LEAK_HD_SBOX_IN_SUCCESSIVE:
+        pass
+
+    elif setting == LEAK_HD_SBOX_OUT_SUCCESSIVE:
+        pass
+
+    else:
+        raise ValueError("Invalid setting: %s" % str(setting))
+
+    return None
+
+
 def getHW(var):
     """Given a variable, return the hamming weight (number of 1's)"""
     return HW8Bit[var]
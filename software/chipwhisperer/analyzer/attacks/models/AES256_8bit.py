@@ -218,6 +218,9 @@ def xtime(a):
     return a
 
 
+# Only the per-trace HypHW()/HypHD() API: there is no leakage() with leakage settings here, so the progressive
+# CPA and its batched leakageMatrix() (see AES128_8bit) do not apply to this model.
+
 def HypHW(pt, ct, key, bnum):
     """Given either plaintext or ciphertext (not both) + a key guess, return hypothetical hamming weight of result"""
     if pt != None:
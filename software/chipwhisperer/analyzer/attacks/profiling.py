@@ -127,21 +127,8 @@ class Profiling(AttackBaseClass, AttackGenericParameters):
                 startingTrace = self.getTracesPerAttack() * (itNum - 1) + self.getTraceStart()
                 endingTrace = self.getTracesPerAttack() * itNum + self.getTraceStart()
 
-                data = []
-                textins = []
-                textouts = []
-
-                for i in range(startingTrace, endingTrace):
-                    d = self.getTraceSource().getTrace(i)
-
-                    if d is None:
-                        continue
-
-                    d = d[startingPoint:endingPoint]
-
-                    data.append(d)
-                    textins.append(self.getTraceSource().getTextin(i))
-                    textouts.append(self.getTraceSource().getTextout(i))
+                # Traces rejected by the source are left out of all three
+                data, textins, textouts, _ = self.getTraceSource().getTraceBlock(startingTrace, endingTrace, (startingPoint, endingPoint))
 
                 #self.attack.clearStats()
                 self.attack.setByteList(self.targetBytes())
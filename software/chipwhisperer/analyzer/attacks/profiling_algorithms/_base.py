@@ -26,6 +26,7 @@
 #=================================================
 import logging
 import numpy as np
+from chipwhisperer.analyzer.utils.PartitionStats import groupSums
 from chipwhisperer.common.api.autoscript import AutoScript
 from chipwhisperer.common.utils import util
 from chipwhisperer.common.utils.tracesource import PassiveTraceObserver
@@ -42,6 +43,9 @@ class TemplateBasic(AutoScript, PassiveTraceObserver):
     """
     scriptsUpdated = util.Signal()
 
+    # Number of traces read from the trace source at once
+    blockSize = 1024
+
     def __init__(self):
         AutoScript.__init__(self)
         PassiveTraceObserver.__init__(self)
@@ -64,7 +68,12 @@ class TemplateBasic(AutoScript, PassiveTraceObserver):
         tstart = trange[0]
         tend = trange[1]
 
-        templateTraces = [ [ [] for j in range(0, numPartitions) ] for i in range(0, subkeys) ]
+        # Per subkey and partition: number of traces, sum and sum of outer products of the POI vectors
+        # (relative to the first trace, to keep the sums accurate)
+        templateCounts = [ np.zeros(numPartitions, dtype=np.int64) for i in range(0, subkeys) ]
+        templateSums = [ np.zeros((numPartitions, len(poiList[i]))) for i in range(0, subkeys) ]
+        templateProducts = [ np.zeros((numPartitions, len(poiList[i]) * len(poiList[i]))) for i in range(0, subkeys) ]
+        reference = None
 
         templateMeans = [ np.zeros((numPartitions, len(poiList[i]))) for i in range (0, subkeys) ]
         templateCovs = [ np.zeros((numPartitions, len(poiList[i]), len(poiList[i]))) for i in range (0, subkeys) ]
@@ -76,31 +85,47 @@ class TemplateBasic(AutoScript, PassiveTraceObserver):
             progressBar.setText('Generating Trace Matrix:')
             progressBar.setMaximum(tend - tstart + subkeys)
 
-        for tnum in range(tstart, tend):
-            # partData = self.getTraceSource().getAuxData(tnum, self.partObject.attrDictPartition)["filedata"]
-            pnum = partMethod.getPartitionNum(self.getTraceSource(), tnum)
-            t = self.getTraceSource().getTrace(tnum)
-            for bnum in range(0, subkeys):
-                templateTraces[bnum][pnum[bnum]].append(t[poiList[bnum]])
+        for bstart in range(tstart, tend, self.blockSize):
+            bend = min(bstart + self.blockSize, tend)
+            traces, tnums = self.getTraceSource().getTracesIndexed(bstart, bend)
+            if len(tnums) > 0:
+                # partData = self.getTraceSource().getAuxData(tnum, self.partObject.attrDictPartition)["filedata"]
+                pnums = np.array([partMethod.getPartitionNum(self.getTraceSource(), tnum) for tnum in tnums])
+                if reference is None:
+                    reference = [traces[0][poiList[bnum]] for bnum in range(0, subkeys)]
+
+                for bnum in range(0, subkeys):
+                    x = traces[:, poiList[bnum]] - reference[bnum]
+                    outer = (x[:, :, None] * x[:, None, :]).reshape(len(x), -1)
+                    templateCounts[bnum] += np.bincount(pnums[:, bnum], minlength=numPartitions)
+                    templateSums[bnum] += groupSums(pnums[:, bnum], x, numPartitions)
+                    templateProducts[bnum] += groupSums(pnums[:, bnum], outer, numPartitions)
 
             if progressBar:
-                progressBar.updateStatus(tnum - tstart)
+                progressBar.updateStatus(bend - tstart)
                 if progressBar.wasAborted():
                     return None
 
+        if reference is None:
+            reference = [np.zeros(len(poiList[bnum])) for bnum in range(0, subkeys)]
+
         if progressBar:
             progressBar.setText('Generating Trace Covariance and Mean Matrices:')
 
         for bnum in range(0, subkeys):
             for i in range(0, numPartitions):
-                templateMeans[bnum][i] = np.mean(templateTraces[bnum][i], axis=0)
-                cov = np.cov(templateTraces[bnum][i], rowvar=0)
-                if __debug__: logging.debug('templateTraces[%d][%d] = %d' % (bnum, i, len(templateTraces[bnum][i])))
-
-                if len(templateTraces[bnum][i]) > 0:
-                    templateCovs[bnum][i] = cov
+                n = templateCounts[bnum][i]
+                if __debug__: logging.debug('templateTraces[%d][%d] = %d' % (bnum, i, n))
+
+                if n > 1:
+                    mean = templateSums[bnum][i] / n
+                    products = templateProducts[bnum][i].reshape(len(mean), len(mean))
+                    templateMeans[bnum][i] = mean + reference[bnum]
+                    # Sample covariance, as np.cov()
+                    templateCovs[bnum][i] = (products - n * np.outer(mean, mean)) / (n - 1)
                 else:
                     logging.warning('Insufficient template data to generate covariance matrix for bnum=%d, partition=%d' % (bnum, i))
+                    templateMeans[bnum][i] = (templateSums[bnum][i] + reference[bnum]) if n == 1 else np.nan
                     templateCovs[bnum][i] = np.zeros((len(poiList[bnum]), len(poiList[bnum])))
 
             if progressBar:
@@ -111,6 +136,7 @@ class TemplateBasic(AutoScript, PassiveTraceObserver):
         self.template = {
          "mean":templateMeans,
          "cov":templateCovs,
+         "count":templateCounts,
          "trange":(tstart, tend),
          "poi":poiList,
          "partitiontype":partMethod.__class__.__name__
@@ -119,4 +145,69 @@ class TemplateBasic(AutoScript, PassiveTraceObserver):
         if progressBar:
             progressBar.close()
 
-        return self.template
\ No newline at end of file
+        return self.template
+
+class TemplateEngine(object):
+    """
+    Templates (mean + covariance of each partition) of one subkey, prepared to evaluate the log-likelihood of a whole
+    block of traces at once. The inverse covariance of each template is precomputed (via Cholesky), so that
+
+        log p(x | template) = -(k*log(2*pi) + log(det(cov)) + x'Ax - 2b'x + c) / 2     with A = cov^-1, b = A*mean, c = mean'*b
+
+    gives all templates for all traces with two matrix products, one over the outer products of the POI vectors.
+
+    Covariance modes:
+        Diagonal   only the variances, POIs taken as independent
+        Full       full covariance matrix of each template
+        Pooled     one covariance matrix for all templates (weighted by number of traces), the noise is
+                   assumed to be independent of the partition. Needs fewer traces to estimate.
+    """
+    covarianceModes = ("Diagonal", "Full", "Pooled")
+
+    def __init__(self, means, covs, counts=None, mode="Diagonal"):
+        means = np.asarray(means, dtype=np.float64)
+        covs = np.asarray(covs, dtype=np.float64)
+        numTemplates, k = means.shape
+
+        if mode == "Pooled":
+            weights = np.maximum(np.asarray(counts, dtype=np.float64) - 1, 0) if counts is not None else np.ones(numTemplates)
+            pooled = np.tensordot(weights, covs, axes=1) / max(weights.sum(), 1)
+            covs = np.repeat(pooled[None, :, :], numTemplates, axis=0)
+        elif mode == "Diagonal":
+            covs = np.array([np.diag(np.diag(c)) for c in covs])
+        elif mode != "Full":
+            raise ValueError("Invalid covariance mode: %s" % mode)
+
+        # Work relative to the templates' centre, so that the quadratic forms don't lose precision
+        with np.errstate(invalid='ignore'):
+            self.centre = np.nanmean(means, axis=0) if np.isfinite(means).any() else np.zeros(k)
+        means = means - self.centre
+
+        self.valid = True
+        A = np.zeros((numTemplates, k, k))
+        logdet = np.zeros(numTemplates)
+        try:
+            if not np.isfinite(means).all():
+                raise np.linalg.LinAlgError("Template without mean")
+            for i in range(0, numTemplates):
+                L = np.linalg.cholesky(covs[i])
+                Linv = np.linalg.inv(L)
+                A[i] = np.dot(Linv.T, Linv)
+                logdet[i] = 2 * np.sum(np.log(np.diag(L)))
+        except np.linalg.LinAlgError as e:
+            # Poorly formed template (e.g. empty partition, constant POI)
+            logging.debug(e)
+            self.valid = False
+
+        self.k = k
+        self.quadratic = A.reshape(numTemplates, k * k)
+        self.linear = np.einsum('ijk,ik->ij', A, means)
+        self.const = np.einsum('ij,ij->i', means, self.linear) + logdet + k * np.log(2 * np.pi)
+
+    def logLikelihood(self, x):
+        """(traces x templates) log-likelihoods of the POI vectors x (traces x POIs), all zero if the templates are invalid"""
+        x = np.asarray(x, dtype=np.float64) - self.centre
+        if not self.valid:
+            return np.zeros((len(x), len(self.const)))
+        outer = (x[:, :, None] * x[:, None, :]).reshape(len(x), -1)
+        return -0.5 * (outer.dot(self.quadratic.T) - 2 * x.dot(self.linear.T) + self.const)
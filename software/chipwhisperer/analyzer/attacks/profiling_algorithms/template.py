@@ -26,11 +26,11 @@
 #=================================================
 import logging
 import numpy as np
-import scipy
-from ._base import TemplateBasic, multivariate_normal
+from ._base import TemplateBasic, TemplateEngine
 from chipwhisperer.analyzer.attacks._stats import DataTypeDiffs
 from chipwhisperer.analyzer.attacks.models import AES128_8bit as AESModel
-from chipwhisperer.analyzer.attacks.models.AES128_8bit import getHW
+from chipwhisperer.analyzer.attacks.models.AES128_8bit import HW8BitTable, GuessTable
+from chipwhisperer.analyzer.utils.PartitionStats import groupSums
 from chipwhisperer.common.api.autoscript import AutoScript
 from chipwhisperer.common.utils import util
 from chipwhisperer.common.utils.tracesource import PassiveTraceObserver
@@ -39,6 +39,31 @@ from chipwhisperer.common.utils.parameter import setupSetParam
 from chipwhisperer.analyzer.ui.CWAnalyzerGUI import CWAnalyzerGUI
 
 
+# Partition of each key guess (row) for each value of the text byte (column)
+HWSBoxTable = HW8BitTable[AESModel.SBoxTable[GuessTable ^ np.arange(0, 256, dtype=np.uint8)]]
+HWXorTable = HW8BitTable[GuessTable ^ np.arange(0, 256, dtype=np.uint8)]
+
+
+def partitionBytes(ptype, plaintexts, bnum):
+    """
+    (bytes, table) for partition types where the partition follows from the key guess and one byte of each trace:
+    the byte of each trace, and the (256 x 256) partition table indexed [guess][byte]. None for other types.
+    """
+    if ptype == "PartitionHWIntermediate":
+        return np.asarray(plaintexts, dtype=np.uint8)[:, bnum], HWSBoxTable
+
+    # TODO Temp
+    elif ptype == "PartitionHDRounds":
+        plaintexts = np.asarray(plaintexts, dtype=np.uint8)
+        if bnum == 0:
+            return plaintexts[:, bnum], HWXorTable
+        knownkey = [0x2b, 0x7e, 0x15, 0x16, 0x28, 0xae, 0xd2, 0xa6, 0xab, 0xf7, 0x15, 0x88, 0x09, 0xcf, 0x4f, 0x3c]
+        s1 = plaintexts[:, bnum - 1] ^ knownkey[bnum - 1]
+        return s1 ^ plaintexts[:, bnum], HWXorTable
+
+    return None
+
+
 class ProfilingTemplate(AutoScript, PassiveTraceObserver, Plugin):
     """
     Template Attack done as a loop, but using an algorithm which can progressively add traces & give output stats
@@ -51,9 +76,12 @@ class ProfilingTemplate(AutoScript, PassiveTraceObserver, Plugin):
         PassiveTraceObserver.__init__(self)
         self.getParams().getChild("Input").hide()
         self._project = None
+        self.covarianceMode = "Diagonal"
 
         self.params.addChildren([
             {'name':'Load Template', 'type':'group', 'children':[]},
+            {'name':'Template Covariance', 'key':'covmode', 'type':'list', 'values':list(TemplateEngine.covarianceModes),
+             'get':self.getCovarianceMode, 'set':self.setCovarianceMode},
             {'name':'Generate New Template', 'type':'group', 'children':[
                 {'name':'Trace Start', 'key':'tgenstart', 'value':0, 'type':'int', 'action':self.updateScript},
                 {'name':'Trace End', 'key':'tgenstop', 'value':parent.traceMax, 'type':'int', 'action':self.updateScript},
@@ -113,6 +141,14 @@ class ProfilingTemplate(AutoScript, PassiveTraceObserver, Plugin):
         tend.setLimits((0, traces-1))
         tend.setValue(traces-1)
 
+    def getCovarianceMode(self):
+        return self.covarianceMode
+
+    @setupSetParam('Template Covariance')
+    def setCovarianceMode(self, mode):
+        """Covariance used when applying templates: Diagonal, Full or Pooled (see TemplateEngine)"""
+        self.covarianceMode = mode
+
     def setByteList(self, brange):
         self.brange = brange
 
@@ -187,82 +223,59 @@ class ProfilingTemplate(AutoScript, PassiveTraceObserver, Plugin):
 
     def addTraces(self, traces, plaintexts, ciphertexts, knownkeys=None, progressBar=None, pointRange=None):
 
-        if multivariate_normal is None:
-            raise Warning("Version of SciPy too old, require >= 0.14, have %s. "
-                          "Update to support this attack" % (scipy.version.version))
-
         # Hack for now - just use last template found
         template = self.loadTemplatesFromProject()[-1]
         pois = template["poi"]
-        numparts = len(template['mean'][0])
+        ptype = str(template["partitiontype"])
+        try:
+            counts = template["count"]
+        except KeyError:
+            # Template from before the counts were saved, pooled covariance weights all partitions equally
+            counts = [None] * len(template['mean'])
         results = np.zeros((16, 256))
 
+        engines = {}
+        for bnum in self.brange:
+            engines[bnum] = TemplateEngine(template['mean'][bnum], template['cov'][bnum], counts[bnum], self.covarianceMode)
+            if not engines[bnum].valid:
+                logging.warning('Error in applying template, probably template is poorly formed or POI incorrect. Byte %d skipped.' % bnum)
+
         tdiff = self._reportinginterval
 
         if progressBar:
             progressBar.setStatusMask("Current Trace = %d-%d Current Subkey = %d", (0, 0, 0))
-            progressBar.setMaximum(16 * len(traces))
-        pcnt = 0
+            progressBar.setMaximum(len(traces))
+
+        for bstart in range(0, len(traces), self.profiling.blockSize):
+            bend = min(bstart + self.profiling.blockSize, len(traces))
+            block = np.asarray(traces[bstart:bend])
+            rows = np.arange(bend - bstart)
 
-        for tnum in range(0, len(traces)):
             for bnum in self.brange:
-                try:
-                    newresultsint = [multivariate_normal.logpdf(traces[tnum][pois[bnum]], mean=template['mean'][bnum][i], cov=np.diag(template['cov'][bnum][i])) for i in range(0, numparts)]
-                except np.linalg.LinAlgError as e:
-                    logging.warning('Error in applying template, probably template is poorly formed or POI incorrect. Byte %d for tnum %d skipped.' % (bnum, tnum))
-                    logging.debug(e)
-                    newresultsint = [0] * 256
-
-                ptype = template["partitiontype"]
-
-                if ptype == "PartitionHWIntermediate":
-                    newresults = []
-                    # Map to key guess format
-                    for i in range(0, 256):
-                        # Get hypothetical hamming weight
-                        # hypint = HypHW(plaintexts[tnum], None, i, bnum)
-                        hypint = AESModel.leakage(plaintexts[tnum], ciphertexts[tnum], i, bnum, AESModel.LEAK_HW_SBOXOUT_FIRSTROUND, None)
-                        newresults.append(newresultsint[ hypint ])
+                # Log-likelihood of every trace under every template, at once
+                loglik = engines[bnum].logLikelihood(block[:, pois[bnum]])
+
+                # Map to key guess format
+                textbytes = partitionBytes(ptype, plaintexts[bstart:bend], bnum)
+                if textbytes is not None:
+                    # Total log-likelihood per text byte value, then per key guess through the partition table
+                    values, table = textbytes
+                    perValue = groupSums(values, loglik, 256)
+                    results[bnum] += perValue[GuessTable.T, table].sum(axis=1)
                 elif ptype == "PartitionHDLastRound":
-                    newresults = []
-                    # Map to key guess format
-                    for i in range(0, 256):
-                        # Get hypothetical hamming distance
-                        # hypint = HypHD(plaintexts[tnum], None, i, bnum)
-                        # hypint = HypHD(None, ciphertexts[tnum], i, bnum)
-                        hypint = AESModel.leakage(plaintexts[tnum], ciphertexts[tnum], i, bnum, AESModel.LEAK_HD_LASTROUND_STATE, None)
-                        newresults.append(newresultsint[ hypint ])
-
-                # TODO Temp
-                elif ptype == "PartitionHDRounds":
-                    newresults = []
-                    # Map to key guess format
-                    for i in range(0, 256):
-                        # Get hypothetical hamming distance
-                        # hypint = HypHD(plaintexts[tnum], None, i, bnum)
-                        if bnum == 0:
-                            hypint = getHW(plaintexts[tnum][bnum] ^ i)
-                        else:
-                            knownkey = [0x2b, 0x7e, 0x15, 0x16, 0x28, 0xae, 0xd2, 0xa6, 0xab, 0xf7, 0x15, 0x88, 0x09, 0xcf, 0x4f, 0x3c]
-                            s1 = plaintexts[tnum][bnum - 1] ^ knownkey[bnum - 1]
-                            s2 = plaintexts[tnum][bnum] ^ i
-                            hypint = getHW(s1 ^ s2)
-
-                        newresults.append(newresultsint[ hypint ])
+                    hyp = AESModel.leakageMatrix(plaintexts[bstart:bend], ciphertexts[bstart:bend], bnum, AESModel.LEAK_HD_LASTROUND_STATE, None)
+                    results[bnum] += np.take(loglik, hyp.astype(np.intp) + rows * loglik.shape[1]).sum(axis=1)
                 else:
-                    newresults = newresultsint
-
-                results[bnum] += newresults
-                self.stats.updateSubkey(bnum, results[bnum], tnum=(tnum + 1))
+                    results[bnum] += loglik.sum(axis=0)
+                self.stats.updateSubkey(bnum, results[bnum], tnum=bend)
 
-                pcnt += 1
-                if progressBar:
-                    progressBar.updateStatus(pcnt, (tnum, len(traces)-1, bnum))
-                    if progressBar.wasAborted():
-                        return
+            if progressBar:
+                progressBar.updateStatus(bend, (bstart, bend - 1, bnum))
+                if progressBar.wasAborted():
+                    return
 
             # Do plotting if required
-            if (tnum % tdiff) == 0 and self.sr:
+            if (bstart + tdiff - 1) // tdiff != (bend + tdiff - 1) // tdiff and self.sr:
                 self.sr()
 
     def getStatistics(self):
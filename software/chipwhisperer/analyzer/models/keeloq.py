@@ -4,6 +4,14 @@
 # Copyright (c) 2016 MARC
 #
 # FIXME: hamming weight table taken from CW
+#
+# All round functions use only bit operations, so they work on a single int as well as on numpy
+# uint32 arrays (e.g. the ciphertexts of all traces), processing every element at once.
+# KeeloqStateCache keeps the data partially decrypted with a keystream, so that extending the
+# keystream by one bit costs one round instead of decrypting the whole keystream again.
+
+import collections
+import numpy as np
 
 #--- Hamming weight / Hamming distance (HW/HD)
 
@@ -24,7 +32,14 @@ HW8Bit = [0, 1, 1, 2, 1, 2, 2, 3, 1, 2, 2, 3, 2, 3, 3, 4, 1, 2, 2, 3, 2, 3, 3,
           5, 6, 4, 5, 5, 6, 5, 6, 6, 7, 4, 5, 5, 6, 5, 6, 6, 7, 5, 6, 6, 7, 6,
           7, 7, 8]
 
+HW8BitArray = np.array(HW8Bit, dtype=np.uint8)
+
 def keeloqGetHW(var):
+    if isinstance(var, np.ndarray):
+        # 32-bit status register, 4 table lookups for every element
+        var = var.astype(np.uint32)
+        return HW8BitArray[var & 0xFF] + HW8BitArray[(var >> 8) & 0xFF] + \
+               HW8BitArray[(var >> 16) & 0xFF] + HW8BitArray[var >> 24]
     hw = 0
     while var > 0:
         hw = hw + HW8Bit[var % 256]
@@ -37,23 +52,24 @@ def keeloqGetHD(var1, var2):
 
 #--- KEELOQ: Non-Linear-Function 0x3A5C742E in algebraic normal form
 
-def keeloqNLF(a, b, c, d, e):
-    return (d + e + a*c + a*e + b*c + b*e + c*d + d*e + a*d*e + a*c*e + a*b*d + a*b*c) % 2;
+#
+#    Multiplication is AND and addition (mod 2) is XOR, so the inputs may also be whole words: every bit
+#    position is evaluated independently.
 
-# FIXME: Total operation is very slow, maybe because of this function.
-#        Should replace * with & or with a lookup table.
+def keeloqNLF(a, b, c, d, e):
+    return d ^ e ^ (a & c) ^ (a & e) ^ (b & c) ^ (b & e) ^ (c & d) ^ (d & e) ^ (a & d & e) ^ (a & c & e) ^ (a & b & d) ^ (a & b & c)
 
 
 #---- KEELOQ: Calc next bit from current state
 
 def keeloqEncryptCalcMSB(data, keybit):
-    nlf = keeloqNLF((data>>31)%2, (data>>26)%2, (data>>20)%2, (data>>9)%2, (data>>1)%2)
-    msb = (keybit ^ (data>>0) ^ (data>>16) ^ nlf) % 2
+    nlf = keeloqNLF(data>>31, data>>26, data>>20, data>>9, data>>1)
+    msb = (keybit ^ (data>>0) ^ (data>>16) ^ nlf) & 1
     return msb
 
 def keeloqDecryptCalcLSB(data, keybit):
-    nlf = keeloqNLF((data>>30)%2, (data>>25)%2, (data>>19)%2, (data>>8)%2, (data>>0)%2)
-    lsb = (keybit ^ (data>>31) ^ (data>>15) ^ nlf) % 2
+    nlf = keeloqNLF(data>>30, data>>25, data>>19, data>>8, data>>0)
+    lsb = (keybit ^ (data>>31) ^ (data>>15) ^ nlf) & 1
     return lsb
 
 #--- KEELOQ: Encrypts/decrypts one round (without key schedule, caller supplies key bit).  Returns new data.
@@ -97,6 +113,46 @@ def keeloqDecryptKeystream(data, keystream=None, round=528):
     return data, round
 
 
+#--- KEELOQ: Partial decrypt with keystream, remembering the results
+#
+#    Holds the partial decryption of one set of ciphertexts (e.g. uint32 array of all traces) for the
+#    most recently used keystreams.  A keystream is decrypted starting from its longest cached prefix,
+#    so attacking the key bit by bit costs one round per new bit.
+
+class KeeloqStateCache(object):
+
+    def __init__(self, data, maxEntries=16):
+        self.data = data
+        self.maxEntries = maxEntries
+        self.states = collections.OrderedDict()
+        self.stats_rounds = 0
+
+    def decrypt(self, keystream=None):
+        """Same as keeloqDecryptKeystream(data, keystream) for the cached data"""
+        keystream = keeloqFilterKeystream(keystream)
+        if keystream in self.states:
+            return self.states[keystream], 528 - len(keystream)
+
+        # longest known prefix
+        known = 0
+        data = self.data
+        for prefix in self.states:
+            if len(prefix) > known and keystream.startswith(prefix):
+                known = len(prefix)
+                data = self.states[prefix]
+
+        # every prefix on the way is kept, the next keystream probably extends one of them
+        for i in range(known, len(keystream)):
+            data = keeloqDecryptKeybit(data, int(keystream[i]))
+            self.states[keystream[:i+1]] = data
+        self.stats_rounds += len(keystream) - known
+
+        while len(self.states) > self.maxEntries:
+            self.states.popitem(last=False)
+
+        return data, 528 - len(keystream)
+
+
 #--- KEELOQ: Convert keystream to a HEX value with 'X' for patially known nibbles and '.' for empty nibbles
 #
 #    Example PartialToHex:    "011100010",4 -> "71X."
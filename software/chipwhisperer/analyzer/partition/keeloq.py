@@ -8,13 +8,16 @@
 #
 #=================================================
 
+import collections
+import numpy as np
+
 from ._base import PartitionBase
 
 from chipwhisperer.analyzer.models.keeloq import keeloqEncryptKeybit
 from chipwhisperer.analyzer.models.keeloq import keeloqEncryptKeybitHD
 from chipwhisperer.analyzer.models.keeloq import keeloqDecryptKeybit
 from chipwhisperer.analyzer.models.keeloq import keeloqDecryptKeybitHD
-from chipwhisperer.analyzer.models.keeloq import keeloqDecryptKeystream
+from chipwhisperer.analyzer.models.keeloq import KeeloqStateCache
 from chipwhisperer.analyzer.models.keeloq import keeloqGetHW
 from chipwhisperer.analyzer.models.keeloq import keeloqGetHD
 
@@ -33,6 +36,60 @@ def parseConfig(obj, config=None):
         obj.roundwidth = config.get('roundwidth') if config is not None else None
 
 
+#------ Helper for fetching ciphertext data of many traces
+
+def keeloqCiphertexts(trace, start, stop):
+    """Ciphertext of traces start...stop-1 as uint32 array, 0 if missing"""
+    data = np.zeros(stop - start, dtype=np.uint32)
+    for tnum in range(start, stop):
+        textout = trace.getTextout(tnum)
+        if (textout is not None) and (len(textout) >= 4):
+            # assume big-endian byte order
+            data[tnum - start] = (textout[0] << 24) | (textout[1] << 16) | (textout[2] << 8) | (textout[3] << 0)
+    return data
+
+
+#------ Partially decrypted ciphertexts of all traces, by trace segment
+#
+#       Partitioning asks for one trace at a time, always with the same keystream.  The whole segment is
+#       decrypted with the first request, the following ones only look up their trace.
+
+class SegmentEntry(object):
+    """States of one trace source, invalid as soon as the source reports changed traces"""
+
+    def __init__(self, trace):
+        self.trace = trace
+        self.states = KeeloqStateCache(keeloqCiphertexts(trace, 0, trace.numTraces()))
+        self.valid = True
+        # The signal only holds a weak reference, dropped entries disconnect themselves
+        if hasattr(trace, "sigTracesChanged"):
+            trace.sigTracesChanged.connect(self.tracesChanged)
+
+    def tracesChanged(self):
+        self.valid = False
+
+
+class SegmentStates(object):
+
+    def __init__(self, maxSegments=64):
+        self.maxSegments = maxSegments
+        self.segments = collections.OrderedDict()
+
+    def get(self, trace):
+        """KeeloqStateCache holding the ciphertexts of all traces in segment 'trace'"""
+        entry = self.segments.pop(id(trace), None)
+        # id() may be reused by a new segment, the traces of a source change with its enabled segments (same
+        # object, maybe the same number of traces) and a segment may grow while capturing
+        if (entry is None) or (entry.trace is not trace) or (not entry.valid) or (len(entry.states.data) != trace.numTraces()):
+            entry = SegmentEntry(trace)
+        self.segments[id(trace)] = entry
+        while len(self.segments) > self.maxSegments:
+            self.segments.popitem(last=False)
+        return entry.states
+
+segmentStates = SegmentStates()
+
+
 #------ Helper for fetching ciphertext data and partial decrypt according to partConfig
 
 def prepareData(trace, tnum, keystream=None, configObj=None):
@@ -40,20 +97,10 @@ def prepareData(trace, tnum, keystream=None, configObj=None):
         if (keystream is None) and (configObj is not None) and hasattr(configObj, "keystream"):
             keystream = configObj.keystream
 
-        #--- get ciphertext
-
-        textout = trace.getTextout(tnum)
-
-        if (textout is not None) and (len(textout) >= 4):
-            # assume big-endian byte order
-            data = (textout[0] << 24) | (textout[1] << 16) | (textout[2] << 8) | (textout[3] << 0)
-        else:
-            data = 0
-
-        #--- skip already known/guessed keybits
+        #--- get ciphertext, skip already known/guessed keybits
 
-        data, round = keeloqDecryptKeystream(data, keystream, round=528)
-        return data, round
+        data, round = segmentStates.get(trace).decrypt(keystream)
+        return int(data[tnum]), round
 
 
 #------ Helper for printing advice to user on where to look for POIs
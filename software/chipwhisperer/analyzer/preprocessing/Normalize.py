@@ -47,18 +47,28 @@ class NormBase(object):
     def loadZFile(self, f):
         pass
 
+    def processTraces(self, traces, tindexes):
+        """Process each row of a 2-D array, rows are traces number tindexes"""
+        return np.array([self.processTrace(t, tindex) for t, tindex in zip(traces, tindexes)])
+
 
 class NormMean(NormBase):
     """Normalize by mean (e.g. make traces zero-mean)"""
     def processTrace(self, t, tindex):
         return t - np.mean(t)
 
+    def processTraces(self, traces, tindexes):
+        return traces - np.mean(traces, axis=1).reshape(-1, 1)
+
 
 class NormMeanStd(NormBase):
     """Normalize by mean & std-dev """
     def processTrace(self, t, tindex):
         return (t - np.mean(t)) / np.std(t)
 
+    def processTraces(self, traces, tindexes):
+        return (traces - np.mean(traces, axis=1).reshape(-1, 1)) / np.std(traces, axis=1).reshape(-1, 1)
+
 
 try:
     from PySide.QtGui import *
@@ -109,6 +119,19 @@ try:
                 f2 = np.polyval(self.f2coeff, self.zdata[tindex])
 
             return (t - f1) / f2
+
+        def processTraces(self, traces, tindexes):
+            if isinstance(self.f1coeff, (int, long)) and self.f1coeff == 0:
+                f1 = 0
+            else:
+                f1 = np.polyval(self.f1coeff, self.zdata[tindexes]).reshape(len(tindexes), -1)
+
+            if isinstance(self.f2coeff, (int, long)) and self.f2coeff == 1:
+                f2 = 1
+            else:
+                f2 = np.polyval(self.f2coeff, self.zdata[tindexes]).reshape(len(tindexes), -1)
+
+            return (traces - f1) / f2
 except:
     class NormLinFunc(NormBase):
         pass
@@ -229,6 +252,9 @@ class Normalize(PreprocessingBase):
         else:
             return self._traceSource.getTrace(n)
 
+    def processBlock(self, traces, tnums):
+        return self.norm.processTraces(traces, tnums), tnums
+
     # def init(self):
     #    if self.ptEnd == 0:
     #        points = np.shape(self.trace().getTrace(0))[0]
@@ -25,6 +25,9 @@
 #    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
 #=================================================
 import logging
+import os
+import tempfile
+import numpy as np
 
 from chipwhisperer.common.api.autoscript import AutoScript
 from chipwhisperer.common.utils.pluginmanager import Plugin
@@ -32,6 +35,28 @@ from chipwhisperer.common.utils.tracesource import TraceSource, ActiveTraceObser
 from chipwhisperer.common.utils.parameter import setupSetParam
 
 
+def shiftTraces(traces, shifts):
+    """
+    Shift every row of the 2-D array traces left by the matching entry of shifts (right if negative),
+    zero-filling the points that move in. Batch version of the np.append() shifting done by the resync modules.
+    """
+    numpoints = traces.shape[1]
+    idx = np.arange(numpoints) + np.asarray(shifts).reshape(-1, 1)
+    valid = (idx >= 0) & (idx < numpoints)
+    out = traces[np.arange(len(traces)).reshape(-1, 1), np.clip(idx, 0, numpoints - 1)].astype(np.float64, copy=False)
+    out[~valid] = 0
+    return out
+
+
+def dataDirectory():
+    """Return the analysis directory of the open project, or the system temp directory if there is none"""
+    try:
+        from chipwhisperer.common.api.CWCoreAPI import CWCoreAPI
+        return os.path.dirname(CWCoreAPI.getInstance().project().getDataFilepath('', 'analysis')["abs"])
+    except Exception:
+        return tempfile.gettempdir()
+
+
 class PreprocessingBase(TraceSource, ActiveTraceObserver, AutoScript, Plugin):
     """
     Base Class for all preprocessing modules
@@ -91,6 +116,51 @@ class PreprocessingBase(TraceSource, ActiveTraceObserver, AutoScript, Plugin):
         """Get known-key number n"""
         return self._traceSource.getKnownKey(n)
 
+    def processBlock(self, traces, tnums):
+        """
+        Batch version of getTrace(): process the 2-D array traces, whose rows are input traces number tnums,
+        and return (traces, tnums) with the rows that are kept. Modules that don't override this are run one
+        trace at a time through getTrace().
+        """
+        raise NotImplementedError
+
+    def getTracesIndexed(self, start, stop):
+        """Get (traces, tnums) for traces start...stop-1, processing the whole block at once when possible"""
+        if not self.enabled:
+            return self._traceSource.getTracesIndexed(start, stop)
+        if type(self).processBlock == PreprocessingBase.processBlock:
+            return TraceSource.getTracesIndexed(self, start, stop)
+        traces, tnums = self._traceSource.getTracesIndexed(start, stop)
+        if len(tnums) == 0:
+            return traces, tnums
+        return self.processBlock(traces, tnums)
+
+    def getTraces(self, start, stop, pointRange=None):
+        """Get traces start...stop-1 as a 2-D array. When disabled this is passed straight to the source."""
+        if self.enabled:
+            return TraceSource.getTraces(self, start, stop, pointRange)
+        else:
+            return self._traceSource.getTraces(start, stop, pointRange)
+
+    def getTextins(self, start, stop):
+        """Get text-ins start...stop-1"""
+        return self._traceSource.getTextins(start, stop)
+
+    def getTextouts(self, start, stop):
+        """Get text-outs start...stop-1"""
+        return self._traceSource.getTextouts(start, stop)
+
+    def getKnownKeys(self, start, stop):
+        """Get known-keys start...stop-1"""
+        return self._traceSource.getKnownKeys(start, stop)
+
+    def getTraceBlock(self, start, stop, pointRange=None):
+        """Get (traces, textins, textouts, knownkeys) for traces start...stop-1, see TraceSource.getTraceBlock()"""
+        if self.enabled:
+            return TraceSource.getTraceBlock(self, start, stop, pointRange)
+        else:
+            return self._traceSource.getTraceBlock(start, stop, pointRange)
+
     def getSampleRate(self):
         """Get the Sample Rate"""
         return self._traceSource.getSampleRate()
@@ -114,5 +184,30 @@ class PreprocessingBase(TraceSource, ActiveTraceObserver, AutoScript, Plugin):
     def numPoints(self):
         return self._traceSource.numPoints()
 
+    def getChainDescription(self):
+        """
+        Return a text description of the settings of this module and of every module upstream of it,
+        so results of the chain can be cached and reused as long as the description does not change.
+        """
+        return self.getInputDescription() + "[%s]\n%s" % (self.__class__.__name__, str(self.getParams()))
+
+    def getInputDescription(self):
+        """Return the description of everything upstream of this module, see getChainDescription()"""
+        if isinstance(self._traceSource, PreprocessingBase):
+            return self._traceSource.getChainDescription()
+        desc = "[Source]\nname = %s\ntraces = %d\npoints = %d\n" % (self._traceSource.name, self._traceSource.numTraces(),
+                                                                    self._traceSource.numPoints())
+        # Identify the trace files behind the source as well, not just their size. The configs come from the
+        # segment list of the source, getSegment() would load the traces of every segment.
+        segments = getattr(self._traceSource, "traceSegments", None)
+        if segments is not None:
+            configs = dict((t.mappedRange[0], t.config) for t in segments
+                           if t.mappedRange is not None and t.mappedRange[1] >= t.mappedRange[0])
+            seglist = self._traceSource.getSegmentList()
+            for offset, length in zip(seglist['offsetList'], seglist['lengthList']):
+                config = configs[offset]
+                desc += "segment = %d %d %s %s\n" % (offset, length, config.configFilename(), config.attr("date"))
+        return desc
+
     def __del__(self):
         if __debug__: logging.debug('Deleted: ' + str(self))
\ No newline at end of file
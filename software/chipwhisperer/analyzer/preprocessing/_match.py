@@ -0,0 +1,100 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016 MARC
+# All rights reserved.
+#
+# Author: MARC
+#
+# Template matching used by the resync modules. A reference snippet is slid over a range of
+# offsets of a trace (1-D) or of every row of a block of traces (2-D), and a score is returned
+# for each offset:
+#
+#   sad()  - Sum of Absolute Difference, computed on a stride-tricks view of all windows
+#   ncc()  - Normalized Cross-Correlation, numerator by FFT convolution and window energy
+#            by running sums, so the cost does not grow with the reference length
+#
+# distance() wraps both so that a lower value is always a better match (1-ncc for NCC),
+# which lets callers keep their argmin / threshold logic regardless of the method.
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+from scipy import signal
+
+
+# Upper bound on the temporary (traces x offsets x window) array built by sad()
+SAD_CHUNK_ELEMENTS = 4 * 1024 * 1024
+
+
+def slidingWindows(data, width):
+    """Return a read-only view (..., len-width+1, width) of all windows of the last axis of data"""
+    data = np.asarray(data)
+    count = data.shape[-1] - width + 1
+    if count < 1:
+        return np.empty(data.shape[:-1] + (0, width), dtype=data.dtype)
+    shape = data.shape[:-1] + (count, width)
+    strides = data.strides + (data.strides[-1],)
+    view = as_strided(data, shape=shape, strides=strides)
+    view.flags.writeable = False
+    return view
+
+
+def sad(data, ref, start, stop):
+    """SAD between ref and data[..., i:i+len(ref)] for every offset start <= i < stop"""
+    data = np.asarray(data, dtype=np.float64)
+    ref = np.asarray(ref, dtype=np.float64)
+    width = len(ref)
+    stop = min(stop, data.shape[-1] - width + 1)
+    if stop <= start:
+        return np.empty(data.shape[:-1] + (0,))
+
+    windows = slidingWindows(data[..., start:stop + width - 1], width)
+    if data.ndim == 1:
+        return np.abs(windows - ref).sum(axis=-1)
+
+    # Process a few rows at a time to bound the size of the temporary array
+    out = np.empty((data.shape[0], stop - start))
+    rows = max(1, SAD_CHUNK_ELEMENTS // max(1, (stop - start) * width))
+    for r in range(0, data.shape[0], rows):
+        out[r:r + rows] = np.abs(windows[r:r + rows] - ref).sum(axis=-1)
+    return out
+
+
+def ncc(data, ref, start, stop):
+    """Normalized cross-correlation (-1...1) between ref and data[..., i:i+len(ref)] for every offset start <= i < stop"""
+    data = np.asarray(data, dtype=np.float64)
+    ref = np.asarray(ref, dtype=np.float64)
+    width = len(ref)
+    stop = min(stop, data.shape[-1] - width + 1)
+    if stop <= start:
+        return np.empty(data.shape[:-1] + (0,))
+    if width == 0:
+        return np.zeros(data.shape[:-1] + (stop - start,))
+
+    segment = data[..., start:stop + width - 1]
+    ref0 = ref - ref.mean()
+    kernel = ref0[::-1]
+    if segment.ndim == 2:
+        kernel = kernel.reshape(1, -1)
+    num = signal.fftconvolve(segment, kernel, mode='valid')
+
+    # Window sums of x and x^2 by running sums
+    zero = np.zeros(segment.shape[:-1] + (1,))
+    s1 = np.concatenate((zero, np.cumsum(segment, axis=-1)), axis=-1)
+    s2 = np.concatenate((zero, np.cumsum(segment * segment, axis=-1)), axis=-1)
+    wsum = s1[..., width:] - s1[..., :-width]
+    wsq = s2[..., width:] - s2[..., :-width]
+    energy = np.maximum(wsq - wsum * wsum / width, 0)
+
+    den = np.sqrt(energy) * np.sqrt(np.sum(ref0 * ref0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = num / den
+    out[~np.isfinite(out)] = 0
+    return out
+
+
+def distance(method, data, ref, start, stop):
+    """Match score where lower is better: SAD for 'sad', 1-NCC for 'ncc'"""
+    if method == 'ncc':
+        return 1.0 - ncc(data, ref, start, stop)
+    return sad(data, ref, start, stop)
@@ -0,0 +1,158 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016 MARC
+# All rights reserved.
+#
+# Author: MARC
+
+
+from ._base import PreprocessingBase, dataDirectory
+from chipwhisperer.common.api.TraceManager import TraceManager
+from chipwhisperer.common.traces.TraceContainerNative import TraceContainerNative
+
+from datetime import datetime
+import glob
+import hashlib
+import logging
+import os
+import numpy as np
+
+
+class CacheDisk(PreprocessingBase):
+    _name = "Cache: Disk"
+    _description = "Output of the modules above is computed once and stored on disk as a set of native trace "\
+                   "segments, keyed by the settings of every module above and by the source trace files. Later "\
+                   "runs (and other attacks) with the same settings read the stored traces instead. Changing any "\
+                   "setting above selects a different store."
+
+    # Traces processed at once while building the store
+    blockSize = 1024
+
+    def __init__(self, traceSource=None):
+        PreprocessingBase.__init__(self, traceSource)
+        self.storeDirectory = None
+        self.store = None
+        self.valid = None
+
+        self.updateScript()
+        self.sigTracesChanged.connect(self.closeStore)
+
+    def updateScript(self, _=None):
+        self.addFunction("init", "setEnabled", "%s" % self.findParam('enabled').getValue())
+
+    def setStoreDirectory(self, directory=None):
+        """Parent directory of the stores (default: project analysis directory)"""
+        self.storeDirectory = directory
+        self.closeStore()
+
+    def getStorePath(self):
+        """Directory holding the stored results for the current settings upstream"""
+        key = hashlib.sha1(self.getInputDescription()).hexdigest()
+        directory = self.storeDirectory
+        if directory is None:
+            directory = dataDirectory()
+        return os.path.join(directory, "preprocessed-%s" % key)
+
+    def closeStore(self):
+        self.store = None
+        self.valid = None
+
+    def openStore(self):
+        """Open the stored results for the current settings, computing them first if needed"""
+        path = self.getStorePath()
+        # chain.txt is written last, so an interrupted build is simply redone
+        if not os.path.isfile(os.path.join(path, "chain.txt")):
+            self.buildStore(path)
+        else:
+            logging.info('Using stored preprocessing results from %s' % path)
+
+        store = TraceManager("Cache: Disk Store")
+        for fname in sorted(glob.glob(os.path.join(path, "config_*.cfg"))):
+            ti = TraceContainerNative()
+            ti.config.loadTrace(fname)
+            store.appendSegment(ti)
+        self.valid = np.load(os.path.join(path, "valid.npy"))
+        self.store = store
+
+    def buildStore(self, path):
+        logging.info('Storing preprocessing results in %s' % path)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        try:
+            seglist = self._traceSource.getSegmentList()
+            segments = zip(seglist['offsetList'], seglist['lengthList'])
+        except NotImplementedError:
+            segments = [(0, self._traceSource.numTraces())]
+
+        valid = np.zeros(self._traceSource.numTraces(), dtype=np.bool)
+        date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        for segnum, (offset, length) in enumerate(segments):
+            traces = None
+            for start in range(offset, offset + length, self.blockSize):
+                stop = min(start + self.blockSize, offset + length)
+                data, tnums = self._traceSource.getTracesIndexed(start, stop)
+                if len(tnums) == 0:
+                    continue
+                if traces is None:
+                    traces = np.zeros((length, data.shape[1]), dtype=np.float64)
+                traces[tnums - offset] = data
+                valid[tnums] = True
+            if traces is None:
+                traces = np.zeros((length, self._traceSource.numPoints()), dtype=np.float64)
+
+            prefix = "seg%04d_" % segnum
+            ti = TraceContainerNative()
+            ti.traces = traces
+            ti.textins = self._traceSource.getTextins(offset, offset + length)
+            ti.textouts = self._traceSource.getTextouts(offset, offset + length)
+            keys = self._traceSource.getKnownKeys(offset, offset + length)
+            if len(keys) > 0 and keys[0] is not None:
+                ti.keylist = np.array(keys)
+                ti.knownkey = ti.keylist[0]
+            else:
+                ti.keylist = None
+            ti.config.setConfigFilename(os.path.join(path, "config_%s.cfg" % prefix))
+            ti.config.setAttr("prefix", prefix)
+            ti.config.setAttr("date", date)
+            ti.config.setAttr("numTraces", length)
+            ti.config.setAttr("numPoints", traces.shape[1])
+            ti.config.setAttr("scopeSampleRate", self._traceSource.getSampleRate())
+            ti.config.setAttr("notes", "Preprocessing results, see chain.txt")
+            ti.saveAllTraces(path, prefix)
+
+        np.save(os.path.join(path, "valid.npy"), valid)
+        f = open(os.path.join(path, "chain.txt"), "w")
+        f.write(self.getInputDescription())
+        f.close()
+
+    def getTrace(self, n):
+        if self.enabled:
+            if self.store is None:
+                self.openStore()
+            if not self.valid[n]:
+                return None
+            return self.store.getTrace(n)
+        else:
+            return self._traceSource.getTrace(n)
+
+    def getTracesIndexed(self, start, stop):
+        if not self.enabled:
+            return self._traceSource.getTracesIndexed(start, stop)
+        if self.store is None:
+            self.openStore()
+        traces = self.store.getTraces(start, stop)
+        valid = self.valid[start:stop]
+        if valid.all():
+            return traces, np.arange(start, stop)
+        return traces[valid], np.arange(start, stop)[valid]
+
+    def numPoints(self):
+        if self.enabled and self.store is not None:
+            return self.store.numPoints()
+        return self._traceSource.numPoints()
+
+    def init(self):
+        self.closeStore()
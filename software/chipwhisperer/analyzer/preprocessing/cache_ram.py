@@ -8,39 +8,61 @@
 
 
 from chipwhisperer.common.results.base import ResultsBase
-from ._base import PreprocessingBase
+from ._base import PreprocessingBase, dataDirectory
 
 from datetime import datetime
+import collections
+import hashlib
+import logging
+import os
+import numpy as np
+
+
+# Per-trace state in the spill file
+SPILL_UNKNOWN  = 0
+SPILL_VALID    = 1
+SPILL_REJECTED = 2
 
 
 class CacheRam(PreprocessingBase):
     _name = "Cache: RAM"
-    _description = "getTrace() results kept in RAM until change signal"
-
+    _description = "getTrace() results kept in RAM until change signal. RAM use is limited by a memory budget "\
+                   "(least recently used traces are dropped first). Optionally every result is also written to a "\
+                   "scratch file on disk, keyed by the settings of the modules above, so later runs can reuse it."
 
     def __init__(self, traceSource=None):
         PreprocessingBase.__init__(self, traceSource)
 
-#        self.params.addChildren([
-#            {'name':'(rfu) Use HDD',           'key':'use_hdd', 'type':'bool', 'default':False, 'value':False, 'action':self.updateScript}
-#        ])
-
         self.constructed = str(datetime.now())
         self.traces = None
+        self.tracesBytes = 0
+        self.budget = 256 * 1024 * 1024
+        self.spill = False
+        self.spillDirectory = None
+        self.spillTraces = None
+        self.spillState = None
+        self.spillFiles = None
 
         self.stats_load    = 0
         self.stats_changed = 0
         self.stats_hit     = 0
+        self.stats_evict   = 0
+        self.stats_spill   = 0
 
         self.debug_print   = False
 
+        self.params.addChildren([
+            {'name':'Memory Budget (MB)', 'key':'budget', 'type':'int', 'limits':(1, 1000000), 'default':256, 'value':256, 'action':self.updateScript},
+            {'name':'Spill to Disk', 'key':'spill', 'type':'bool', 'default':False, 'value':False, 'action':self.updateScript},
+        ])
+
         self.updateScript()
         self.updateLimits()
         self.sigTracesChanged.connect(self.updateLimits)
 
 
     def updateLimits(self):
-        self.traces = None
+        self.clearCache()
         self.stats_changed += 1
         if self.debug_print: print "Cache L=%05d H=%05d CH=%03d %s: connect" % (self.stats_load, self.stats_hit, self.stats_changed, self.constructed)
         return
@@ -48,33 +70,167 @@ class CacheRam(PreprocessingBase):
 
     def updateScript(self, _=None):
         self.addFunction("init", "setEnabled", "%s" % self.findParam('enabled').getValue())
+        self.addFunction("init", "setMemoryBudget", "%d" % self.findParam('budget').getValue())
+        self.addFunction("init", "setSpillToDisk", "%s" % self.findParam('spill').getValue())
         self.updateLimits()
 
 
+    def setMemoryBudget(self, megabytes):
+        """Limit the RAM used by cached traces, in MB"""
+        self.budget = megabytes * 1024 * 1024
+        self.evict()
+
+
+    def setSpillToDisk(self, spill, directory=None):
+        """
+        Also keep every result in a memory-mapped scratch file. The files cache-<sha1 of the settings>.npy,
+        -state.npy and .txt are stored in the analysis directory of the project (default, the system temp
+        directory without a project) or the given directory. The files of the previous settings are deleted when
+        the settings above change; files left by earlier sessions are only reused, they can be deleted any time.
+        """
+        self.closeSpill()
+        self.spill = spill
+        self.spillDirectory = directory
+
+
+    def clearCache(self):
+        self.traces = None
+        self.tracesBytes = 0
+        self.closeSpill()
+
+
+    def evict(self):
+        """Drop least recently used traces until RAM use is within budget"""
+        if self.traces is None:
+            return
+        while self.tracesBytes > self.budget and len(self.traces) > 0:
+            _, trace = self.traces.popitem(last=False)
+            if trace is not None:
+                self.tracesBytes -= trace.nbytes
+            self.stats_evict += 1
+
+
+    def getSpillFilename(self, description=None):
+        """Scratch files (traces, state, description) for the current upstream settings and trace segments"""
+        if description is None:
+            description = self.getInputDescription()
+        key = hashlib.sha1(description).hexdigest()
+        directory = self.spillDirectory
+        if directory is None:
+            directory = dataDirectory()
+        return (os.path.join(directory, "cache-%s.npy" % key), os.path.join(directory, "cache-%s-state.npy" % key),
+                os.path.join(directory, "cache-%s.txt" % key))
+
+
+    def openSpill(self):
+        # The description names the segments (config file and capture date), so trace sets of the same size
+        # never share a scratch file. It is also stored with the file and compared before reusing it.
+        description = self.getInputDescription()
+        tfname, sfname, dfname = self.getSpillFilename(description)
+        if self.spillFiles not in (None, (tfname, sfname, dfname)):
+            self.removeSpill()
+        shape = (self._traceSource.numTraces(), self._traceSource.numPoints())
+        try:
+            with open(dfname, "r") as f:
+                if f.read() != description:
+                    raise ValueError("Cache file was made from other traces")
+            traces = np.lib.format.open_memmap(tfname, mode='r+')
+            state = np.lib.format.open_memmap(sfname, mode='r+')
+            if traces.shape != shape or state.shape != (shape[0],):
+                raise ValueError("Cache file does not match the traces")
+            logging.info('Reusing cached traces from %s' % tfname)
+        except (IOError, ValueError):
+            if not os.path.isdir(os.path.dirname(tfname)):
+                os.makedirs(os.path.dirname(tfname))
+            traces = np.lib.format.open_memmap(tfname, mode='w+', dtype=np.float64, shape=shape)
+            state = np.lib.format.open_memmap(sfname, mode='w+', dtype=np.uint8, shape=(shape[0],))
+            with open(dfname, "w") as f:
+                f.write(description)
+        self.spillTraces = traces
+        self.spillState = state
+        self.spillFiles = (tfname, sfname, dfname)
+
+
+    def closeSpill(self):
+        if self.spillTraces is not None:
+            self.spillTraces.flush()
+            self.spillState.flush()
+        self.spillTraces = None
+        self.spillState = None
+
+
+    def removeSpill(self):
+        """Delete the scratch files of the settings used before, they would not be used again"""
+        self.closeSpill()
+        for fname in self.spillFiles:
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+        self.spillFiles = None
+
+
+    def fetch(self, n):
+        """Get trace n from the spill file if it is there, otherwise from the source"""
+        if self.spill:
+            if self.spillTraces is None:
+                self.openSpill()
+            state = self.spillState[n]
+            if state == SPILL_VALID:
+                self.stats_spill += 1
+                return np.array(self.spillTraces[n])
+            elif state == SPILL_REJECTED:
+                self.stats_spill += 1
+                return None
+
+        self.stats_load += 1
+        trace = self._traceSource.getTrace(n)
+
+        if self.spill:
+            if trace is None:
+                self.spillState[n] = SPILL_REJECTED
+            elif len(trace) == self.spillTraces.shape[1]:
+                self.spillTraces[n] = trace
+                self.spillState[n] = SPILL_VALID
+        return trace
+
+
     def getTrace(self, n):
         if self.enabled:
 
             if self.traces is None:
-                self.traces = [None] * self._traceSource.numTraces()
-
-            if self.traces[n] is None:
-                self.stats_load += 1
-                self.traces[n] = self._traceSource.getTrace(n)
+                self.traces = collections.OrderedDict()
+
+            if n not in self.traces:
+                trace = self.fetch(n)
+                self.traces[n] = trace
+                if trace is not None:
+                    self.tracesBytes += trace.nbytes
+                self.evict()
                 if self.debug_print: print "Cache L=%05d H=%05d CH=%03d %s: fetch" % (self.stats_load, self.stats_hit, self.stats_changed, self.constructed)
             else:
                 self.stats_hit  += 1
+                # Mark as most recently used
+                trace = self.traces.pop(n)
+                self.traces[n] = trace
                 if self.debug_print: print "Cache L=%05d H=%05d CH=%03d %s: hit" % (self.stats_load, self.stats_hit, self.stats_changed, self.constructed)
 
-            return self.traces[n]
+            return trace
 
         else:
             return self._traceSource.getTrace(n)
 
 
+    def getStats(self):
+        """Return cache counters: loads from source, RAM hits, hits in the spill file, evictions and hit rate"""
+        total = self.stats_load + self.stats_hit + self.stats_spill
+        return {'load':self.stats_load, 'hit':self.stats_hit, 'spill':self.stats_spill, 'evict':self.stats_evict,
+                'changed':self.stats_changed, 'bytes':self.tracesBytes,
+                'hitrate':(float(self.stats_hit + self.stats_spill) / total) if total else 0.0}
+
+
     def init(self):
-        self.traces = None
+        self.clearCache()
         self.stats_changed += 1
         if self.debug_print: print "Cache L=%05d H=%05d CH=%03d %s: init" % (self.stats_load, self.stats_hit, self.stats_changed, self.constructed)
         return
-
-
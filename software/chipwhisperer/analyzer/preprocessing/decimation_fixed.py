@@ -63,6 +63,9 @@ class DecimationFixed(PreprocessingBase):
         else:
             return self._traceSource.getTrace(n)
 
+    def processBlock(self, traces, tnums):
+        return traces[:, ::self._decfactor], tnums
+
     def numPoints(self):
         if self.enabled:
             return len(range(0, self._traceSource.numPoints(), self._decfactor))
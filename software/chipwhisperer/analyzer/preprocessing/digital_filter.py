@@ -91,3 +91,6 @@ class Filter(PreprocessingBase):
             return signal.lfilter(self.b, self.a, trace)
         else:
             return self._traceSource.getTrace(n)
+
+    def processBlock(self, traces, tnums):
+        return signal.lfilter(self.b, self.a, traces, axis=1), tnums
@@ -29,7 +29,7 @@ import numpy as np
 import scipy as sp
 
 from chipwhisperer.common.results.base import ResultsBase
-from ._base import PreprocessingBase
+from ._base import PreprocessingBase, shiftTraces
 
 
 class ResyncCrossCorrelation(PreprocessingBase):
@@ -96,6 +96,14 @@ class ResyncCrossCorrelation(PreprocessingBase):
             
         else:
             return self._traceSource.getTrace(n)
+
+    def processBlock(self, traces, tnums):
+        # 2-D 'valid' convolution with a single-row kernel correlates every trace at once
+        cross = sp.signal.fftconvolve(traces, self.reftrace.reshape(1, -1), mode='valid')
+        if self.debugReturnCorr:
+            return cross, tnums
+        newmaxloc = np.argmax(cross[:, self.ccStart:self.ccEnd], axis=1)
+        return shiftTraces(traces, newmaxloc - self.refmaxloc), tnums
    
     def init(self):
         try:
@@ -28,7 +28,7 @@
 import numpy as np
 
 from chipwhisperer.common.results.base import ResultsBase
-from ._base import PreprocessingBase
+from ._base import PreprocessingBase, shiftTraces
 
 
 class ResyncPeakDetect(PreprocessingBase):
@@ -111,6 +111,23 @@ class ResyncPeakDetect(PreprocessingBase):
         else:
             return self._traceSource.getTrace(n)
 
+    def processBlock(self, traces, tnums):
+        window = traces[:, self.ccStart:self.ccEnd]
+        if str.lower(self.type) == 'max':
+            newmaxloc = np.argmax(window, axis=1)
+            maxval = np.max(window, axis=1)
+        else:
+            newmaxloc = np.argmin(window, axis=1)
+            maxval = np.min(window, axis=1)
+
+        if self.limit:
+            keep = (maxval <= self.refmaxsize * (1.0 + self.limit)) & (maxval >= self.refmaxsize * (1.0 - self.limit))
+            traces = traces[keep]
+            tnums = tnums[keep]
+            newmaxloc = newmaxloc[keep]
+
+        return shiftTraces(traces, newmaxloc - self.refmaxloc), tnums
+
     def init(self):
         try:
             self.calcRefTrace(self.rtrace)
@@ -32,7 +32,8 @@
 import numpy as np
 
 from chipwhisperer.common.results.base import ResultsBase
-from ._base import PreprocessingBase
+from ._base import PreprocessingBase, shiftTraces
+from . import _match
 from scipy import signal
 
 
@@ -41,7 +42,8 @@ class ResyncSAD(PreprocessingBase):
     _description = "Minimizes the 'Sum of Absolute Difference' (SAD), also known as 'Sum of Absolute Error'. Uses "\
                   "a portion of one of the traces as the 'reference'. This reference is then slid over the 'input "\
                   "window' for each trace, and the amount of shift resulting in the minimum SAD criteria is selected "\
-                  "as the shift amount for that trace."
+                  "as the shift amount for that trace. Alternatively the shift maximizing the normalized "\
+                  "cross-correlation (NCC) can be used, which ignores offset and gain differences between traces."
 
     def __init__(self, traceSource=None):
         PreprocessingBase.__init__(self, traceSource)
@@ -55,6 +57,7 @@ class ResyncSAD(PreprocessingBase):
         self.ccEnd = 1
         self.wdStart = 0
         self.wdEnd = 1
+        self.matchMethod = 'sad'
 
         self.params.addChildren([
             {'name':'Ref Trace', 'key':'reftrace', 'type':'int', 'value':0, 'action':self.updateScript},
@@ -63,6 +66,8 @@ class ResyncSAD(PreprocessingBase):
 
             {'name':'Input Window', 'key':'windowpt', 'type':'rangegraph', 'graphwidget':ResultsBase.registeredObjects["Trace Output Plot"],
                                                                      'action':self.updateScript, 'value':(0, 0), 'default':(0, 0)},
+            {'name':'Match Method', 'key':'matchmethod', 'type':'list', 'values':{"Sum-of-Difference":"sad", "Normalized Cross-Correlation":"ncc"},
+                                                                     'default':"sad", 'value':"sad", 'action':self.updateScript},
             # {'name':'Valid Limit', 'type':'float', 'value':0, 'step':0.1, 'limits':(0, 10), 'set':self.setValidLimit},
             # {'name':'Output SAD (DEBUG)', 'type':'bool', 'value':False, 'set':self.setOutputSad},
 
@@ -93,6 +98,7 @@ class ResyncSAD(PreprocessingBase):
 
         self.addFunction("init", "setReference", "rtraceno=%d, refpoints=(%d,%d), inputwindow=(%d,%d)" %
                          (self.findParam('reftrace').getValue(), refpt[0], refpt[1], windowpt[0], windowpt[1]))
+        self.addFunction("init", "setMatchMethod", "'%s'" % self.findParam('matchmethod').getValue())
 
         self.updateLimits()
 
@@ -159,6 +165,11 @@ class ResyncSAD(PreprocessingBase):
         self.ccEnd = refpoints[1]
         self.init()
 
+    def setMatchMethod(self, method='sad'):
+        """'sad' (Sum of Absolute Difference) or 'ncc' (matched as 1 - normalized cross-correlation)"""
+        self.matchMethod = method
+        self.init()
+
     def setOutputSad(self, enabled):
         self.debugReturnSad = enabled
    
@@ -198,6 +209,25 @@ class ResyncSAD(PreprocessingBase):
             return trace
         else:
             return self._traceSource.getTrace(n)
+
+    def processBlock(self, traces, tnums):
+        if self.filterGenerator != None:
+            filttraces = signal.lfilter(self.b, self.a, traces, axis=1)
+            sad = self.findSADs(filttraces)
+            if self.filterVisible == True:
+                traces = filttraces
+        else:
+            sad = self.findSADs(traces)
+
+        if self.debugReturnSad:
+            return sad, tnums
+
+        if sad.shape[1] == 0:
+            return traces[0:0], tnums[0:0]
+
+        keep = np.min(sad, axis=1) <= self.maxthreshold
+        shifts = np.argmin(sad[keep], axis=1) - self.refmaxloc
+        return shiftTraces(traces[keep], shifts), tnums[keep]
    
     def init(self):
         try:
@@ -209,14 +239,12 @@ class ResyncSAD(PreprocessingBase):
         
     def findSAD(self, inputtrace):
         reflen = self.ccEnd-self.ccStart
-        sadlen = self.wdEnd-self.wdStart
-        sadarray = np.empty(sadlen-reflen)
-        
-        for ptstart in range(self.wdStart, self.wdEnd-reflen):
-            #Find SAD        
-            sadarray[ptstart-self.wdStart] = np.sum(np.abs(inputtrace[ptstart:(ptstart+reflen)] - self.reftrace))
-            
-        return sadarray
+        return _match.distance(self.matchMethod, inputtrace, self.reftrace, self.wdStart, self.wdEnd-reflen)
+
+    def findSADs(self, inputtraces):
+        """Same as findSAD() for every row of a 2-D array, returns one SAD row per trace"""
+        reflen = self.ccEnd-self.ccStart
+        return _match.distance(self.matchMethod, inputtraces, self.reftrace, self.wdStart, self.wdEnd-reflen)
         
     def calcRefTrace(self, tnum):
         if self.enabled == False:
@@ -11,6 +11,7 @@ import numpy as np
 from chipwhisperer.common.utils import util
 from chipwhisperer.common.results.base import ResultsBase
 from ._base import PreprocessingBase
+from . import _match
 
 
 class ResyncSliceToSlot(PreprocessingBase):
@@ -34,6 +35,7 @@ class ResyncSliceToSlot(PreprocessingBase):
         self.ref_limit_start      = 0
         self.ref_limit_stop       = 1
 
+        self.match_method         = 'sad'
         self.sync_method          = None
 
         self.jitter_slice_percent = 0
@@ -112,7 +114,7 @@ class ResyncSliceToSlot(PreprocessingBase):
             #--- define and restrict sync algorithm
 
             {'name':'Match method',             'key':'match_method', 'type':'list',
-                                                'values':{"Sum-of-Difference":"sad"},					# TODO: add other options, like PLL etc
+                                                'values':{"Sum-of-Difference":"sad", "Normalized Cross-Correlation":"ncc"},	# TODO: add other options, like PLL etc
                                                 'default':"sad", 'value':"sad", 'action':self.updateScript},
 
             {'name':'  Sync fine-tune',         'key':'sync_method', 'type':'list', 'action':self.updateScript,
@@ -260,11 +262,12 @@ class ResyncSliceToSlot(PreprocessingBase):
         #---
 
         self.addFunction("init", "setReference",
-                         "ref_trace=%d, ref_window=(%d,%d), ref_divs=%d, ref_limit=(%d,%d), sync_method='%s', jitter_slice=%f, jitter_total=%f" %
+                         "ref_trace=%d, ref_window=(%d,%d), ref_divs=%d, ref_limit=(%d,%d), match_method='%s', sync_method='%s', jitter_slice=%f, jitter_total=%f" %
                          (self.findParam('ref_trace').getValue(),
                           ref_window[0], ref_window[1],
                           self.findParam('ref_divs').getValue(),
                           ref_limit[0], ref_limit[1],
+                          self.findParam('match_method').getValue(),
                           self.findParam('sync_method').getValue(),
                           self.findParam('jitter_slice').getValue(),
                           self.findParam('jitter_total').getValue()
@@ -287,7 +290,7 @@ class ResyncSliceToSlot(PreprocessingBase):
 
 
 
-    def setReference(self, ref_trace=0, ref_window=(0, 0), ref_divs=1, ref_limit=(0, 0), sync_method=None, jitter_slice=0, jitter_total=0):
+    def setReference(self, ref_trace=0, ref_window=(0, 0), ref_divs=1, ref_limit=(0, 0), match_method='sad', sync_method=None, jitter_slice=0, jitter_total=0):
 
         self.ref_trace        = ref_trace
         self.ref_window_start = ref_window[0]
@@ -297,6 +300,7 @@ class ResyncSliceToSlot(PreprocessingBase):
         self.ref_limit_start  = ref_limit[0]
         self.ref_limit_stop   = ref_limit[1]
 
+        self.match_method     = match_method
         self.sync_method      = sync_method
 
         self.jitter_slice_percent = jitter_slice
@@ -588,14 +592,9 @@ class ResyncSliceToSlot(PreprocessingBase):
 
                 for slice in range(0, refslices):
 
-                    #--- calculate SAD over the acceptable window
+                    #--- calculate SAD (or 1-NCC) over the acceptable window, for all offsets at once
 
-                    sad_array = np.empty(range_size)
-                    for offset in range(0, range_size):
-                        sad_start = range_start + offset
-                        sad_stop  = range_start + offset + self.slicewidth_int
-                        sad_array[offset] = np.sum(np.abs(trace[sad_start:sad_stop] - self.sliceshapes[slice]))
-                        # print "SAD for slice %d pos=%d: %f" % (slice, sad_start, sad_array[offset])
+                    sad_array = _match.distance(self.match_method, trace, self.sliceshapes[slice], range_start, range_stop)
 
                     match_value   = sad_array.min()
                     match_offsets = np.where(sad_array == match_value)
@@ -0,0 +1,210 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016 MARC
+# All rights reserved.
+#
+# Author: MARC
+#
+# Vectorized partition statistics, used by PartitionDisplay for T-Test (TVLA) and SAD analysis.
+#
+# Traces are read in blocks with getTraces(). For each key, the traces of a block are grouped by
+# partition number and summed in one operation (one-hot matrix product for few partitions,
+# sort + np.add.reduceat for many), accumulating sum, sum of squares and count. Mean and sample
+# variance follow from these at the end. To keep the sums of squares accurate over millions of
+# traces, all points are taken relative to the first trace of the range.
+#
+# The mean pairwise difference of all partitions is computed with array broadcasting:
+#
+#   T-Test   all pairs (i<j) at once, in blocks of pairs to bound the memory
+#   SAD      sum over pairs |m_i - m_j| from the sorted means, sum_k m_(k) * (2k - n + 1)
+#
+# The stats layout is the one used by PartitionDisplay: {"mean", "variance", "number"}, each
+# indexed [key][partition]. A mean may be None (partition not available), "number" may be a
+# scalar or an array (one count per point).
+
+import numpy as np
+
+
+# Number of points (traces x points per trace, or pairs x points) processed at once
+BLOCK_POINTS = 2**22
+
+# Up to this number of partitions the one-hot matrix product is faster than sorting
+ONEHOT_PARTITIONS = 32
+
+
+def partitionPairs(partData, start, stop):
+    """For each key, (tnums, partitions) of all partition members in start...stop-1, sorted by trace number"""
+    pairs = []
+    for keyParts in partData:
+        tnums = [np.asarray(tlist, dtype=np.int64) for tlist in keyParts]
+        parts = [np.full(len(t), i, dtype=np.int32) for i, t in enumerate(tnums)]
+        tnums = np.concatenate(tnums) if tnums else np.zeros(0, dtype=np.int64)
+        parts = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int32)
+
+        inRange = (tnums >= start) & (tnums < stop)
+        tnums = tnums[inRange]
+        parts = parts[inRange]
+        order = np.argsort(tnums, kind='mergesort')
+        pairs.append((tnums[order], parts[order]))
+    return pairs
+
+
+def groupSums(groups, rows, numGroups):
+    """Sum of the rows belonging to each group (groups[i] is the group of rows[i]), shape (numGroups, points)"""
+    if numGroups <= ONEHOT_PARTITIONS:
+        onehot = np.zeros((numGroups, len(groups)))
+        onehot[groups, np.arange(len(groups))] = 1.0
+        return onehot.dot(rows)
+
+    sums = np.zeros((numGroups, rows.shape[1]))
+    if len(groups) == 0:
+        return sums
+    order = np.argsort(groups, kind='mergesort')
+    sortedGroups = groups[order]
+    first = np.flatnonzero(np.concatenate(([True], sortedGroups[1:] != sortedGroups[:-1])))
+    sums[sortedGroups[first]] = np.add.reduceat(rows[order], first, axis=0)
+    return sums
+
+
+def partitionStats(traces, partData, tRange, pointRange, progressBar=None, blockSize=None):
+    """
+    Mean, sample variance and count of every partition of every key, in one pass over traces tRange[0]...tRange[1]-1
+    (points pointRange[0]...pointRange[1]-1). partData[key][partition] lists the trace numbers. Returns None if
+    aborted from the progressBar.
+    """
+    numKeys = len(partData)
+    numPartitions = len(partData[0])
+    numPoints = pointRange[1] - pointRange[0]
+    start = max(tRange[0], 0)
+    stop = min(tRange[1], traces.numTraces())
+
+    sums = np.zeros((numKeys, numPartitions, numPoints))
+    sumsq = np.zeros((numKeys, numPartitions, numPoints))
+    counts = np.zeros((numKeys, numPartitions), dtype=np.int64)
+
+    pairs = partitionPairs(partData, start, stop)
+    # Only the traces used by some partition need to be read
+    used = [t for t, _ in pairs if len(t)]
+    if used:
+        start = max(start, min(t[0] for t in used))
+        stop = min(stop, max(t[-1] for t in used) + 1)
+    else:
+        stop = start
+
+    if blockSize is None:
+        blockSize = max(1, BLOCK_POINTS // max(numPoints, 1))
+    numBlocks = (max(stop - start, 0) + blockSize - 1) // blockSize
+
+    if progressBar:
+        progressBar.setMinimum(0)
+        progressBar.setMaximum(numBlocks)
+
+    reference = None
+    for n, bstart in enumerate(range(start, stop, blockSize)):
+        if progressBar:
+            progressBar.updateStatus(n)
+            if progressBar.wasAborted():
+                return None
+
+        bend = min(bstart + blockSize, stop)
+        block = np.asarray(traces.getTraces(bstart, bend, pointRange), dtype=np.float64)
+        if reference is None:
+            reference = block[0].copy()
+        block = block - reference
+        blockSq = block * block
+
+        for bnum, (tnums, parts) in enumerate(pairs):
+            lo, hi = np.searchsorted(tnums, (bstart, bend))
+            if lo == hi:
+                continue
+            rows = tnums[lo:hi] - bstart
+            groups = parts[lo:hi]
+            if hi - lo == bend - bstart and np.array_equal(rows, np.arange(bend - bstart)):
+                # Every trace of the block used once, no need to gather
+                sums[bnum] += groupSums(groups, block, numPartitions)
+                sumsq[bnum] += groupSums(groups, blockSq, numPartitions)
+            else:
+                sums[bnum] += groupSums(groups, block[rows], numPartitions)
+                sumsq[bnum] += groupSums(groups, blockSq[rows], numPartitions)
+            counts[bnum] += np.bincount(groups, minlength=numPartitions)
+
+    if progressBar:
+        progressBar.updateStatus(numBlocks)
+
+    if reference is None:
+        reference = np.zeros(numPoints)
+
+    n = np.maximum(counts, 1)[:, :, None]
+    mean = sums / n
+    variance = np.maximum(sumsq - sums * mean, 0) / np.maximum(counts - 1, 1)[:, :, None]
+    mean += reference
+    # Empty partitions: mean and variance 0, as with the running (Welford) update
+    mean[counts == 0] = 0
+
+    return {"mean":[list(m) for m in mean], "variance":[list(v) for v in variance],
+            "number":[[int(c) for c in cnt] for cnt in counts]}
+
+
+def _validPartitions(means):
+    """Indexes of the partitions with a mean"""
+    return [i for i, m in enumerate(means) if m is not None]
+
+
+def ttestSum(means, variances, numbers, blockSize=None):
+    """Sum over all pairs of partitions (i<j) of |Welch's t|, non-finite t counted as 0. One key, lists by partition."""
+    valid = _validPartitions(means)
+    if len(valid) < 2:
+        numPoints = len(means[valid[0]]) if valid else 0
+        return np.zeros(numPoints)
+
+    m = np.array([means[i] for i in valid], dtype=np.float64)
+    numPoints = m.shape[1]
+    # Standard error squared of each mean, "number" may be per point
+    with np.errstate(divide='ignore', invalid='ignore'):
+        se = np.array([np.asarray(variances[i], dtype=np.float64) / np.broadcast_to(np.asarray(numbers[i], dtype=np.float64), (numPoints,))
+                       for i in valid])
+
+    if blockSize is None:
+        blockSize = max(1, BLOCK_POINTS // max(numPoints, 1))
+    first, second = np.triu_indices(len(valid), 1)
+
+    total = np.zeros(numPoints)
+    for p in range(0, len(first), blockSize):
+        i = first[p:p + blockSize]
+        j = second[p:p + blockSize]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ttest = (m[i] - m[j]) / np.sqrt(se[i] + se[j])
+        # NaN or +-inf would give "number out of range" in the graph, use 0 instead
+        ttest[~np.isfinite(ttest)] = 0
+        total += np.abs(ttest).sum(axis=0)
+    return total
+
+
+def sadSum(means):
+    """Sum over all pairs of partitions (i<j) of |mean_i - mean_j|. One key, list by partition."""
+    valid = _validPartitions(means)
+    if len(valid) < 2:
+        numPoints = len(means[valid[0]]) if valid else 0
+        return np.zeros(numPoints)
+
+    # In sorted order, the k-th mean is larger than k others and smaller than n-1-k others
+    m = np.sort(np.array([means[i] for i in valid], dtype=np.float64), axis=0)
+    n = len(valid)
+    weights = 2 * np.arange(n) - n + 1
+    return weights.dot(m)
+
+
+def mergePartitions(means, variances, numbers, members):
+    """(mean, variance, number) of the union of partitions 'members' of one key, from their stats"""
+    n = np.array([numbers[i] for i in members], dtype=np.float64)
+    m = np.array([means[i] for i in members], dtype=np.float64)
+    total = n.sum()
+    if total == 0:
+        return np.zeros(m.shape[1]), np.zeros(m.shape[1]), 0
+
+    mean = n.dot(m) / total
+    # Sum of squared deviations of each partition, plus its offset from the common mean
+    sq = sum((numbers[i] - 1) * np.asarray(variances[i]) if numbers[i] > 1 else 0 for i in members)
+    sq = sq + n.dot((m - mean) ** 2)
+    return mean, sq / max(total - 1, 1), int(total)
@@ -33,6 +33,7 @@ from PySide.QtGui import *
 import chipwhisperer.common.utils.qt_tweaks as QtFixes
 import pyqtgraph as pg
 from chipwhisperer.analyzer.utils.Partition import Partition
+from chipwhisperer.analyzer.utils import PartitionStats
 from chipwhisperer.common.utils import util
 from chipwhisperer.common.api.autoscript import AutoScript
 from chipwhisperer.common.api.CWCoreAPI import CWCoreAPI
@@ -48,46 +49,24 @@ class DifferenceModeTTest(object):
     differenceType = "Welch's T-Test"
 
     def difference(self, numkeys, numparts, trace, numpoints, stats, pbDialog=None):
-        means = stats["mean"]
-        var = stats["variance"]
-        num = stats["number"]
-
         if pbDialog:
             pbDialog.setMinimum(0)
             pbDialog.setMaximum(numkeys * numparts)
 
-        # scalingFactor compensates for number of inner loop executions, to arrive at mean(ttests) rather than sum(ttests)
+        # scalingFactor compensates for number of pairs, to arrive at mean(ttests) rather than sum(ttests)
         loopIterations = numparts * (numparts-1) / 2
-        scalingFactor  = 1.0 / loopIterations
+        scalingFactor  = 1.0 / max(loopIterations, 1)
 
         SADSeg = np.zeros((numkeys, numpoints))
         for bnum in range(0, numkeys):
-            for i in range(0, numparts):
-                if pbDialog:
-                    pbDialog.updateStatus(numparts * bnum + i)
-                    util.updateUI()
-                    if pbDialog.wasAborted():
-                        return SADSeg
-                for j in range(i+1, numparts):
-                    #          ^^^ Starting at i+1 because all comparisons j<i have been done already in previous
-                    #              iterations of the parent loop, and comparison j==i wastes time with add(0)
-
-                    if means[bnum][i] is not None and means[bnum][j] is not None:
-
-                        with np.errstate(divide='ignore', invalid='ignore'):
-                            ttest = np.subtract(means[bnum][i], means[bnum][j])
-                            ttest /= np.sqrt((var[bnum][i]/num[bnum][i]) + (var[bnum][j]/num[bnum][j]))
-
-                        # Working with unexpected input can lead to NaN (not a number) or +-inf.  Example: 1.0/0 = inf
-                        # Allowing inf leads to "number out of range" exceptions during graph display.
-                        # Therefore we replace ALL unexpected results with 0 (not just NaNs, as the original code did).
-                        ttest[~np.isfinite(ttest)] = 0
+            if pbDialog:
+                pbDialog.updateStatus(numparts * bnum)
+                util.updateUI()
+                if pbDialog.wasAborted():
+                    return SADSeg
 
-                        # calculate sum(ttests) here, apply scalingFactor after the loop (faster)
-                        SADSeg[bnum] = np.add(SADSeg[bnum], np.abs(ttest))
-
-            # calculate mean(ttests) = sum(ttests) / count
-            SADSeg[bnum] = np.multiply(SADSeg[bnum], scalingFactor)
+            # All pairs of partitions at once (see PartitionStats.ttestSum)
+            SADSeg[bnum] = PartitionStats.ttestSum(stats["mean"][bnum], stats["variance"][bnum], stats["number"][bnum]) * scalingFactor
 
         if pbDialog:
             pbDialog.updateStatus(numkeys * numparts)
@@ -102,26 +81,20 @@ class DifferenceModeSAD(object):
 
     def difference(self, numkeys, numparts, trace, numpoints, stats, pbDialog=None):
 
-        means = stats["mean"]
-
         if pbDialog:
             pbDialog.setMinimum(0)
             pbDialog.setMaximum(numkeys * numparts)
 
         SADSeg = np.zeros((numkeys, numpoints))
         for bnum in range(0, numkeys):
-            for i in range(0, numparts):
-                if pbDialog:
-                    pbDialog.updateStatus(numparts * bnum + i)
-                    util.updateUI()
-                    if pbDialog.wasAborted():
-                        return SADSeg
-                for j in range(i+1, numparts):
-                    if means[bnum][i] is not None and means[bnum][j] is not None:
-                        SADSeg[bnum] = np.add(SADSeg[bnum], np.abs(np.subtract(means[bnum][i], means[bnum][j])))
+            if pbDialog:
+                pbDialog.updateStatus(numparts * bnum)
+                util.updateUI()
+                if pbDialog.wasAborted():
+                    return SADSeg
 
             # MARC: calculate mean(sads) = sum(sads) / count
-            SADSeg[bnum] = np.divide(SADSeg[bnum], numparts * (numparts-1) / 2)
+            SADSeg[bnum] = np.divide(PartitionStats.sadSum(stats["mean"][bnum]), max(numparts * (numparts-1) / 2, 1))
 
         return SADSeg
 
@@ -740,84 +713,29 @@ class PartitionDisplay(Parameterized, AutoScript):
             fname = self.api.project().convertDataFilepathAbs(foundsecs[0]["filename"])
             stats = np.load(fname)
         else:
-            # Array to hold average + stddev of all traces/partitions
-            A_k = []
-            A_j = []
-            Q_k = []
-            dataArrays = [A_k, A_j, Q_k]
-            ACnt = []
-            for bnum in range(0, self.numKeys):
-                for d in dataArrays:
-                    d.append([])
-                ACnt.append([])
-                for i in range(0, numPartitions):
-                    for d in dataArrays:
-                        d[bnum].append(np.zeros(numPoints))
-                    ACnt[bnum].append(0)
-
-            # Get segment list
-            segList = traces.getSegmentList()
-
             if progressBar:
                 progressBar.setWindowTitle("Phase 1: Trace Statistics")
-                progressBar.setMaximum(bnum)  # len(segList['offsetList']) * self.numKeys)
+                progressBar.setText("Accumulating partition sums")
                 progressBar.show()
 
-            # TODO: Double-check this fix
-            # for tsegn, segtrace in enumerate(segList['offsetList']):
-            tsegn = 0
-            if progressBar: progressBar.setText("Segment %d" % tsegn)
-
             # Average data needs to be calculated
             # Require partition list
             partData = partitionData["partdata"]
 
+            # Sum and sum of squares of all partitions of all keys, in one pass over blocks of traces.
+            # MARC: Variance is the sample variance (/n-1), as before with the running update:
+            #       The t-distribution with n - 1 degrees of freedom is the sampling distribution of the
+            #       t-value when the samples consist of independent identically distributed observations
+            #       from a normally distributed population.
+            stats = PartitionStats.partitionStats(traces, partData, tRange, (pointStart, pointStop), progressBar)
 
-            # print "Calculating Average + Std-Dev"
-            # Std-Dev calculation:
-            # A[0] = 0
-            # A[k] = A[k-1] + (x[k] - A[k-1]) / k
-            # Q[0] = 0
-            # Q[k] = Q[k-1] + (x[k] - A[k-1])(x[k] - A[k])
-            for bnum in range(0, self.numKeys):
-                if progressBar:
-                    progressBar.updateStatus(tsegn * self.numKeys + bnum)
-                    if progressBar.wasAborted():
-                        break
-                for i in range(0, numPartitions):
-                    util.updateUI()
-                    tlist = partData[bnum][i]
-                    if len(tlist) > 0:
-                        for tnum in tlist:
-                            # MARC bugfix: trace==0 was never used
-                            if tnum >= tRange[0] and tnum < tRange[1]:
-                                t = traces.getTrace(tnum)[pointStart:pointStop]
-                                ACnt[bnum][i] += 1
-                                A_k[bnum][i] = A_k[bnum][i] + ((t - A_j[bnum][i]) / ACnt[bnum][i])
-                                Q_k[bnum][i] = Q_k[bnum][i] + ((t - A_j[bnum][i]) * (t - A_k[bnum][i]))
-                                A_j[bnum][i] = A_k[bnum][i]
-
-            if progressBar and progressBar.wasAborted():
+            if stats is None:
                 progressBar.hide()
                 return
 
-            # Finally get variance
-            for bnum in range(0, self.numKeys):
-                    for i in range(0, numPartitions):
-                        # TODO: Should be using population variance or sample variance (e.g. /n or /n-1)?
-                        #      Since this is taken over very large sample sizes I imagine it won't matter
-                        #      ultimately.
-                        # MARC: (from Wiki) The t-distribution with n − 1 degrees of freedom is the sampling
-                        #       distribution of the t-value when the samples consist of independent
-                        #       identically distributed observations from a normally distributed population.
-                        #       Thus for inference purposes t is a useful "pivotal quantity" in the case
-                        #       when the mean and variance are unknown population parameters, in the sense
-                        #       that the t-value has then a probability distribution that depends on neither
-                        #       mean nor variance.
-                        Q_k[bnum][i] = Q_k[bnum][i] / max(ACnt[bnum][i] - 1, 1)
-
-            # Average is in A_k
-            stats = {"mean":A_k, "variance":Q_k, "number":ACnt}
+            A_k  = stats["mean"]
+            Q_k  = stats["variance"]
+            ACnt = stats["number"]
 
             # Wasn't cancelled - save this to project file for future use if requested
             if saveFile:
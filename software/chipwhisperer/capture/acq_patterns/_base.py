@@ -81,5 +81,14 @@ class AcqKeyTextPattern_Base(Parameterized, Plugin):
         """Called when a new encryption pair is requested"""
         raise AttributeError("This needs to be reimplemented")
 
+    def newPairs(self, count):
+        """Return a list of count (key, text) pairs, e.g. for batched encryption"""
+        pairs = []
+        for i in range(0, count):
+            key, text = self.newPair()
+            # newPair() may return the same (modified) object each time
+            pairs.append((bytearray(key), bytearray(text)))
+        return pairs
+
     def __str__(self):
         return self.getName()
\ No newline at end of file
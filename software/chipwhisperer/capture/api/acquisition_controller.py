@@ -23,10 +23,51 @@
 #    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
 #=================================================
 import logging
-import time
+import Queue
+import sys
+import threading
+import numpy as np
 from chipwhisperer.common.utils import util
 
 
+class TraceWriterThread(threading.Thread):
+    """
+    Stores captured traces from a bounded queue, so writing trace N overlaps with capturing trace N+1.
+    When the queue is full, put() blocks until the writer catches up.
+    """
+
+    def __init__(self, store, depth):
+        threading.Thread.__init__(self, name="Trace Writer")
+        self.daemon = True
+        self.store = store
+        self.queue = Queue.Queue(maxsize=depth)
+        self.error = None
+
+    def put(self, item):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(item)
+
+    def finish(self):
+        """Wait until all queued traces are stored, re-raising any error of the writer"""
+        self.queue.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                continue
+            try:
+                self.store(*item)
+            except Exception as e:
+                self.error = e
+
+
 class AcquisitionController():
 
     def __init__(self, scope, target=None, writer=None, auxList=None, keyTextPattern=None):
@@ -41,6 +82,7 @@ class AcquisitionController():
         keyTextPattern.setTarget(target)
 
         self.maxtraces = 1
+        self.pipelineDepth = 0
 
         if self.auxList is not None:
             for aux in auxList:
@@ -61,13 +103,12 @@ class AcquisitionController():
         self.target.loadInput(plaintext)
         self.target.go()
 
-        timeout = 50
-        while self.target.isDone() == False and timeout:
-            timeout -= 1
-            time.sleep(0.01)
-
-        if timeout == 0:
-            logging.warning('Target timeout')
+        poll = util.AdaptivePoll(0.5, maxDelay=0.01)
+        while self.target.isDone() == False:
+            if poll.expired():
+                logging.warning('Target timeout')
+                break
+            poll.wait()
 
         # print "DEBUG: Target go()"
 
@@ -87,6 +128,28 @@ class AcquisitionController():
         self.sigNewTextResponse.emit(self.key, plaintext, resp, self.target.getExpected())
         return resp
 
+    def targetDoBatch(self, count):
+        """
+        Run count encryptions on the target without capturing traces, using the target's batch mode. Inputs
+        sharing a key are sent together. Returns a list of (key, textin, textout).
+        """
+        pairs = self._keyTextPattern.newPairs(count)
+        results = []
+        start = 0
+        while start < len(pairs):
+            key = pairs[start][0]
+            stop = start
+            while stop < len(pairs) and pairs[stop][0] == key:
+                stop += 1
+            texts = [p[1] for p in pairs[start:stop]]
+            outputs = self.target.runBatch(texts, key=key)
+            for text, resp in zip(texts, outputs):
+                self.key = key
+                self.sigNewTextResponse.emit(key, text, resp, self.target.getExpected(text))
+                results.append((key, text, resp))
+            start = stop
+        return results
+
     def doSingleReading(self, numPoints=None):
         # Set mode
         if self.auxList:
@@ -138,6 +201,26 @@ class AcquisitionController():
     def setMaxtraces(self, maxtraces):
         self.maxtraces = maxtraces
 
+    def setPipelineDepth(self, depth):
+        """
+        Number of captured traces that may wait to be stored while the next ones are captured. 0 stores
+        every trace before starting the next capture.
+        """
+        self.pipelineDepth = depth
+
+    def storeTrace(self, tnum, data, scaling, textin, textout, key, channelNum):
+        """Add one captured trace to the writer, as raw integer points if the scope and writer support it"""
+        try:
+            if scaling is not None and self.writer.useRawPoints(*scaling):
+                self.writer.addTrace(data, textin, textout, key, dtype=np.uint16, channelNum=channelNum)
+            else:
+                if scaling is not None:
+                    data = data * scaling[0] + scaling[1]
+                self.writer.addTrace(data, textin, textout, key, channelNum=channelNum)
+        except ValueError as e:
+            logging.warning('Exception caught in adding trace %d, trace skipped.' % tnum)
+            logging.debug(str(e))
+
     def doReadings(self, channelNumbers=[0], tracesDestination=None, progressBar=None):
         self._keyTextPattern.initPair()
         data = self._keyTextPattern.newPair()
@@ -156,24 +239,44 @@ class AcquisitionController():
         if self.target:
             self.target.init()
 
+        writerThread = None
+        if self.writer and self.pipelineDepth > 0:
+            writerThread = TraceWriterThread(self.storeTrace, self.pipelineDepth)
+            writerThread.start()
+
         self.currentTrace = 0
-        while self.currentTrace < self.maxtraces:
-            if self.doSingleReading():
-                try:
+        try:
+            while self.currentTrace < self.maxtraces:
+                if self.doSingleReading():
                     if self.writer:
                         for channelNum in channelNumbers:
-                            self.writer.addTrace(self.scope.channels[channelNum].getTrace(), self.textin, self.textout, self.key, channelNum=channelNum)
-                except ValueError as e:
-                    logging.warning('Exception caught in adding trace %d, trace skipped.' % self.currentTrace)
-                    logging.debug(str(e))
-                self.sigTraceDone.emit()
-                self.currentTrace += 1
-            else:
-                util.updateUI()  # Check if it was aborted
+                            channel = self.scope.channels[channelNum]
+                            item = (self.currentTrace, channel.getTraceRaw(), channel.pointScaling(),
+                                    self.textin, self.textout, self.key, channelNum)
+                            if writerThread:
+                                writerThread.put(item)
+                            else:
+                                self.storeTrace(*item)
+                    self.sigTraceDone.emit()
+                    self.currentTrace += 1
+                else:
+                    util.updateUI()  # Check if it was aborted
+
+                if progressBar is not None:
+                    if progressBar.wasAborted():
+                        break
+        except:
+            # Stop the writer, but report the capture error rather than one of the writer
+            exc = sys.exc_info()
+            if writerThread:
+                try:
+                    writerThread.finish()
+                except Exception as e:
+                    logging.error('Storing traces failed: %s' % str(e))
+            raise exc[0], exc[1], exc[2]
 
-            if progressBar is not None:
-                if progressBar.wasAborted():
-                    break
+        if writerThread:
+            writerThread.finish()
 
         if self.auxList:
             for aux in self.auxList:
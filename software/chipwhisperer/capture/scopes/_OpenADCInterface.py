@@ -9,7 +9,7 @@
 import logging
 import sys
 import time
-import datetime
+import numpy as np
 from chipwhisperer.common.utils import util
 from chipwhisperer.common.utils.parameter import Parameter, Parameterized, setupSetParam
 
@@ -225,6 +225,7 @@ class TriggerSettings(Parameterized):
         self.presampleTempMargin = 24
         self._timeout = 2
         self._stream_mode = False
+        self._raw_mode = False
 
         self.params = Parameter(name=self.getName(), type='group')
         child_list = [
@@ -278,8 +279,23 @@ class TriggerSettings(Parameterized):
                      'sample rate is unknown since it depends on how fast your computer can read from the buffer).'
                      ' A slow sampling rate (ADC Freq < 10 MHz) may be required.\n\n' +
                      'This feature is currently in BETA.'})
+        child_list.append(
+            {'name': 'Raw ADC Samples', 'type': 'bool', 'default': self._raw_mode, 'set': self.setRawMode,
+             'get': self.getRawMode,
+             'help': '%namehdr%' +
+                     'Deliver the 10-bit ADC codes as integers instead of converting every sample to a float. '
+                     'Native traces are then stored as uint16 (4x less memory and disk space), with the scale and '
+                     'offset recorded in the .cfg file. Traces are converted to floats when they are read.'})
         self.params.addChildren(child_list)
 
+    @setupSetParam("Raw ADC Samples")
+    def setRawMode(self, enabled):
+        self._raw_mode = enabled
+        self.oa.setRawMode(enabled)
+
+    def getRawMode(self):
+        return self._raw_mode
+
     @setupSetParam("Stream Mode")
     def setStreamMode(self, enabled):
         self._stream_mode = enabled
@@ -878,6 +894,7 @@ class OpenADCInterface(object):
         self.ddrMode = False
         self.sysFreq = 0
         self._streammode = False
+        self._rawmode = False
         self._sbuf = []
         self.settings()
 
@@ -895,6 +912,17 @@ class OpenADCInterface(object):
         self._streammode = stream
         self.updateStreamBuffer()
 
+    def setRawMode(self, raw):
+        """If enabled, processData() returns the ADC codes (uint16) instead of floats"""
+        self._rawmode = raw
+
+    def rawMode(self):
+        return self._rawmode
+
+    def pointScaling(self):
+        """(scale, offset) converting ADC codes to the values returned when not in raw mode"""
+        return 1.0 / 1024.0, -self.offset
+
     def setTimeout(self, timeout):
         self._timeout = timeout
 
@@ -1100,7 +1128,7 @@ class OpenADCInterface(object):
             bufsizebytes, self._stream_len_act = nae.cmdReadStream_bufferSize(self._stream_len)
 
         #Generate the buffer to save buffer
-        self._sbuf = [0] * bufsizebytes
+        self._sbuf = bytearray(bufsizebytes)
 
     def numSamples(self):
         """Return the number of samples captured in one go. Returns max after resetting the hardware"""
@@ -1199,14 +1227,13 @@ class OpenADCInterface(object):
         if self._streammode:
 
             # Wait for a trigger, letting the UI run when it can
-            starttime = datetime.datetime.now()
+            poll = util.AdaptivePoll(self._timeout)
             while self.serial.cmdReadStream_isDone() == False:
                 # Wait for a moment before re-running the loop
-                time.sleep(0.05)
-                diff = datetime.datetime.now() - starttime
+                poll.wait()
 
                 # If we've timed out, don't wait any longer for a trigger
-                if (diff.total_seconds() > self._timeout):
+                if poll.expired():
                     logging.warning('Timeout in OpenADC capture(), trigger FORCED')
                     timeout = True
                     self.triggerNow()
@@ -1231,18 +1258,17 @@ class OpenADCInterface(object):
                 timeout = True
         else:
             status = self.getStatus()
-            starttime = datetime.datetime.now()
+            poll = util.AdaptivePoll(self._timeout)
 
             # Wait for a trigger, letting the UI run when it can
             while ((status & STATUS_ARM_MASK) == STATUS_ARM_MASK) | ((status & STATUS_FIFO_MASK) == 0):
                 status = self.getStatus()
 
                 # Wait for a moment before re-running the loop
-                time.sleep(0.05)
-                diff = datetime.datetime.now() - starttime
+                poll.wait()
 
                 # If we've timed out, don't wait any longer for a trigger
-                if (diff.total_seconds() > self._timeout):
+                if poll.expired():
                     logging.warning('Timeout in OpenADC capture(), trigger FORCED')
                     timeout = True
                     self.triggerNow()
@@ -1253,15 +1279,15 @@ class OpenADCInterface(object):
             self.arm(False)
 
             # If using large offsets, system doesn't know we are delaying api
-            nosampletimeout = 100
-            while (self.getBytesInFifo() == 0) and nosampletimeout:
-                time.sleep(0.05)
-                nosampletimeout -= 1
-
-            if nosampletimeout == 0:
-                logging.warning('No samples received. Either very long offset, or no ADC clock (try "Reset ADC DCM"). '
-                                'If you need such a long offset, manually update "nosampletimeout" limit in source code.')
-                timeout = True
+            nosampletimeout = 5.0
+            poll = util.AdaptivePoll(nosampletimeout)
+            while self.getBytesInFifo() == 0:
+                if poll.expired():
+                    logging.warning('No samples received. Either very long offset, or no ADC clock (try "Reset ADC DCM"). '
+                                    'If you need such a long offset, manually update "nosampletimeout" limit in source code.')
+                    timeout = True
+                    break
+                poll.wait()
 
         return timeout
 
@@ -1275,26 +1301,16 @@ class OpenADCInterface(object):
             # Process data
             bsize = self.serial.cmdReadStream_size_of_fpgablock()
 
-            data = [0] * self.serial.cmdReadStream_bufferSize(self._stream_len)[0]
-            data[0] = self._sbuf[0]
-            dbuf2_idx = 1
-            for i in range(0, self._stream_rx_bytes, bsize):
-                if self._sbuf[i] != 0xAC:
-                    logging.warning("Stream mode: Expected sync byte (AC) at location %d but got %x" % (i, self._sbuf[i]))
-                    break
-                s = i + 1
-                data[dbuf2_idx: (dbuf2_idx + (bsize - 1))] = self._sbuf[s:(s + (bsize - 1))]
-
-                # Write to next section
-                dbuf2_idx += (bsize - 1)
+            data = stripSyncBytes(self._sbuf, self._stream_rx_bytes, bsize,
+                                  self.serial.cmdReadStream_bufferSize(self._stream_len)[0])
 
             logging.debug("Stream mode: done, %d bytes ready for processing"%len(data))
             datapoints = self.processData(data, 0.0)
-            if datapoints:
+            if datapoints is not None and len(datapoints) > 0:
                 logging.debug("Stream mode: done, %d samples processed"%len(datapoints))
             else:
                 logging.warning("Stream mode: done, no samples resulted from processing")
-                datapoints = []
+                datapoints = np.zeros(0)
 
             if len(datapoints) > NumberPoints:
                 datapoints = datapoints[0:NumberPoints]
@@ -1302,7 +1318,7 @@ class OpenADCInterface(object):
             return datapoints
 
         else:
-            datapoints = []
+            datapackages = []
 
             if NumberPoints == None:
                 NumberPoints = 0x1000
@@ -1373,7 +1389,7 @@ class OpenADCInterface(object):
                 if data:
                     datapackage = self.processData(data, 0.0)
                     if datapackage is not None:
-                        datapoints = datapoints + datapackage
+                        datapackages.append(datapackage)
 
                 if progressDialog:
                     progressDialog.setValue(status)
@@ -1381,6 +1397,11 @@ class OpenADCInterface(object):
                     if progressDialog.wasCanceled():
                         break
 
+            if datapackages:
+                datapoints = np.concatenate(datapackages)
+            else:
+                datapoints = np.zeros(0)
+
             print "MARC: (pre-sample bughunt) oa.readData() len=%d" % len(datapoints)
 
             # for point in datapoints:
@@ -1396,9 +1417,6 @@ class OpenADCInterface(object):
             return datapoints
 
     def processData(self, data, pad=float('NaN'), pretrigger_out=None):
-        fpData = []
-        lastpt = -100
-
         if data is None:
             print("WARNING: No data available to process.")
             return None
@@ -1469,54 +1487,21 @@ class OpenADCInterface(object):
             logging.warning('Unexpected sync byte: 0x%x' % data[0])
             return None
 
-        trigfound = False
-        trigsamp = 0
-
-        for i in range(1, len(data) - 3, 4):
-            #Convert
-            temppt = (data[i + 3]<<0) | (data[i + 2]<<8) | (data[i + 1]<<16) | (data[i + 0]<<24)
-
-            #print("%2x "%data[i])
-
-            #print "%x %x %x %x"%(data[i +0], data[i +1], data[i +2], data[i +3]);
-            #print "%x"%temppt
-
-            intpt1 = temppt & 0x3FF
-            intpt2 = (temppt >> 10) & 0x3FF
-            intpt3 = (temppt >> 20) & 0x3FF
-
-            # print "%x %x %x" % (intpt1, intpt2, intpt3)
-
-            if trigfound == False:
-                mergpt = temppt >> 30
-                if (mergpt != 3):
-                       trigfound = True
-                       trigsamp = trigsamp + mergpt
-                       #print "Trigger found at %d"%trigsamp
-                else:
-                   trigsamp += 3
-
-            #input validation test: uncomment following and use
-            #ramp input on FPGA
-            ##if (intpt != lastpt + 1) and (lastpt != 0x3ff):
-            ##    print "intpt: %x lstpt %x\n"%(intpt, lastpt)
-            ##lastpt = intpt;
-
-            #print "%x %x %x"%(intpt1, intpt2, intpt3)
-
-            fpData.append(float(intpt1) / 1024.0 - self.offset)
-            fpData.append(float(intpt2) / 1024.0 - self.offset)
-            fpData.append(float(intpt3) / 1024.0 - self.offset)
-
-        #print len(fpData)
-
-        if trigfound == False:
+        codes, trigsamp = unpackSamples(data)
+        if trigsamp is None:
             logging.warning('Trigger not found in ADC data. No data reported!')
+            trigsamp = len(codes)
+
+        if self._rawmode:
+            fpData = codes
+            pad = 0
+        else:
+            fpData = codes / 1024.0 - self.offset
 
         #Ensure that the trigger point matches the requested by padding/chopping
         diff = self.presamples_desired - trigsamp
         if diff > 0:
-               fpData = [pad]*diff + fpData
+               fpData = np.concatenate((np.full(diff, pad, dtype=fpData.dtype), fpData))
                logging.warning('Pretrigger not met. Increase presampleTempMargin (in the code).')
         else:
                fpData = fpData[-diff:]
@@ -1525,6 +1510,71 @@ class OpenADCInterface(object):
 
         return fpData
 
+
+def toByteArray(data):
+    """View received data (bytearray, str, array or list of ints) as a uint8 ndarray, without copying if possible"""
+    if isinstance(data, np.ndarray):
+        return data.astype(np.uint8, copy=False)
+    if isinstance(data, (bytearray, str)):
+        return np.frombuffer(data, dtype=np.uint8)
+    return np.asarray(data, dtype=np.uint8)
+
+
+def unpackSamples(data):
+    """
+    Decode an ADC data package: one sync byte, then big-endian 32-bit words each holding three 10-bit
+    samples (bits 0-9, 10-19, 20-29, in that order). Bits 30-31 are 3 until the word holding the trigger,
+    where they give the trigger position within the word.
+
+    Returns (codes, trigsamp): the ADC codes as uint16 ndarray and the index of the trigger sample, or None
+    if the trigger was not found.
+    """
+    raw = toByteArray(data)
+    nwords = max(len(raw) - 1, 0) // 4
+    words = raw[1:1 + 4 * nwords].view('>u4').astype(np.uint32)
+
+    samples = np.empty((nwords, 3), dtype=np.uint16)
+    samples[:, 0] = words & 0x3FF
+    samples[:, 1] = (words >> 10) & 0x3FF
+    samples[:, 2] = (words >> 20) & 0x3FF
+    samples = samples.reshape(-1)
+
+    trigwords = np.flatnonzero((words >> 30) != 3)
+    if len(trigwords) == 0:
+        return samples, None
+    w = trigwords[0]
+    return samples, 3 * int(w) + int(words[w] >> 30)
+
+
+def stripSyncBytes(sbuf, rxbytes, bsize, buflen):
+    """
+    Stream mode: the FPGA inserts a sync byte (0xAC) at the start of every block of bsize bytes. Return
+    the first sync byte followed by the payload of all blocks, as a uint8 ndarray of length buflen (the
+    remainder is zero). Stops at the first block without a sync byte.
+    """
+    raw = toByteArray(sbuf)
+    data = np.zeros(buflen, dtype=np.uint8)
+    if len(raw) == 0:
+        return data
+    data[0] = raw[0]
+
+    starts = np.arange(0, min(rxbytes, len(raw)), bsize)
+    bad = np.flatnonzero(raw[starts] != 0xAC)
+    if len(bad) > 0:
+        i = starts[bad[0]]
+        logging.warning("Stream mode: Expected sync byte (AC) at location %d but got %x" % (i, raw[i]))
+        starts = starts[:bad[0]]
+    if len(starts) == 0:
+        return data
+
+    stop = min(starts[-1] + bsize, len(raw))
+    keep = np.ones(stop, dtype=np.bool)
+    keep[starts] = False
+    payload = raw[:stop][keep][:buflen - 1]
+    data[1:1 + len(payload)] = payload
+    return data
+
+
 if __name__ == "__main__":
     import serial
 
@@ -96,7 +96,12 @@ class OpenADCQt(Parameterized):
         except IndexError, e:
             raise IOError("Error reading data: %s" % str(e))
 
-        self.dataUpdated.emit(channelNr, self.datapoints, -self.parm_trigger.presamples(True), self.parm_clock.adcFrequency())
+        if self.sc.rawMode():
+            scaling = self.sc.pointScaling()
+        else:
+            scaling = None
+
+        self.dataUpdated.emit(channelNr, self.datapoints, -self.parm_trigger.presamples(True), self.parm_clock.adcFrequency(), scaling)
 
     def capture(self):
         timeout = self.sc.capture()
@@ -48,8 +48,8 @@ class ScopeTemplate(Parameterized):
     def setCurrentScope(self, scope):
         pass
 
-    def newDataReceived(self, channelNum, data=None, offset=0, sampleRate=0):
-        self.channels[channelNum].newScopeData(data, offset, sampleRate)
+    def newDataReceived(self, channelNum, data=None, offset=0, sampleRate=0, scaling=None):
+        self.channels[channelNum].newScopeData(data, offset, sampleRate, scaling)
 
     def getStatus(self):
         return self.connectStatus.value()
@@ -100,12 +100,17 @@ class Channel(TraceSource):
         self._lastData = []
         self._lastOffset = 0
         self._sampleRate = 0
+        self._lastScaling = None
 
-    def newScopeData(self, data=None, offset=0, sampleRate=0):
-        """Capture the received trace and emit a signal to inform the observers"""
+    def newScopeData(self, data=None, offset=0, sampleRate=0, scaling=None):
+        """
+        Capture the received trace and emit a signal to inform the observers. If the scope delivers raw
+        integer points, scaling is (scale, offset) such that value = point * scale + offset.
+        """
         self._lastData = data
         self._lastOffset = offset
         self._sampleRate = sampleRate
+        self._lastScaling = scaling
         if len(data) > 0:
             self.sigTracesChanged.emit()
         else:
@@ -114,8 +119,19 @@ class Channel(TraceSource):
     def getTrace(self, n=0):
         if n != 0:
             raise ValueError("Live trace source has no buffer, so it only supports trace 0.")
+        if self._lastScaling is not None:
+            return self._lastData * self._lastScaling[0] + self._lastScaling[1]
         return self._lastData
 
+    def getTraceRaw(self, n=0):
+        """Return the trace as delivered by the scope (integer points if pointScaling() is not None)"""
+        if n != 0:
+            raise ValueError("Live trace source has no buffer, so it only supports trace 0.")
+        return self._lastData
+
+    def pointScaling(self):
+        return self._lastScaling
+
     def numPoints(self):
         return len(self._lastData)
 
@@ -22,7 +22,9 @@
 #    You should have received a copy of the GNU General Public License
 #    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
 #=================================================
+import binascii
 import logging
+import re
 
 from usb import USBError
 
@@ -45,6 +47,7 @@ class SimpleSerial(TargetTemplate):
         self.textlength = 16
         self.outputlength = 16
         self.input = ""
+        self._template = None
         self.params.addChildren([
             {'name':'Connection', 'type':'list', 'key':'con', 'values':ser_cons, 'get':self.getConnection, 'set':self.setConnection},
             {'name':'Key Length (Bytes)', 'type':'list', 'values':[16, 32], 'get':self.keyLen, 'set':self.setKeyLen},
@@ -56,6 +59,12 @@ class SimpleSerial(TargetTemplate):
             {'name':'Load Input Command', 'key':'cmdinput', 'type':'str', 'value':''},
             {'name':'Go Command','key':'cmdgo', 'type':'str', 'value':'p$TEXT$\\n'},
             {'name':'Output Format', 'key':'cmdout', 'type':'str', 'value':'r$RESPONSE$\\n'},
+            {'name':'Batch Size', 'key':'batchsize', 'type':'int', 'limits':(1, 1000), 'value':3,
+             'help':'%namehdr%' +
+                    'Maximum number of encryptions sent in one round-trip by runBatch(). All commands of a batch are '
+                    'written at once, then all responses are read with one bulk read. The responses must fit into the '
+                    'serial receive buffer of the capture hardware (127 bytes on CW-Lite), so keep '
+                    'Batch Size * response length below that.'},
             #{'name':'Data Format', 'key':'datafmt', 'type':'list', 'values':{'DEADBEEF':'',
             #                                                                 'DE AD BE EF':' ',
             #                                                                 'DE:AD:BE:EF':':',
@@ -137,6 +146,13 @@ class SimpleSerial(TargetTemplate):
         if cmdstr is None or len(cmdstr) == 0:
             return
 
+        self.writeCommands(self.expandCommand(cmdstr), flushInputBefore)
+
+    def expandCommand(self, cmdstr):
+        """Insert key/input into a command string"""
+        if cmdstr is None:
+            return ""
+
         varList = [("$KEY$",self.key, "Hex Encryption Key"),
                    ("$TEXT$",self.input, "Input Plaintext")]
 
@@ -149,7 +165,9 @@ class SimpleSerial(TargetTemplate):
         #This is dumb
         newstr = newstr.replace("\\n", "\n")
         newstr = newstr.replace("\\r", "\r")
+        return newstr
 
+    def writeCommands(self, newstr, flushInputBefore=True):
         #print newstr
         try:
             if flushInputBefore:
@@ -174,13 +192,42 @@ class SimpleSerial(TargetTemplate):
     def isDone(self):
         return True
 
-    def readOutput(self):
-        dataLen= self.outputlength*2
-
+    def outputFormat(self):
         fmt = self.findParam('cmdout').getValue()
         #This is dumb
         fmt = fmt.replace("\\n", "\n")
         fmt = fmt.replace("\\r", "\r")
+        return fmt
+
+    def outputTemplate(self, fmt):
+        """
+        Return (regex, length) matching one response of the given output format. The regex is compiled once
+        and reused until the format or output length changes.
+        """
+        if self._template is None or self._template[0] != (fmt, self.outputlength):
+            parts = fmt.split("$RESPONSE$", 1)
+            length = len(fmt.replace("$RESPONSE$", ""))
+            if len(parts) == 2:
+                pattern = re.escape(parts[0]) + "([0-9a-fA-F]{%d})" % (self.outputlength * 2) + re.escape(parts[1])
+                length += self.outputlength * 2
+            else:
+                pattern = re.escape(parts[0])
+            self._template = ((fmt, self.outputlength), re.compile(pattern, re.DOTALL), length)
+        return self._template[1], self._template[2]
+
+    def parseOutput(self, response, template, pos=0):
+        """Decode the response starting at pos, or return None if it doesn't match the output format"""
+        match = template.match(response, pos)
+        if match is None:
+            print("Sync Error: %s" % response)
+            print("Hex Version: %s" % (" ".join(["%02x" % ord(t) for t in response])))
+            return None
+        if template.groups == 0:
+            return bytearray(self.outputlength)
+        return bytearray(binascii.unhexlify(match.group(1)))
+
+    def readOutput(self):
+        fmt = self.outputFormat()
 
         if len(fmt) == 0:
             return None
@@ -196,8 +243,7 @@ class SimpleSerial(TargetTemplate):
             self.newInputData.emit(self.ser.read(databytes))
             return None
 
-        dataLen += len(fmt.replace("$RESPONSE$", ""))
-        expected = fmt.split("$RESPONSE$")
+        template, dataLen = self.outputTemplate(fmt)
 
         #Read data from serial port
         response = self.ser.read(dataLen, timeout=500)
@@ -206,33 +252,47 @@ class SimpleSerial(TargetTemplate):
             logging.warning('Response length from target shorter than expected (%d<%d): "%s".' % (len(response), dataLen, response))
             return None
 
-        #Go through...skipping expected if applicable
-        #Check expected first
+        return self.parseOutput(response, template)
 
-        #Is a beginning part
-        if len(expected[0]) > 0:
-            if response[0:len(expected[0])] != expected[0]:
-                print("Sync Error: %s"%response)
-                print("Hex Version: %s" % (" ".join(["%02x" % ord(t) for t in response])))
-                return None
-
-        startindx = len(expected[0])
-
-        #Is middle part?
-        data = bytearray(self.outputlength)
-        if len(expected) == 2:
-            for i in range(0,self.outputlength):
-                data[i] = int(response[(i * 2 + startindx):(i * 2 + startindx + 2)], 16)
-
-            startindx += self.outputlength*2
-
-        #Is end part?
-        if len(expected[1]) > 0:
-            if response[startindx:startindx+len(expected[1])] != expected[1]:
-                print("Sync Error: %s"%response)
-                return None
+    def runBatch(self, inputs, key=None):
+        """
+        Encrypt a list of inputs with few round-trips: the commands for up to 'Batch Size' inputs are written
+        at once, then all their responses are read with one bulk read. Returns one response per input (None
+        where the response did not match the output format).
+        """
+        if self.connectStatus.value()==False:
+            raise Warning("Can't write to the target while disconected. Connect to it first.")
 
-        return data
+        fmt = self.outputFormat()
+        if len(fmt) == 0 or fmt.startswith("$GLITCH$"):
+            raise Warning("Batch mode requires an Output Format with a fixed-length response.")
+
+        if key:
+            self.loadEncryptionKey(key)
+
+        template, dataLen = self.outputTemplate(fmt)
+        cmdinput = self.findParam('cmdinput').getValue()
+        cmdgo = self.findParam('cmdgo').getValue()
+        batchsize = self.findParam('batchsize').getValue()
+
+        responses = []
+        for start in range(0, len(inputs), batchsize):
+            batch = inputs[start:start + batchsize]
+            cmds = []
+            for inputtext in batch:
+                self.input = inputtext
+                cmds.append(self.expandCommand(cmdinput) + self.expandCommand(cmdgo))
+            self.writeCommands("".join(cmds))
+
+            response = self.ser.read(dataLen * len(batch), timeout=500 + dataLen * len(batch))
+            for i in range(0, len(batch)):
+                if len(response) < (i + 1) * dataLen:
+                    logging.warning('Response length from target shorter than expected (%d<%d): "%s".' % (len(response), dataLen * len(batch), response))
+                    responses.extend([None] * (len(batch) - i))
+                    break
+                responses.append(self.parseOutput(response, template, i * dataLen))
+
+        return responses
 
     def go(self):
         self.runCommand(self.findParam('cmdgo').getValue())
@@ -264,9 +324,9 @@ class SimpleSerial(TargetTemplate):
             return text[0:blen]
         return text
 
-    def getExpected(self):
+    def getExpected(self, inputtext=None):
         """Based on key & text get expected if known, otherwise returns None"""
         if self.textLen() == 16:
-            return TargetTemplate.getExpected(self)
+            return TargetTemplate.getExpected(self, inputtext)
         else:
             return None
@@ -22,6 +22,7 @@
 #    You should have received a copy of the GNU General Public License
 #    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
 #=================================================
+import logging
 
 from chipwhisperer.capture.api.programmers import Programmer
 from chipwhisperer.common.utils import util
@@ -123,6 +124,23 @@ class TargetTemplate(Parameterized, Plugin):
         """Do Encryption"""
         raise NotImplementedError("Target \"" + self.getName() + "\" does not implement method " + self.__class__.__name__ + ".go()")
 
+    def runBatch(self, inputs, key=None):
+        """Encrypt a list of inputs, returns the list of outputs. Targets with a faster way than one by one override this."""
+        if key:
+            self.loadEncryptionKey(key)
+        outputs = []
+        for inputtext in inputs:
+            self.loadInput(inputtext)
+            self.go()
+            poll = util.AdaptivePoll(0.5, maxDelay=0.01)
+            while self.isDone() == False:
+                if poll.expired():
+                    logging.warning('Target timeout')
+                    break
+                poll.wait()
+            outputs.append(self.readOutput())
+        return outputs
+
     def keyLen(self):
         """Length of key system is using"""
         return 16
@@ -131,13 +149,15 @@ class TargetTemplate(Parameterized, Plugin):
         """Length of the plaintext used by the system"""
         return 16
 
-    def getExpected(self):
-        """Based on key & text get expected if known, otherwise returns None"""
-        
+    def getExpected(self, inputtext=None):
+        """Based on key & text (default: the last loaded input) get expected if known, otherwise returns None"""
+        if inputtext is None:
+            inputtext = getattr(self, 'input', None)
+
         # e.g. for AES we can do this:
-        if AES and hasattr(self, 'key') and hasattr(self, 'input') and self.input and self.key:
+        if AES and hasattr(self, 'key') and inputtext and self.key:
             cipher = AES.new(str(self.key), AES.MODE_ECB)
-            ct = cipher.encrypt(str(self.input))
+            ct = cipher.encrypt(str(inputtext))
             ct = bytearray(ct)
             return ct
         else:
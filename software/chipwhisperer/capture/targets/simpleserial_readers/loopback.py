@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016 MARC
+# All rights reserved.
+#
+# Author: MARC
+#
+# Simulated SimpleSerial target, for testing the target/capture software without hardware.
+# Understands the default SimpleSerial protocol:
+#
+#   k<hex>\n  - load key
+#   p<hex>\n  - encrypt, the reply r<hex>\n is queued for read()
+#   x         - reset (ignored)
+#
+# By default the reply is AES-128(key, text) if pycrypto is available, otherwise the input is echoed.
+# Use setResponseFunction() to simulate something else.
+
+from _base import SimpleSerialTemplate
+
+try:
+    from Crypto.Cipher import AES
+except ImportError:
+    AES = None
+
+
+def defaultResponse(key, text):
+    if AES and key and len(key) == 16 and len(text) == 16:
+        return bytearray(AES.new(str(key), AES.MODE_ECB).encrypt(str(text)))
+    return bytearray(text)
+
+
+class SimpleSerial_Loopback(SimpleSerialTemplate):
+    _name = "Loopback (simulated target)"
+
+    def __init__(self):
+        SimpleSerialTemplate.__init__(self)
+        self.responseFunction = defaultResponse
+        self.key = None
+        self.txline = ""
+        self.rxbuf = ""
+        self.stats_commands = 0
+
+    def setResponseFunction(self, func):
+        """func(key, text) returns the bytes the simulated target replies to 'p<text>'"""
+        self.responseFunction = func
+
+    def write(self, string):
+        for c in str(string):
+            if c == "\n":
+                self.command(self.txline)
+                self.txline = ""
+            elif c == "x" and self.txline == "":
+                pass
+            else:
+                self.txline += c
+
+    def command(self, line):
+        self.stats_commands += 1
+        try:
+            data = bytearray.fromhex(unicode(line[1:]))
+        except ValueError:
+            return
+        if line.startswith("k"):
+            self.key = data
+        elif line.startswith("p"):
+            resp = self.responseFunction(self.key, data)
+            self.rxbuf += "r" + "".join(["%02x" % b for b in resp]) + "\n"
+
+    def inWaiting(self):
+        return len(self.rxbuf)
+
+    def read(self, num=0, timeout=250):
+        if num == 0:
+            num = len(self.rxbuf)
+        data = self.rxbuf[:num]
+        self.rxbuf = self.rxbuf[num:]
+        return data
+
+    def flush(self):
+        self.rxbuf = ""
+
+    def flushInput(self):
+        self.flush()
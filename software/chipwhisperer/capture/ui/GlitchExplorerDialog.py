@@ -36,6 +36,7 @@ import chipwhisperer.common.utils.qt_tweaks as QtFixes
 from chipwhisperer.common.utils.parameter import Parameterized, Parameter
 from chipwhisperer.common.utils import util
 from chipwhisperer.common.results.base import ResultsBase
+from chipwhisperer.capture.utils import GlitchSweep
 
 
 class TuningParameter(Parameterized):
@@ -56,7 +57,6 @@ class TuningParameter(Parameterized):
             {'name':'Value', 'type':'float', 'key':'curval', 'value':1.0},
             {'name':'Step', 'type':'float', 'key':'step', 'value':1.0, 'action':self.updateParams},
             {'name':'Repeat', 'type':'int', 'key':'repeat', 'value':1, 'action':self.updateParams},
-            {'name':'Mode', 'type':'list', 'key':'mode', 'values':["Linear"], 'value':"Linear", 'action':self.updateParams},
         ])
         self.cnt = 0
         self.updateParams()
@@ -98,6 +98,19 @@ class TuningParameter(Parameterized):
         self.tracesrequired = math.ceil(((self.paramRange[1] - self.paramRange[0]) / self.paramStep) * self.paramRepeat)+1
         self.tracesreqChanged.emit(self.paramNum, self.tracesrequired)
 
+    def sweepParameter(self):
+        """This parameter for a GlitchSweep search"""
+        return GlitchSweep.SweepParameter(self.name(), self.paramRange[0], self.paramRange[1], self.paramStep, self.paramType)
+
+    def setValue(self, newval):
+        """Set this parameter to a value chosen by a GlitchSweep search"""
+        self.paramValueItem.setValue(newval)
+        parameter = self.paramScript+[newval]
+        try:
+            Parameter.setParameter(parameter)
+        except:
+            raise StopIteration("Choose a valid Parameter Path/Value combination. Got: " + str(parameter))
+
     def findNewValue(self, mode="linear"):
         """ Find new value for this parameter """
 
@@ -155,6 +168,9 @@ class GlitchExplorerDialog(Parameterized, QtFixes.QDialog):
             {'name':'Traces Required', 'key':'tracesreq', 'type':'int', 'value':1, 'limits':(1, 1E99), 'readonly':True, 'children':[
                 {'name':'Use this value', 'type':'action', 'action':lambda _: Parameter.setParameter(['Generic Settings', 'Acquisition Settings', 'Number of Traces',self.findParam('tracesreq').getValue()])},
              ]},
+            {'name':'Search Strategy', 'key':'strategy', 'type':'list', 'values':GlitchSweep.strategies.keys(), 'value':'Linear',
+             'tip':"Linear steps through every combination using the settings of each Tuning Parameter. The other strategies "
+                   "search the same grid (Repeat = highest repeat of the parameters) and stop when done."},
             {'name':'Normal Response', 'type':'str', 'key':'normalresp', 'value':'s.startswith("Bad")'},
             {'name':'Successful Response', 'type':'str', 'key':'successresp', 'value':'s.startswith("Welcome")'},
 
@@ -185,6 +201,8 @@ class GlitchExplorerDialog(Parameterized, QtFixes.QDialog):
         self.table.horizontalHeader().setResizeMode(QHeaderView.Interactive)
         self.clearTable()
         self._campaignRunning = False
+        self.sweep = None
+        self.sweepDone = False
 
     def openPlotWidget(self, _):
         if "Glitch Explorer" not in ResultsBase.registeredObjects:
@@ -211,6 +229,35 @@ class GlitchExplorerDialog(Parameterized, QtFixes.QDialog):
         self._campaignRunning = True
         self.tuneEnabled(False)
         self.clearPlotWidget()
+        self.startSweep()
+
+    def startSweep(self):
+        """Start a GlitchSweep search with the selected strategy, unless Linear (done by the Tuning Parameters)"""
+        strategy = self.findParam('strategy').getValue()
+        if strategy == "Linear" or len(self.tuneParamList) == 0:
+            self.sweep = None
+            return
+        repeat = max(t.paramRepeat for t in self.tuneParamList)
+        self.sweepDone = False
+        self.sweep = GlitchSweep.strategies[strategy]([t.sweepParameter() for t in self.tuneParamList], repeat)
+        self.nextSweepValues()
+
+    def nextSweepValues(self):
+        try:
+            values = self.sweep.next()
+        except StopIteration:
+            logging.info('Glitch search finished after %d attempts' % self.sweep.attempts)
+            self.stopSweep()
+            return
+        for t, v in zip(self.tuneParamList, values):
+            t.setValue(v)
+
+    def stopSweep(self):
+        """Stop reporting to the search and abort the capture, as the 'Stop Capture' action does"""
+        self.sweepDone = True
+        progressBar = getattr(self.parent(), 'capturingProgressBar', None)
+        if self._campaignRunning and progressBar is not None:
+            progressBar.abort()
 
     def campaignDone(self):
         self._campaignRunning = False
@@ -297,8 +344,12 @@ class GlitchExplorerDialog(Parameterized, QtFixes.QDialog):
     def traceDone(self):
         """ Single api done """
 
+        if self.sweep is not None:
+            if not self.sweepDone:
+                self.nextSweepValues()
+
         # TODO: Improve how looping is done
-        if len(self.tuneParamList) > 0:
+        elif len(self.tuneParamList) > 0:
             # Always increment lowest, triggers upper values
             # try:
                 self.tuneParamList[0].findNewValue()
@@ -347,31 +398,7 @@ class GlitchExplorerDialog(Parameterized, QtFixes.QDialog):
     def addResponse(self, resp):
         """ Add a response from the system to glitch table + logs """
 
-        normeval = self.findParam('normalresp').getValue()
-        succeval = self.findParam('successresp').getValue()
-
-        if len(normeval) > 0:
-            #Check if Normal
-            normresult = eval(normeval, {'s':resp}, {})
-        else:
-            normresult = False
-
-        #Check if Successful
-        if len(succeval) > 0:
-            #Check if Normal
-            succresult = eval(succeval, {'s':resp}, {})
-        else:
-            succresult = False
-
-        #Check ?
-        if not isinstance(normresult, bool):
-            raise ValueError("Result of 'normal' eval() not a bool, got %s (result: %s)" % (type(normresult), normresult))
-
-        if not isinstance(succresult, bool):
-            raise ValueError("Result of 'success' eval() not a bool, got %s (result: %s)" % (type(succresult), succresult))
-
-        if normresult and succresult:
-            logging.warning('Both normresult and succresult True!')
+        normresult, succresult = GlitchSweep.classify(resp, self.findParam('normalresp').getValue(), self.findParam('successresp').getValue())
 
         starttime = datetime.now()
 
@@ -386,6 +413,9 @@ class GlitchExplorerDialog(Parameterized, QtFixes.QDialog):
                 raise StopIteration("Choose a valid Parameter Path for Tuning Parameter \"%s\" . Got: %s" % (self.tuneParamList[i].name(), self.tuneParamList[i].paramScript))
         newdata = {"input":"", "output":respstr, "normal":normresult, "success":succresult, "settings":settingsList, "date":starttime}
 
+        if self.sweep is not None and not self.sweepDone:
+            self.sweep.report(settingsList, normresult, succresult)
+
         self.tableList.append(newdata)
         self.appendToTable(newdata)
         self.updateStatus()
@@ -0,0 +1,326 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016 MARC
+# All rights reserved.
+#
+# Author: MARC
+#
+# Search strategies for glitch parameters (width, offset, repeat, ...), usable from the Glitch
+# Explorer or from scripts without any GUI. Parameters are searched on the grid given by their
+# range and step. A strategy hands out settings with next() and is told the outcome of every
+# attempt with report(); "interesting" settings are those giving a successful or an abnormal
+# (e.g. crashed) response, as they show the glitch reaching the target.
+#
+#   LinearSweep        every grid point, first parameter fastest (as the Glitch Explorer did)
+#   RandomSweep        every grid point once, in random order
+#   AdaptiveSweep      random exploration, refined around interesting settings with a shrinking
+#                      neighbourhood until the region is mapped at full resolution
+#   CoarseToFineSweep  grid at a coarse stride, the stride halved around interesting settings
+#                      (or everywhere if nothing was found) until it reaches the step
+#
+# runSweep() drives a strategy headless, SimulatedGlitchTarget responds like the glitch
+# tutorial firmware for testing.
+
+import collections
+import itertools
+import logging
+import random
+
+
+def classify(resp, normeval='s.startswith("Bad")', succeval='s.startswith("Welcome")'):
+    """Evaluate the 'normal' and 'successful' expressions (on s = response), returns (normal, success)"""
+    if len(normeval) > 0:
+        normresult = eval(normeval, {'s':resp}, {})
+    else:
+        normresult = False
+
+    if len(succeval) > 0:
+        succresult = eval(succeval, {'s':resp}, {})
+    else:
+        succresult = False
+
+    if not isinstance(normresult, bool):
+        raise ValueError("Result of 'normal' eval() not a bool, got %s (result: %s)" % (type(normresult), normresult))
+
+    if not isinstance(succresult, bool):
+        raise ValueError("Result of 'success' eval() not a bool, got %s (result: %s)" % (type(succresult), succresult))
+
+    if normresult and succresult:
+        logging.warning('Both normresult and succresult True!')
+
+    return normresult, succresult
+
+
+class SweepParameter(object):
+    """One glitch parameter, searched on the grid low, low+step, ... <= high"""
+
+    def __init__(self, name, low, high, step=1, datatype=int):
+        if step <= 0:
+            raise ValueError("Step of %s must be positive" % name)
+        self.name = name
+        self.low = low
+        self.high = high
+        self.step = step
+        self.datatype = datatype
+        self.points = int((high - low) / float(step) + 1E-9) + 1
+
+    def value(self, i):
+        return self.datatype(self.low + i * self.step)
+
+    def index(self, value):
+        return min(self.points - 1, max(0, int(round((value - self.low) / float(self.step)))))
+
+
+class SweepStrategy(object):
+    """
+    Base class of the search strategies: subclasses implement choose(), returning the grid point (tuple of
+    indices) to try next or None when done. Every point is tried 'repeat' times in a row.
+    """
+    _name = None
+
+    def __init__(self, params, repeat=1, maxAttempts=None, seed=None):
+        self.params = params
+        self.shape = tuple(p.points for p in params)
+        self.total = 1
+        for n in self.shape:
+            self.total *= n
+        self.repeat = max(1, repeat)
+        self.maxAttempts = maxAttempts
+        self.random = random.Random(seed)
+
+        # Grid point -> [attempts, normal, success]
+        self.results = collections.OrderedDict()
+        self.attempts = 0
+        self._current = None
+        self._repeatsLeft = 0
+        self._untried = None
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.next()
+            except StopIteration:
+                return
+
+    def next(self):
+        """Settings (one value per parameter) for the next attempt, raises StopIteration when the search is done"""
+        if self.maxAttempts is not None and self.attempts >= self.maxAttempts:
+            raise StopIteration("Maximum number of attempts reached")
+        if self._repeatsLeft == 0:
+            point = self.choose()
+            if point is None:
+                raise StopIteration("Search finished")
+            self._current = point
+            self._repeatsLeft = self.repeat
+            self.results.setdefault(point, [0, 0, 0])
+        self._repeatsLeft -= 1
+        return self.values(self._current)
+
+    def report(self, values, normal, success):
+        """Outcome of an attempt with the given settings"""
+        point = self.point(values)
+        res = self.results.setdefault(point, [0, 0, 0])
+        res[0] += 1
+        res[1] += int(bool(normal))
+        res[2] += int(bool(success))
+        self.attempts += 1
+        if self.isInteresting(point):
+            self.found(point, res[2] > 0)
+
+    def found(self, point, success):
+        """Called when a point gave an interesting response (success or abnormal)"""
+        pass
+
+    def choose(self):
+        raise NotImplementedError
+
+    def values(self, point):
+        return [p.value(i) for p, i in zip(self.params, point)]
+
+    def point(self, values):
+        return tuple(p.index(v) for p, v in zip(self.params, values))
+
+    def isTried(self, point):
+        return point in self.results
+
+    def isInteresting(self, point):
+        res = self.results.get(point)
+        return res is not None and (res[2] > 0 or res[1] < res[0])
+
+    def isValid(self, point):
+        return all(0 <= i < n for i, n in zip(point, self.shape))
+
+    def randomPoint(self):
+        """Random untried grid point, None if every point was tried"""
+        if len(self.results) >= self.total:
+            return None
+        # Rejection sampling while the grid is mostly untried, enumerate the rest otherwise
+        if len(self.results) < self.total // 2:
+            while True:
+                point = tuple(self.random.randrange(n) for n in self.shape)
+                if point not in self.results:
+                    return point
+        if self._untried is None:
+            self._untried = [p for p in itertools.product(*[range(n) for n in self.shape]) if p not in self.results]
+            self.random.shuffle(self._untried)
+        while self._untried:
+            point = self._untried.pop()
+            if point not in self.results:
+                return point
+        return None
+
+    def successes(self):
+        """Settings that gave a successful response at least once, with their success rate"""
+        return [(self.values(p), float(r[2]) / r[0]) for p, r in self.results.items() if r[2] > 0]
+
+
+class LinearSweep(SweepStrategy):
+    _name = "Linear"
+
+    def __init__(self, *args, **kwargs):
+        SweepStrategy.__init__(self, *args, **kwargs)
+        # First parameter changes fastest
+        self._order = (tuple(reversed(p)) for p in itertools.product(*[range(n) for n in reversed(self.shape)]))
+
+    def choose(self):
+        for point in self._order:
+            if not self.isTried(point):
+                return point
+        return None
+
+
+class RandomSweep(SweepStrategy):
+    _name = "Random"
+
+    def choose(self):
+        return self.randomPoint()
+
+
+class AdaptiveSweep(SweepStrategy):
+    """
+    Random exploration. Around each interesting point the neighbours at distance 'radius' are queued with half the
+    radius, and the direct neighbours too, so a glitch window is mapped completely once it is hit. Points queued
+    around successes come before those queued around other abnormal responses.
+    """
+    _name = "Adaptive"
+
+    def __init__(self, params, repeat=1, maxAttempts=None, seed=None, radius=None):
+        SweepStrategy.__init__(self, params, repeat, maxAttempts, seed)
+        if radius is None:
+            radius = max(1, max(self.shape) // 8)
+        self.radius = radius
+        self._radius = {}
+        self._queues = (collections.deque(), collections.deque())
+
+    def found(self, point, success):
+        r = self._radius.get(point, self.radius)
+        queue = self._queues[0 if success else 1]
+        # Neighbours at distance r (queued with half the radius) and the direct neighbours
+        for step in sorted(set((r, 1)), reverse=True):
+            for delta in itertools.product((-step, 0, step), repeat=len(point)):
+                neighbour = tuple(i + di for i, di in zip(point, delta))
+                if self.isValid(neighbour) and not self.isTried(neighbour) and neighbour not in self._radius:
+                    self._radius[neighbour] = max(1, step // 2)
+                    queue.append(neighbour)
+
+    def choose(self):
+        for queue in self._queues:
+            while queue:
+                point = queue.popleft()
+                if not self.isTried(point):
+                    return point
+        return self.randomPoint()
+
+
+class CoarseToFineSweep(SweepStrategy):
+    """
+    Grid at stride 'stride' (default: about 8 points per parameter), then at each halving of the stride only the
+    cells around interesting points of the previous level. A level without interesting points is refined everywhere.
+    """
+    _name = "Coarse to Fine"
+
+    def __init__(self, params, repeat=1, maxAttempts=None, seed=None, stride=None):
+        SweepStrategy.__init__(self, params, repeat, maxAttempts, seed)
+        if stride is None:
+            stride = 1
+            while max(self.shape) > stride * 8:
+                stride *= 2
+        self.stride = stride
+        self._level = []
+        self._queue = collections.deque(self.gridPoints(stride))
+
+    def gridPoints(self, stride, around=None):
+        """Points at multiples of stride, only in the cells around the given points if any"""
+        if around is None:
+            axes = [range(0, n, stride) for n in self.shape]
+            return list(itertools.product(*axes))
+        points = set()
+        for centre in around:
+            axes = [[i + k * stride for k in (-1, 0, 1) if 0 <= i + k * stride < n] for i, n in zip(centre, self.shape)]
+            points.update(itertools.product(*axes))
+        return sorted(points)
+
+    def choose(self):
+        while True:
+            while self._queue:
+                point = self._queue.popleft()
+                if not self.isTried(point):
+                    self._level.append(point)
+                    return point
+            if self.stride == 1:
+                return None
+            interesting = [p for p in self._level if self.isInteresting(p)]
+            self.stride //= 2
+            self._level = []
+            self._queue.extend(self.gridPoints(self.stride, interesting if interesting else None))
+
+
+strategies = collections.OrderedDict((s._name, s) for s in (LinearSweep, RandomSweep, AdaptiveSweep, CoarseToFineSweep))
+
+
+def runSweep(strategy, attempt, normeval='s.startswith("Bad")', succeval='s.startswith("Welcome")', stopOnSuccess=False):
+    """
+    Run a search without GUI: attempt(settings) applies the settings, glitches the target and returns its response,
+    which is classified with the expressions as in the Glitch Explorer. Returns the list of (settings, response,
+    normal, success).
+    """
+    log = []
+    for values in strategy:
+        resp = attempt(values)
+        normal, success = classify(resp, normeval, succeval)
+        strategy.report(values, normal, success)
+        log.append((values, resp, normal, success))
+        if success and stopOnSuccess:
+            break
+    return log
+
+
+class SimulatedGlitchTarget(object):
+    """
+    Responds to glitch settings like the glitch tutorial firmware: "Bad password" normally, "Welcome" with probability
+    successRate inside the window (one (low, high) per parameter) and a garbled response otherwise there. Within
+    'margin' of the window the target crashes with probability crashRate.
+    """
+
+    def __init__(self, window, successRate=0.5, margin=None, crashRate=0.3, seed=None):
+        self.window = window
+        self.successRate = successRate
+        self.margin = margin if margin is not None else [0] * len(window)
+        self.crashRate = crashRate
+        self.random = random.Random(seed)
+        self.attempts = 0
+
+    def inside(self, values, margin=None):
+        margin = margin or [0] * len(self.window)
+        return all(lo - m <= v <= hi + m for v, (lo, hi), m in zip(values, self.window, margin))
+
+    def respond(self, values):
+        self.attempts += 1
+        if self.inside(values):
+            if self.random.random() < self.successRate:
+                return "Welcome to the system\n"
+            return "\x00\xff"
+        if self.inside(values, self.margin) and self.random.random() < self.crashRate:
+            return ""
+        return "Bad password\n"
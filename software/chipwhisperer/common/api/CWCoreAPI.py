@@ -83,6 +83,7 @@ class CWCoreAPI(Parameterized):
         self._auxList = [None]  # TODO: implement it as a list in the whole class
         self._numTraces = 50
         self._numTraceSets = 1
+        self._pipelineDepth = 0
 
         self.params = Parameter(name='Generic Settings', type='group', addLoadSave=True).register()
         self.params.addChildren([
@@ -97,6 +98,8 @@ class CWCoreAPI(Parameterized):
                      'as each segment is buffered into RAM before being written to disk.'},
                     {'name':'Traces per Set', 'type':'int', 'readonly':True, 'get':self.tracesPerSet},
                     {'name':'Key/Text Pattern', 'type':'list', 'values':self.valid_acqPatterns, 'get':self.getAcqPattern, 'set':self.setAcqPattern},
+                    {'name':'Pipeline Depth', 'type':'int', 'limits':(0, 1E4), 'get':self.getPipelineDepth, 'set':self.setPipelineDepth, 'tip': 'Number of captured traces '
+                     'that may wait to be written while the next traces are captured (0 = write each trace before the next capture).'},
             ]},
         ])
         self.scopeParam = Parameter(name="Scope Settings", type='group', addLoadSave=True).register()
@@ -302,6 +305,15 @@ class CWCoreAPI(Parameterized):
         """Set the number of sets/segments"""
         self._numTraceSets = s
 
+    def getPipelineDepth(self):
+        """Return the number of captured traces that may be queued for writing"""
+        return self._pipelineDepth
+
+    @setupSetParam("Pipeline Depth")
+    def setPipelineDepth(self, depth):
+        """Set the number of captured traces that may be queued for writing (0 = no pipelining)"""
+        self._pipelineDepth = depth
+
     def tracesPerSet(self):
         """Return the number of traces in each set/segment"""
         return int(self._numTraces / self._numTraceSets)
@@ -353,6 +365,7 @@ class CWCoreAPI(Parameterized):
 
                 ac = AcquisitionController(self.getScope(), self.getTarget(), currentTrace, self._auxList, self.getAcqPattern())
                 ac.setMaxtraces(setSize)
+                ac.setPipelineDepth(self._pipelineDepth)
                 ac.sigNewTextResponse.connect(self.sigNewTextResponse.emit)
                 ac.sigTraceDone.connect(self.sigTraceDone.emit)
                 __pb = lambda: progressBar.updateStatus(i*setSize + ac.currentTrace + 1, (i, ac.currentTrace))
@@ -22,12 +22,18 @@
 #    You should have received a copy of the GNU General Public License
 #    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
 
+import bisect
+import collections
 import ConfigParser
 import logging
 import os.path
 import re
+import numpy as np
 
 from chipwhisperer.common.traces.TraceContainerNative import TraceContainerNative
+from chipwhisperer.common.traces.TraceContainerChunked import TraceContainerChunked
+from chipwhisperer.common.traces.TraceContainerCompressed import TraceContainerCompressed
+from chipwhisperer.common.traces._cfgfile import TraceContainerConfig
 from chipwhisperer.common.utils import util
 from chipwhisperer.common.utils.tracesource import TraceSource
 
@@ -39,6 +45,10 @@ class TraceManager(TraceSource):
     load and manage the traces.
     """
 
+    # Container class for the "format" recorded in a segment's .cfg file, native if not listed
+    segmentFormats = {"native":TraceContainerNative, "chunked":TraceContainerChunked,
+                      "compressed":TraceContainerCompressed}
+
     def __init__(self, name = "Trace Management"):
         TraceSource.__init__(self, name)
         self.name = name
@@ -48,11 +58,19 @@ class TraceManager(TraceSource):
         self._sampleRate = 0
         self.lastUsedSegment = None
         self.traceSegments = []
+        self._enabledSegments = []
+        self._segmentStarts = []
+        self._loadedSegments = collections.OrderedDict()
+        self._maxLoadedSegments = 4
+        self._segmentHits = 0
+        self._segmentMisses = 0
         if __debug__: logging.debug('Created: ' + str(self))
 
     def newProject(self):
         """Create a new empty set of traces."""
+        self.flushSegmentCache()
         self.traceSegments = []
+        self._updateRanges()
         self.dirty.setValue(False)
         self.sigTracesChanged.emit()
 
@@ -78,7 +96,11 @@ class TraceManager(TraceSource):
                 fname = fdir + t[1]
                 fname = os.path.normpath(fname.replace("\\", "/"))
                 # print "Opening %s"%fname
-                ti = TraceContainerNative()
+                try:
+                    fmt = TraceContainerConfig(fname).attr("format")
+                except Exception:
+                    fmt = None
+                ti = TraceManager.segmentFormats.get(fmt, TraceContainerNative)()
                 try:
                     ti.config.loadTrace(fname)
                 except Exception, e:
@@ -107,39 +129,77 @@ class TraceManager(TraceSource):
 
     def getSegmentList(self, start=0, end=-1):
         """Return a list of segments."""
-        tnum = start
         if end == -1:
             end = self._numTraces
 
         dataDict = {'offsetList':[], 'lengthList':[]}
 
-        while(tnum < end):
-            t = self.getSegment(tnum)
+        if start >= end:
+            return dataDict
+
+        # Only the offset index is needed here, so no segment gets loaded
+        first = self._findSegment(start)
+        for t in self._enabledSegments[first:]:
+            if t.mappedRange[0] >= end:
+                break
             dataDict['offsetList'].append(t.mappedRange[0])
             dataDict['lengthList'].append(t.mappedRange[1] - t.mappedRange[0] + 1)
-            tnum = t.mappedRange[1] + 1
 
         return dataDict
 
+    def _findSegment(self, traceIndex):
+        """Return the position in the list of enabled segments of the segment holding traceIndex."""
+        i = bisect.bisect_right(self._segmentStarts, traceIndex) - 1
+        if i < 0 or traceIndex > self._enabledSegments[i].mappedRange[1]:
+            raise ValueError("Error: Trace %d is not in mapped range." % traceIndex)
+        return i
+
     def getSegment(self, traceIndex):
         """Return the trace segment with the specified trace in the list with all enabled segments."""
-        if self.lastUsedSegment is not None:
-            if self.lastUsedSegment.mappedRange is not None and self.lastUsedSegment.mappedRange[0] <= traceIndex <= \
-                    self.lastUsedSegment.mappedRange[1]:
-                return self.lastUsedSegment
-            else:
-                # Only load one segment at a time for memory reasons
-                self.lastUsedSegment.unloadAllTraces()
-                self.lastUsedSegment = None
+        traceSegment = self._enabledSegments[self._findSegment(traceIndex)]
 
-        for traceSegment in self.traceSegments:
-            if traceSegment.mappedRange and traceSegment.mappedRange[0] <= traceIndex <= traceSegment.mappedRange[1]:
-                if not traceSegment.isLoaded():
-                    traceSegment.loadAllTraces(None, None)
-                self.lastUsedSegment = traceSegment
-                return traceSegment
+        if traceSegment in self._loadedSegments:
+            self._segmentHits += 1
+            # Mark as most recently used
+            del self._loadedSegments[traceSegment]
+        else:
+            self._segmentMisses += 1
+            if not traceSegment.isLoaded():
+                traceSegment.loadAllTraces(None, None)
+        self._loadedSegments[traceSegment] = traceSegment
+
+        # Keep only a few segments loaded for memory reasons
+        while len(self._loadedSegments) > self._maxLoadedSegments:
+            self._loadedSegments.popitem(last=False)[0].unloadAllTraces()
+
+        self.lastUsedSegment = traceSegment
+        return traceSegment
+
+    def setMaxLoadedSegments(self, num):
+        """Set how many segments are kept loaded at once, least recently used ones are unloaded first."""
+        self._maxLoadedSegments = max(1, num)
+        while len(self._loadedSegments) > self._maxLoadedSegments:
+            self._loadedSegments.popitem(last=False)[0].unloadAllTraces()
+
+    def getMaxLoadedSegments(self):
+        return self._maxLoadedSegments
+
+    def flushSegmentCache(self):
+        """Unload all the segments loaded by getSegment()."""
+        for t in self._loadedSegments:
+            t.unloadAllTraces()
+        self._loadedSegments.clear()
+        self.lastUsedSegment = None
+
+    def getSegmentCacheStats(self):
+        """Return the hit/miss counters of the loaded segments cache."""
+        total = self._segmentHits + self._segmentMisses
+        return {'hits':self._segmentHits, 'misses':self._segmentMisses, 'loaded':len(self._loadedSegments),
+                'hitrate':(float(self._segmentHits) / total) if total else 0.0}
 
-        raise ValueError("Error: Trace %d is not in mapped range." % traceIndex)
+    def resetSegmentCacheStats(self):
+        self._segmentHits = 0
+        self._segmentMisses = 0
 
     def getAuxData(self, n, auxDic):
         """Return data about a segment"""
@@ -175,6 +235,67 @@ class TraceManager(TraceSource):
         except ValueError:
             return []
 
+    def _segmentRanges(self, start, stop):
+        """
+        Walk traces start...stop-1 as (segment, first, last+1) pieces, indexes relative to each segment.
+        Later getSegment() calls may unload a segment, so each piece must be read before asking for the next one.
+        """
+        tnum = start
+        while tnum < stop:
+            t = self.getSegment(tnum)
+            end = min(stop, t.mappedRange[1] + 1)
+            yield (t, tnum - t.mappedRange[0], end - t.mappedRange[0])
+            tnum = end
+
+    def _joinRanges(self, pieces):
+        if len(pieces) == 1:
+            return pieces[0]
+        return np.concatenate(pieces)
+
+    def getTracesIndexed(self, start, stop):
+        """Return (traces, tnums) for traces start...stop-1, see TraceSource.getTracesIndexed(). No trace is ever rejected here."""
+        return self.getTraces(start, stop), np.arange(start, stop)
+
+    def getTraces(self, start, stop, pointRange=None):
+        """Return traces start...stop-1 as a 2-D array. Ranges inside one segment are views of the segment data."""
+        return self._joinRanges([t.getTraces(a, b, pointRange) for t, a, b in self._segmentRanges(start, stop)])
+
+    def getTextins(self, start, stop):
+        """Return the input texts of traces start...stop-1 as a 2-D array"""
+        return self._joinRanges([t.getTextins(a, b) for t, a, b in self._segmentRanges(start, stop)])
+
+    def getTextouts(self, start, stop):
+        """Return the output texts of traces start...stop-1 as a 2-D array"""
+        return self._joinRanges([t.getTextouts(a, b) for t, a, b in self._segmentRanges(start, stop)])
+
+    def getKnownKeys(self, start, stop):
+        """Return the known encryption keys of traces start...stop-1."""
+        keys = []
+        try:
+            for t, a, b in self._segmentRanges(start, stop):
+                keys.extend(t.getKnownKeys(a, b))
+        except ValueError:
+            return [[]] * (stop - start)
+        return keys
+
+    def getTraceBlock(self, start, stop, pointRange=None):
+        """Return (traces, textins, textouts, knownkeys) for traces start...stop-1, see TraceSource.getTraceBlock()."""
+        traces = []
+        textins = []
+        textouts = []
+        knownkeys = []
+        for t, a, b in self._segmentRanges(start, stop):
+            traces.append(t.getTraces(a, b, pointRange))
+            textins.append(t.getTextins(a, b))
+            textouts.append(t.getTextouts(a, b))
+            try:
+                knownkeys.extend(t.getKnownKeys(a, b))
+            except ValueError:
+                knownkeys.extend([[]] * (b - a))
+        if len(traces) == 0:
+            return np.array([]), np.array([]), np.array([]), knownkeys
+        return self._joinRanges(traces), self._joinRanges(textins), self._joinRanges(textouts), knownkeys
+
     def _updateRanges(self):
         """Update the trace range for each segments."""
         startTrace = 0
@@ -203,6 +324,16 @@ class TraceManager(TraceSource):
                 t.mappedRange = None
         self._numTraces = startTrace
 
+        # Offset index used by getSegment()
+        self._enabledSegments = [t for t in self.traceSegments if t.mappedRange is not None and t.mappedRange[1] >= t.mappedRange[0]]
+        self._segmentStarts = [t.mappedRange[0] for t in self._enabledSegments]
+        for t in self._loadedSegments.keys():
+            if t.mappedRange is None or t not in self.traceSegments:
+                t.unloadAllTraces()
+                del self._loadedSegments[t]
+        if self.lastUsedSegment not in self._loadedSegments:
+            self.lastUsedSegment = None
+
     def numPoints(self):
         """Return the number of points in traces of the selected segments."""
         return self._numPoints
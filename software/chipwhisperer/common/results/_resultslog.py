@@ -0,0 +1,149 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016 MARC
+# All rights reserved.
+#
+# Author: MARC
+#
+# Append-only log of attack results, written by ResultsSave while an attack runs. The file is
+# a fixed header followed by fixed-width records, one per reporting interval:
+#
+#   header   magic "CWRESLOG", version, number of keys, number of guesses per key (32 bytes)
+#   record   tracecnt  int64[keys]           traces used for each key (-1: not attacked yet)
+#            diffsmax  float64[keys][perms]  maximum over all points of each key guess
+#            diffsmin  float64[keys][perms]  minimum
+#
+# Adding a record only appends to the file, so the cost does not grow over the attack. Every
+# record is flushed, and readers only use complete records, so the log can be read (or followed
+# with ResultsLogReader.poll()) by another process while the attack is still writing it. Records
+# support the same indexing as the former list of dicts: rec[i]["diffsmax"][key][guess].
+
+import os
+import numpy as np
+
+
+MAGIC = "CWRESLOG"
+VERSION = 1
+
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("version", "<u4"), ("numKeys", "<u4"), ("numPerms", "<u4"), ("reserved", "<u4", (3,))])
+
+
+def recordDtype(numKeys, numPerms):
+    return np.dtype([("tracecnt", "<i8", (numKeys,)), ("diffsmax", "<f8", (numKeys, numPerms)), ("diffsmin", "<f8", (numKeys, numPerms))])
+
+
+def diffsMaxMin(diffs, numKeys, numPerms):
+    """Maximum and minimum of each key guess over all points, (numKeys x numPerms) each. NaN where there are no diffs."""
+    tempmax = np.full((numKeys, numPerms), np.nan)
+    tempmin = np.full((numKeys, numPerms), np.nan)
+
+    if isinstance(diffs, np.ndarray) and diffs.ndim >= 2:
+        # All keys in one array: a single reduction
+        groups = [(slice(0, numKeys), diffs[:numKeys])]
+    else:
+        groups = [(slice(i, i + 1), np.asarray(diffs[i])[None]) for i in range(0, numKeys) if diffs[i] is not None]
+
+    for keys, d in groups:
+        # (keys x guesses x points), one point per guess for e.g. the template attack
+        d = np.asarray(d, dtype=np.float64)
+        d = d.reshape(d.shape[0], d.shape[1], -1)[:, :numPerms]
+        if d.shape[2] == 0:
+            continue
+        tempmax[keys, :d.shape[1]] = np.nanmax(d, axis=2)
+        tempmin[keys, :d.shape[1]] = np.nanmin(d, axis=2)
+
+    return tempmax, tempmin
+
+
+class ResultsLog(object):
+    """Writes a results log (see above). The file is created, or replaced, when the log is opened."""
+
+    def __init__(self, fname, numKeys, numPerms):
+        self.fname = fname
+        self.numKeys = numKeys
+        self.numPerms = numPerms
+        self.dtype = recordDtype(numKeys, numPerms)
+        self.records = 0
+
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header["magic"] = MAGIC
+        header["version"] = VERSION
+        header["numKeys"] = numKeys
+        header["numPerms"] = numPerms
+
+        self._file = open(fname, "wb")
+        self._file.write(header.tostring())
+        self._file.flush()
+
+    def append(self, tracecnt, diffsmax, diffsmin):
+        """Append one record, tracecnt may contain None for keys not attacked"""
+        rec = np.zeros(1, dtype=self.dtype)
+        rec["tracecnt"] = [-1 if t is None else t for t in tracecnt][:self.numKeys]
+        rec["diffsmax"] = diffsmax
+        rec["diffsmin"] = diffsmin
+        self._file.write(rec.tostring())
+        self._file.flush()
+        self.records += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def readHeader(f):
+    data = f.read(HEADER_DTYPE.itemsize)
+    # Files shorter than the header (e.g. a small .npy) are not logs either
+    if len(data) != HEADER_DTYPE.itemsize:
+        raise IOError("Not a results log")
+    header = np.fromstring(data, dtype=HEADER_DTYPE)
+    if header["magic"][0] != MAGIC:
+        raise IOError("Not a results log")
+    if header["version"][0] > VERSION:
+        raise IOError("Results log version %d not supported" % header["version"][0])
+    return recordDtype(int(header["numKeys"][0]), int(header["numPerms"][0]))
+
+
+def isResultsLog(fname):
+    try:
+        with open(fname, "rb") as f:
+            readHeader(f)
+        return True
+    except IOError:
+        return False
+
+
+class ResultsLogReader(object):
+    """Reads a results log, also while it is still being written"""
+
+    def __init__(self, fname):
+        self.fname = fname
+        with open(fname, "rb") as f:
+            self.dtype = readHeader(f)
+        self.records = 0
+
+    def numRecords(self):
+        """Number of complete records in the file now"""
+        return max(os.path.getsize(self.fname) - HEADER_DTYPE.itemsize, 0) // self.dtype.itemsize
+
+    def read(self, start=0, stop=None):
+        """Records start...stop-1 (default: all complete ones) as a structured array"""
+        available = self.numRecords()
+        stop = available if stop is None else min(stop, available)
+        if stop <= start:
+            return np.zeros(0, dtype=self.dtype)
+        with open(self.fname, "rb") as f:
+            f.seek(HEADER_DTYPE.itemsize + start * self.dtype.itemsize)
+            return np.fromstring(f.read((stop - start) * self.dtype.itemsize), dtype=self.dtype)
+
+    def poll(self):
+        """Records appended since the last poll()"""
+        recs = self.read(self.records)
+        self.records += len(recs)
+        return recs
+
+
+def load(fname):
+    """All complete records of a results log"""
+    return ResultsLogReader(fname).read()
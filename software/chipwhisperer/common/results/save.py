@@ -24,11 +24,10 @@
 #    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
 #=================================================
 
-import copy
 from datetime import datetime
-import numpy as np
 from chipwhisperer.analyzer.attacks._base import AttackObserver
 from .base import ResultsBase
+from ._resultslog import ResultsLog, diffsMaxMin
 from chipwhisperer.common.utils.pluginmanager import Plugin
 from chipwhisperer.common.utils.parameter import setupSetParam
 
@@ -41,7 +40,7 @@ class ResultsSave(ResultsBase, AttackObserver, Plugin):
         AttackObserver.__init__(self)
         self._filename = None
         self._enabled = False
-        self.dataarray = None
+        self._log = None
 
         self.getParams().addChildren([
             {'name':'Save Raw Results', 'type':'bool', 'get':self.getEnabled, 'set':self.setEnabled}
@@ -60,31 +59,20 @@ class ResultsSave(ResultsBase, AttackObserver, Plugin):
         # attackStats.diffs_tnum[i]
 
         if self._filename is None:
-            # Generate filename
-            self._filename = "tempstats_%s.npy" % datetime.now().strftime('%Y%m%d_%H%M%S')
-
-            # Generate Array
-            self.dataarray = []
+            # Generate filename, records are appended to the log as the attack runs
+            self._filename = "tempstats_%s.cwr" % datetime.now().strftime('%Y%m%d_%H%M%S')
+            self._log = ResultsLog(self._filename, self._numKeys(), self._maxNumPerms())
 
         # Record max & min, used as we don't know if user wanted absolute mode or not
-
-        tempmin = np.ndarray((self._numKeys(), self._maxNumPerms()))
-        tempmax = np.ndarray((self._numKeys(), self._maxNumPerms()))
-
-        for i in range(0, self._numKeys()):
-            for j in range(0, self._numPerms(i)):
-                tempmax[i][j] = np.nanmax(attackStats.diffs[i][j])
-                tempmin[i][j] = np.nanmin(attackStats.diffs[i][j])
-
-        newdata = {"tracecnt":copy.deepcopy(attackStats.diffs_tnum), "diffsmax":tempmax, "diffsmin":tempmin}
-
-        self.dataarray.append(newdata)
-        np.save(self._filename, self.dataarray)
+        tempmax, tempmin = diffsMaxMin(attackStats.diffs, self._numKeys(), self._maxNumPerms())
+        self._log.append(attackStats.diffs_tnum, tempmax, tempmin)
 
     def processAnalysis(self):
         """Attack is done"""
+        if self._log is not None:
+            self._log.close()
         self._filename = None
-        self.dataarray = None
+        self._log = None
 
     def getEnabled(self):
         return self._enabled
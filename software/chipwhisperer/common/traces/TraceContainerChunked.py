@@ -0,0 +1,357 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016 MARC
+# All rights reserved.
+#
+# Author: MARC
+#
+# Trace container that writes traces to disk in fixed-size chunks while they are captured:
+#
+#   <prefix>chunk000000_traces.npy   (and _textin, _textout, _keys)
+#   <prefix>chunk000001_traces.npy
+#   ...
+#   <prefix>manifest.json            list of committed chunks
+#
+# Only one chunk is held in RAM, so the size of a capture is limited by the disk instead of the
+# memory. A chunk is written and synced before it is added to the manifest, and the manifest is
+# replaced atomically (write to temporary file, rename), so after a crash everything up to the
+# last committed chunk can still be read. Chunks are memory-mapped when reading, and refresh()
+# picks up chunks committed since, so a capture can be looked at while it is still running.
+
+import bisect
+import json
+import os
+import numpy as np
+from _base import TraceContainer
+from chipwhisperer.common.utils.parameter import setupSetParam
+
+
+MANIFEST_VERSION = 1
+
+# Per-chunk files, and the in-memory buffers of the chunk being filled
+CHUNK_FIELDS = (("traces", "traces"), ("textin", "textins"), ("textout", "textouts"), ("keys", "keylist"))
+
+
+def syncSave(fname, data):
+    """np.save() that only returns once the data is on disk"""
+    f = open(fname, "wb")
+    try:
+        np.save(f, data)
+        f.flush()
+        os.fsync(f.fileno())
+    finally:
+        f.close()
+
+
+def replaceFile(fname, text):
+    """Atomically replace fname with text: readers see either the old or the new file, never a partial one"""
+    tmpname = fname + ".tmp"
+    f = open(tmpname, "w")
+    try:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    finally:
+        f.close()
+    try:
+        os.rename(tmpname, fname)
+    except OSError:
+        # Windows does not replace existing files on rename
+        os.remove(fname)
+        os.rename(tmpname, fname)
+
+
+class TraceContainerChunked(TraceContainer):
+    _name = "ChipWhisperer/Chunked"
+
+    def __init__(self, configfile=None):
+        self.chunkSize = 1000
+        TraceContainer.__init__(self, configfile)
+        self.getParams().addChildren([
+            {'name':'Chunk Size (traces)', 'key':'chunksize', 'type':'int', 'limits':(1, 10000000), 'get':self.getChunkSize, 'set':self.setChunkSize},
+        ])
+
+    def clear(self):
+        TraceContainer.clear(self)
+        self.config.setAttr("format", "chunked")
+        # Committed chunks: name, index of first trace, number of traces
+        self.chunks = []
+        self.chunkStarts = []
+        self._committed = 0
+        # Memory-mapped chunk files, by (chunk index, field)
+        self._mapped = {}
+        self._directory = None
+        self._prefix = None
+
+    def getChunkSize(self):
+        return self.chunkSize
+
+    @setupSetParam("Chunk Size (traces)")
+    def setChunkSize(self, traces):
+        """Number of traces kept in RAM and written to disk at once"""
+        self.chunkSize = max(1, int(traces))
+
+    def setTraceHint(self, traces):
+        # Only one chunk is kept in memory
+        self.tracehint = min(traces, self.chunkSize)
+
+    def setTraceBuffer(self, tracebuffer):
+        # Buffers of other sets are not reused, they may be far larger than a chunk
+        pass
+
+    def useRawPoints(self, scale, offset):
+        if self.traces is not None or self._committed:
+            if not self.isRaw() or (scale, offset) != self.getPointScaling():
+                return False
+        self.setPointScaling(scale, offset)
+        return True
+
+    def isRaw(self):
+        return self.traces is not None and self.traces.dtype.kind in 'iu' or \
+               self._committed > 0 and self._chunkData(0, "traces").dtype.kind in 'iu'
+
+    def location(self, directory=None, prefix=None):
+        if directory is None:
+            directory = os.path.split(self.config.configFilename())[0]
+        if prefix is None:
+            prefix = self.config.attr("prefix")
+        return directory, prefix
+
+    def manifestFilename(self, directory=None, prefix=None):
+        directory, prefix = self.location(directory, prefix)
+        return os.path.join(directory, "%smanifest.json" % prefix)
+
+    def chunkFilename(self, name, field, directory=None):
+        directory, _ = self.location(directory)
+        return os.path.join(directory, "%s_%s.npy" % (name, field))
+
+    def numTraces(self):
+        if self._isloaded or self._committed or self._numTraces:
+            return self._committed + self._numTraces
+        return TraceContainer.numTraces(self)
+
+    def numPoints(self):
+        if self._committed:
+            return self._chunkData(0, "traces").shape[1]
+        if self.traces is not None:
+            return self.traces.shape[1]
+        try:
+            return int(self.config.attr("numPoints"))
+        except (TypeError, ValueError):
+            return 0
+
+    def writeDataToConfig(self):
+        self.config.setAttr("numTraces", self._committed + self._numTraces)
+        self.config.setAttr("numPoints", self.numPoints())
+
+    def addTrace(self, trace, textin, textout, key, dtype=np.double, channelNum=0):
+        TraceContainer.addTrace(self, trace, textin, textout, key, dtype, channelNum)
+        if self._numTraces >= self.chunkSize:
+            self.flushChunk()
+
+    def flushChunk(self):
+        """Write the traces added since the last chunk to disk and commit them in the manifest"""
+        n = self._numTraces
+        if n == 0:
+            return
+        directory, prefix = self.location()
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        chunk = {"name":"%schunk%06d" % (prefix, len(self.chunks)), "start":self._committed, "count":n}
+        for field, attr in CHUNK_FIELDS:
+            data = getattr(self, attr)
+            if isinstance(data, list):
+                # Missing or odd-sized text/keys, stored only if they can be memory-mapped
+                try:
+                    data = np.asarray(data, dtype=np.uint8)
+                except (TypeError, ValueError):
+                    continue
+                if data.ndim != 2:
+                    continue
+            self.saveChunkField(chunk, field, data[:n])
+
+        self.chunks.append(chunk)
+        self.chunkStarts.append(self._committed)
+        self._committed += n
+        self.writeManifest()
+
+        # Buffers are reused for the next chunk
+        self._numTraces = 0
+        self._numTextins = 0
+        self._numTextouts = 0
+        self._numKeys = 0
+        self.writeDataToConfig()
+        self.config.saveTrace()
+
+    def saveChunkField(self, chunk, field, data):
+        """Write one field of a new chunk to disk. Anything added to chunk is kept in the manifest."""
+        syncSave(self.chunkFilename(chunk["name"], field), data)
+
+    def loadChunkField(self, chunk, field):
+        """Read one field of a committed chunk, raises IOError if it was not stored"""
+        return np.load(self.chunkFilename(chunk["name"], field, self._directory), mmap_mode='r')
+
+    def writeManifest(self):
+        manifest = {"version":MANIFEST_VERSION, "numTraces":self._committed, "chunks":self.chunks}
+        replaceFile(self.manifestFilename(), json.dumps(manifest, indent=1))
+
+    def readManifest(self, directory=None, prefix=None):
+        try:
+            f = open(self.manifestFilename(directory, prefix), "r")
+        except IOError:
+            # Nothing committed yet
+            return []
+        try:
+            manifest = json.load(f)
+        finally:
+            f.close()
+        if manifest.get("version", 0) > MANIFEST_VERSION:
+            raise IOError("Chunked trace manifest version %s not supported" % manifest.get("version"))
+        chunks = manifest["chunks"]
+        for c in chunks:
+            c["name"] = str(c["name"])
+        return chunks
+
+    def refresh(self):
+        """Pick up chunks committed since the traces were loaded (e.g. by a capture still running). Returns numTraces()."""
+        chunks = self.readManifest(*self.location(self._directory, self._prefix))
+        if len(chunks) < len(self.chunks):
+            # Capture was restarted, forget what was mapped
+            self._mapped = {}
+        self.chunks = chunks
+        self.chunkStarts = [c["start"] for c in chunks]
+        self._committed = sum(c["count"] for c in chunks)
+        return self.numTraces()
+
+    def loadAllTraces(self, directory=None, prefix=""):
+        """Map the committed chunks (nothing is read into memory until used)"""
+        if self.config.configFilename():
+            directory, prefix = self.location(directory, prefix)
+        self._directory = directory
+        self._prefix = prefix
+        self.refresh()
+
+        self.pointScale = float(self.config.attr("pointScale"))
+        self.pointOffset = float(self.config.attr("pointOffset"))
+        try:
+            self.knownkey = np.load(os.path.join(directory, "%sknownkey.npy" % prefix))
+        except (IOError, ValueError):
+            self.knownkey = None
+
+        self.setDirty(False)
+        self._isloaded = True
+
+    def unloadAllTraces(self):
+        """Drop the memory maps, the chunk list is kept"""
+        self._mapped = {}
+        self._isloaded = False
+
+    def _chunkData(self, c, field):
+        key = (c, field)
+        if key not in self._mapped:
+            try:
+                self._mapped[key] = self.loadChunkField(self.chunks[c], field)
+            except IOError:
+                # Field was not stored (e.g. no keys)
+                self._mapped[key] = None
+        return self._mapped[key]
+
+    def _pending(self, field):
+        return getattr(self, dict(CHUNK_FIELDS)[field])
+
+    def _row(self, field, n):
+        if n < 0:
+            n += self.numTraces()
+        if n >= self._committed:
+            data = self._pending(field)
+            offset = self._committed
+        else:
+            c = bisect.bisect_right(self.chunkStarts, n) - 1
+            data = self._chunkData(c, field)
+            offset = self.chunkStarts[c]
+        if data is None:
+            return None
+        return data[n - offset]
+
+    def _rows(self, field, start, stop):
+        """Rows start...stop-1 of a field, a view if they are in a single chunk"""
+        stop = min(stop, self.numTraces())
+        parts = []
+        n = start
+        while n < stop:
+            if n >= self._committed:
+                data = self._pending(field)
+                first = self._committed
+                end = stop
+            else:
+                c = bisect.bisect_right(self.chunkStarts, n) - 1
+                data = self._chunkData(c, field)
+                first = self.chunkStarts[c]
+                end = min(stop, first + self.chunks[c]["count"])
+            if data is None:
+                parts.append(np.array([None] * (end - n)))
+            else:
+                parts.append(data[n - first:end - first])
+            n = end
+        if len(parts) == 1:
+            return parts[0]
+        if len(parts) == 0:
+            return np.zeros((0, self.numPoints())) if field == "traces" else np.zeros(0)
+        return np.concatenate(parts)
+
+    def getTrace(self, n):
+        return self.scalePoints(self._row("traces", n))
+
+    def getTraceRaw(self, n):
+        return self._row("traces", n)
+
+    def getTracesRaw(self, start, stop, pointRange=None):
+        data = self._rows("traces", start, stop)
+        if pointRange is None:
+            return data
+        return data[:, pointRange[0]:pointRange[1]]
+
+    def getTextin(self, n):
+        return self._row("textin", n)
+
+    def getTextout(self, n):
+        return self._row("textout", n)
+
+    def getKnownKey(self, n=0):
+        key = self._row("keys", n)
+        if key is None:
+            return self.knownkey
+        return key
+
+    def getTextins(self, start, stop):
+        return np.asarray(self._rows("textin", start, stop))
+
+    def getTextouts(self, start, stop):
+        return np.asarray(self._rows("textout", start, stop))
+
+    def getKnownKeys(self, start, stop):
+        return [self.getKnownKey(n) for n in range(start, min(stop, self.numTraces()))]
+
+    def saveAllTraces(self, directory, prefix=""):
+        self.flushChunk()
+        if self.knownkey is not None:
+            np.save(os.path.join(directory, "%sknownkey.npy" % prefix), self.knownkey)
+        self.config.saveTrace()
+        self.setDirty(False)
+
+    def closeAll(self, clearTrace=True, clearText=True, clearKeys=True):
+        directory, prefix = self.location()
+        self.saveAllTraces(directory, prefix)
+        self._directory = directory
+        self._prefix = prefix
+
+        # Everything is on disk now, drop the chunk buffers
+        if clearTrace:
+            self.traces = None
+        if clearText:
+            self.textins = []
+            self.textouts = []
+        if clearKeys:
+            self.keylist = []
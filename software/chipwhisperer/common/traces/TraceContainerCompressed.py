@@ -0,0 +1,212 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016 MARC
+# All rights reserved.
+#
+# Author: MARC
+#
+# Chunked trace container (see TraceContainerChunked) with compressed traces. Each chunk of
+# traces is compressed on its own and appended to <prefix>traces.cwz; offset and size are kept
+# in the chunk index (manifest), so a trace or a block of traces only needs the chunks it
+# touches to be decompressed. Text and keys are small and are stored as in the chunked format.
+#
+# Before compression the bytes of the points are shuffled (all first bytes, then all second
+# bytes, ...), as done by blosc. Traces from a 10-bit ADC leave most bytes of a float64 constant
+# or nearly so, which zlib then compresses well.
+#
+# Blocks spanning several chunks are decompressed by a pool of threads (zlib releases the GIL),
+# and the most recently used chunks are kept decompressed. getStats() reports the compression
+# ratio and the read throughput.
+
+import bisect
+import collections
+import os
+import threading
+import time
+import zlib
+from multiprocessing.pool import ThreadPool
+import numpy as np
+from TraceContainerChunked import TraceContainerChunked
+from chipwhisperer.common.utils.parameter import setupSetParam
+
+
+def shuffleBytes(data):
+    """Bytes of data, grouped by byte position within the points"""
+    data = np.ascontiguousarray(data)
+    return data.view(np.uint8).reshape(-1, data.dtype.itemsize).T.tostring()
+
+
+def unshuffleBytes(buf, dtype, shape):
+    """Inverse of shuffleBytes()"""
+    dtype = np.dtype(dtype)
+    planes = np.frombuffer(buf, dtype=np.uint8).reshape(dtype.itemsize, -1)
+    return np.ascontiguousarray(planes.T).view(dtype).reshape(shape)
+
+
+class TraceContainerCompressed(TraceContainerChunked):
+    _name = "ChipWhisperer/Compressed"
+
+    def __init__(self, configfile=None):
+        self.level = 6
+        self.threads = 4
+        self.cacheChunks = 4
+        self._lock = threading.Lock()
+        TraceContainerChunked.__init__(self, configfile)
+        self.getParams().addChildren([
+            {'name':'Compression Level', 'key':'level', 'type':'int', 'limits':(1, 9), 'get':self.getCompressionLevel, 'set':self.setCompressionLevel},
+            {'name':'Decompression Threads', 'key':'threads', 'type':'int', 'limits':(1, 64), 'get':self.getThreads, 'set':self.setThreads},
+        ])
+
+    def clear(self):
+        TraceContainerChunked.clear(self)
+        self.config.setAttr("format", "compressed")
+        # Decompressed trace chunks, least recently used first
+        self._decompressed = collections.OrderedDict()
+        self.closePool()
+        self.stats_chunks    = 0
+        self.stats_readBytes = 0
+        self.stats_readTime  = 0.0
+
+    def getCompressionLevel(self):
+        return self.level
+
+    @setupSetParam("Compression Level")
+    def setCompressionLevel(self, level):
+        """zlib level used for new chunks (1: fastest ... 9: smallest)"""
+        self.level = level
+
+    def getThreads(self):
+        return self.threads
+
+    @setupSetParam("Decompression Threads")
+    def setThreads(self, threads):
+        """Number of chunks decompressed in parallel by block reads"""
+        self.threads = max(1, threads)
+        self.closePool()
+
+    def closePool(self):
+        """Stop the decompression threads, a new pool is started by the next block read"""
+        pool = getattr(self, "_pool", None)
+        self._pool = None
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    def dataFilename(self, directory=None, prefix=None):
+        directory, prefix = self.location(directory, prefix)
+        return os.path.join(directory, "%straces.cwz" % prefix)
+
+    def saveChunkField(self, chunk, field, data):
+        if field != "traces":
+            return TraceContainerChunked.saveChunkField(self, chunk, field, data)
+
+        packed = zlib.compress(shuffleBytes(data), self.level)
+        # First chunk starts a new file, data left behind by an interrupted write is never indexed
+        f = open(self.dataFilename(), "ab" if self.chunks else "wb")
+        try:
+            f.seek(0, os.SEEK_END)
+            chunk["offset"] = f.tell()
+            f.write(packed)
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+        chunk["length"] = len(packed)
+        chunk["dtype"] = data.dtype.str
+        chunk["shape"] = list(data.shape)
+
+    def loadChunkField(self, chunk, field):
+        if field != "traces":
+            return TraceContainerChunked.loadChunkField(self, chunk, field)
+
+        f = open(self.dataFilename(self._directory, self._prefix), "rb")
+        try:
+            f.seek(chunk["offset"])
+            packed = f.read(chunk["length"])
+        finally:
+            f.close()
+        if len(packed) != chunk["length"]:
+            raise IOError("Compressed trace file %s is truncated" % self.dataFilename(self._directory, self._prefix))
+
+        started = time.time()
+        data = unshuffleBytes(zlib.decompress(packed), chunk["dtype"], chunk["shape"])
+        data.flags.writeable = False
+        with self._lock:
+            self.stats_chunks += 1
+            self.stats_readBytes += data.nbytes
+            self.stats_readTime += time.time() - started
+        return data
+
+    def _chunkData(self, c, field):
+        if field != "traces":
+            return TraceContainerChunked._chunkData(self, c, field)
+        data = self._decompressed.pop(c, None)
+        if data is None:
+            data = self.loadChunkField(self.chunks[c], field)
+        self._decompressed[c] = data
+        while len(self._decompressed) > self.cacheChunks:
+            self._decompressed.popitem(last=False)
+        return data
+
+    def prefetch(self, start, stop):
+        """Decompress the chunks holding traces start...stop-1 in parallel"""
+        stop = min(stop, self._committed)
+        if stop <= start:
+            return
+        first = bisect.bisect_right(self.chunkStarts, start) - 1
+        last = bisect.bisect_right(self.chunkStarts, stop - 1) - 1
+        missing = [c for c in range(first, last + 1) if c not in self._decompressed]
+        if len(missing) < 2:
+            return
+        if self._pool is None:
+            self._pool = ThreadPool(self.threads)
+        decoded = self._pool.map(lambda c: self.loadChunkField(self.chunks[c], "traces"), missing)
+        for c, data in zip(missing, decoded):
+            self._decompressed[c] = data
+
+    def getTracesRaw(self, start, stop, pointRange=None):
+        # Keep every chunk of the block while it is assembled
+        cacheChunks = self.cacheChunks
+        self.cacheChunks = max(cacheChunks, len(self.chunks))
+        try:
+            self.prefetch(start, stop)
+            return TraceContainerChunked.getTracesRaw(self, start, stop, pointRange)
+        finally:
+            self.cacheChunks = cacheChunks
+            while len(self._decompressed) > self.cacheChunks:
+                self._decompressed.popitem(last=False)
+
+    def numPoints(self):
+        if self._committed:
+            return self.chunks[0]["shape"][1]
+        return TraceContainerChunked.numPoints(self)
+
+    def isRaw(self):
+        if self._committed:
+            return np.dtype(str(self.chunks[0]["dtype"])).kind in 'iu'
+        return TraceContainerChunked.isRaw(self)
+
+    def refresh(self):
+        committed = self._committed
+        numTraces = TraceContainerChunked.refresh(self)
+        if self._committed < committed:
+            self._decompressed.clear()
+        return numTraces
+
+    def unloadAllTraces(self):
+        TraceContainerChunked.unloadAllTraces(self)
+        self._decompressed.clear()
+        self.closePool()
+
+    def closeAll(self, clearTrace=True, clearText=True, clearKeys=True):
+        TraceContainerChunked.closeAll(self, clearTrace, clearText, clearKeys)
+        self.closePool()
+
+    def getStats(self):
+        """Return compression ratio of the committed chunks, and chunks/bytes decompressed with throughput in MB/s"""
+        raw = sum(np.dtype(str(c["dtype"])).itemsize * c["shape"][0] * c["shape"][1] for c in self.chunks)
+        packed = sum(c["length"] for c in self.chunks)
+        return {'rawBytes':raw, 'compressedBytes':packed, 'ratio':(float(raw) / packed) if packed else 0.0,
+                'chunks':self.stats_chunks, 'readBytes':self.stats_readBytes, 'readTime':self.stats_readTime,
+                'readMBps':(self.stats_readBytes / 1e6 / self.stats_readTime) if self.stats_readTime else 0.0}
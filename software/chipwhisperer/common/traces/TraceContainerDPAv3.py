@@ -29,18 +29,37 @@ import os.path
 import sys
 from PySide.QtGui import *
 from PySide.QtCore import *
-from chipwhisperer.common.utils import tracereader_dpacontestv3, tracereader_native
+from chipwhisperer.common.utils import tracereader_dpacontestv3
+from chipwhisperer.common.ui.ProgressBar import ProgressBar
 import numpy as np
 from time import gmtime, strftime
 from _base import TraceContainer
 import chipwhisperer.common.utils.qt_tweaks as QtFixes
 
+
+def writeRows(f, rows, fmt):
+    """Write rows as lines of values formatted with fmt, each value followed by a space"""
+    start = 0
+    while start < len(rows):
+        # Rows of equal length are formatted as one block
+        width = len(rows[start])
+        stop = start + 1
+        while stop < len(rows) and len(rows[stop]) == width:
+            stop += 1
+        np.savetxt(f, np.asarray(rows[start:stop]), fmt=(fmt + " ") * width)
+        start = stop
+
+
 class TraceContainerDPAv3(TraceContainer):
     _name = "DPAContestv3"
 
+    # Traces buffered before writing to the text files
+    writeBlock = 256
+
     def __init__(self):
         super(TraceContainerDPAv3, self).__init__()
         self.dir = "."
+        self.pending = {"in":[], "out":[], "wave":[], "key":[]}
 
     def setDirectory(self, directory):
         self.dir = directory
@@ -67,10 +86,11 @@ class TraceContainerDPAv3(TraceContainer):
             logging.info('Key file exists!')
             return
         
-        self.inf = open(self.dir + "text_in.txt", "w")
-        self.outf = open(self.dir + "text_out.txt", "w")
-        self.wavef = open(self.dir + "wave.txt", "w")
-        self.keyf = open(self.dir + "key.txt", "w")
+        self.inf = open(self.dir + "text_in.txt", "w", 1 << 16)
+        self.outf = open(self.dir + "text_out.txt", "w", 1 << 16)
+        self.wavef = open(self.dir + "wave.txt", "w", 1 << 20)
+        self.keyf = open(self.dir + "key.txt", "w", 1 << 16)
+        self.pending = {"in":[], "out":[], "wave":[], "key":[]}
         
     def numPoints(self):
         return self._numPoints
@@ -80,23 +100,23 @@ class TraceContainerDPAv3(TraceContainer):
         self._numTraces = self._numTraces + 1
         self._numPoints = len(wave)
 
-        for i in textin:
-            self.inf.write('%2X '%i)
-        self.inf.write('\n')
-
-        for i in textout:
-            self.outf.write('%2X '%i)
-        self.outf.write('\n')
-
-        for i in wave:
-            iint = i * float(2**16)
-            self.wavef.write('%d '%int(iint))
-        self.wavef.write('\n')
-
-        if key:
-            for i in key:
-                self.keyf.write('%2X '%i)
-            self.keyf.write('\n')
+        self.pending["in"].append(np.asarray(textin, dtype=np.int64))
+        self.pending["out"].append(np.asarray(textout, dtype=np.int64))
+        # Same as int(point * 2**16) for every point
+        self.pending["wave"].append(np.trunc(np.asarray(wave, dtype=np.float64) * float(2**16)).astype(np.int64))
+        if key is not None and len(key):
+            self.pending["key"].append(np.asarray(key, dtype=np.int64))
+
+        if len(self.pending["wave"]) >= self.writeBlock:
+            self.writePending()
+
+    def writePending(self):
+        """Write the buffered traces to the text files"""
+        writeRows(self.inf, self.pending["in"], "%2X")
+        writeRows(self.outf, self.pending["out"], "%2X")
+        writeRows(self.wavef, self.pending["wave"], "%d")
+        writeRows(self.keyf, self.pending["key"], "%2X")
+        self.pending = {"in":[], "out":[], "wave":[], "key":[]}
         
     def copyTo(self, srcTraces=None):
         pass        
@@ -134,6 +154,7 @@ class TraceContainerDPAv3(TraceContainer):
         self.writeInfo()
         
     def closeAll(self, clearTrace=True, clearText=True, clearKeys=True):
+        self.writePending()
         self.saveAllTraces()
         self.inf.close()
         self.outf.close()
@@ -301,30 +322,9 @@ class ImportDPAv3Dialog(QtFixes.QDialog):
         if self.validatePrefix(False) == False:
             return
         
-        ti = TraceContainer()
-        ti.numTraces = int(self.LETraces.text())
-        ti.numPoints = int(self.LEPoints.text())
-        ti.date = self.LEDate.text()
-        ti.scope = self.LEScope.text()
-        ti.targetHW = self.LETargetHW.text()
-        ti.targetSW = self.LETargetSW.text()
-        ti.notes = self.LENotes.text()
-
-        msg = QMessageBox()
-        msg.setText("Message from ChipWhisperer")
-        msg.setInformativeText("Importing, could take a while. This message dissappears when done")
-        msg.setStandardButtons(0)
-        msg.show()
-        self.trimport.loadAllTraces()
-    
-        tmp = tracereader_native.tracereader_native()
-        tmp.copyTo(self.trimport)
-        msg.close()
-
-        #Save file automatically
-        tmp.saveAllTraces(self.parent.parent.cwp.traceslocation + "/", prefix=self.prefixDirLE.text() + "_")
-
-        ti.prefix = self.prefixDirLE.text() + "_"
-        
-        ti.saveTrace(self.getTraceCfgFile())     
+        attrs = {"date":self.LEDate.text(), "scopeName":self.LEScope.text(), "targetHW":self.LETargetHW.text(),
+                 "targetSW":self.LETargetSW.text(), "notes":self.LENotes.text()}
+        progressBar = ProgressBar("Importing DPA Contest v3 traces", "Importing, could take a while.")
+        with progressBar:
+            self.trimport.importToNative(self.getTraceCfgFile(), self.prefixDirLE.text() + "_", attrs, progressBar=progressBar)
         self.close()
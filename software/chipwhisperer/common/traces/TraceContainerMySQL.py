@@ -26,6 +26,7 @@ import pickle
 import numpy as np
 from _base import TraceContainer
 from _cfgfile import makeAttrDict
+from _sqlbulk import TraceTable, UMySQLConnection
 
 try:
     import umysql as sql
@@ -44,7 +45,14 @@ class TraceContainerMySQL(TraceContainer):
         self.idOffset = 0
         self.lastId = 0
         self.openMode = openMode
-        self.fmt = None
+        self.fmt = "Raw Binary (bulk)"
+        self.tableName = ""
+        self.dbapi = None
+        self.table = None
+        self.pending = []
+        self.batchSize = 100
+        self.readAhead = 64
+        self.readBlock = {}
 
         traceParams = [{'name':'MySQL Configuration', 'type':'group', 'children':[
                         {'name':'Server Address', 'key':'addr', 'type':'str', 'value':'127.0.0.1'},
@@ -58,34 +66,67 @@ class TraceContainerMySQL(TraceContainer):
         if self.openMode == False:
             traceParams[0]['children'].append({'name':'Table Naming', 'key':'tableNameType', 'type':'list', 'values':{'Auto-Prefix':'prefix'}, 'value':'prefix'})
         else:
-            traceParams[0]['children'].append({'name':'Relist Tables', 'key':'tableListAct', 'type':'action'})
-            traceParams[0]['children'].append({'name':'Table List', 'key':'tableNameList', 'type':'list', 'values':[], 'value':'', 'linked':['Table Name']})
+            traceParams[0]['children'].append({'name':'Relist Tables', 'key':'tableListAct', 'type':'action', 'action':lambda _:self.listAllTables()})
+            traceParams[0]['children'].append({'name':'Table List', 'key':'tableNameList', 'type':'list', 'values':[], 'value':'',
+                                               'action':lambda p:self.configParam('tableName').setValue(p.getValue(), ignoreReadonly=True)})
 
-        traceParams[0]['children'].append({'name':'Trace Format', 'key':'traceFormat', 'type':'list', 'values':['NumPy Pickle'], 'value':'NumPy Pickle', 'set':self.setFormat})
-        self.params.addChildren(traceParams)
-
-        #Connect actions if applicable
-        try:
-            self.getParams.findParam('tableListAct').opts['action'] = self.listAllTables
-        except AttributeError:
-            pass
-
-        self.getParams.findParam('tableName').opts['get'] = self._getTableName
+        traceParams[0]['children'].append({'name':'Trace Format', 'key':'traceFormat', 'type':'list', 'values':['Raw Binary (bulk)', 'NumPy Pickle'], 'value':'Raw Binary (bulk)', 'action':lambda p:self.setFormat(p.getValue())})
+        traceParams[0]['children'].append({'name':'Insert Batch Size', 'key':'batchSize', 'type':'int', 'limits':(1, 10000), 'value':100, 'action':lambda p:self.setBatchSize(p.getValue())})
+        self.traceParams = traceParams
+        self.getParams().addChildren(traceParams)
 
         #Save extra configuration options
-        self.attrDict = makeAttrDict("MySQL Config", "mysql", self.getParams.traceParams)
+        self.attrDict = makeAttrDict("MySQL Config", "mysql", self.traceParams)
         self.config.attrList.append(self.attrDict)
 
         #Format name must agree with names from TraceContainerFormatList
         self.config.setAttr("format", "mysql")
 
+    def configParam(self, key):
+        """Parameter of the MySQL Configuration group, by the key also used in the .cfg file"""
+        for p in self.traceParams[0]['children']:
+            if p['key'] == key:
+                return self.findParam([self.traceParams[0]['name'], p['name']])
+        raise KeyError("No MySQL parameter with key %s" % key)
+
     def setFormat(self, fmt):
         self.fmt = fmt
 
-    def format(self):
-        if self.fmt is None:
-            self.fmt = self.findParam('traceFormat').getValue()
+    def setBatchSize(self, traces):
+        """Traces inserted per transaction in bulk mode"""
+        self.batchSize = traces
+
+    def isBulk(self):
+        """Bulk mode: traces keyed by index, stored as raw binary, inserted and read many rows at a time"""
+        return self.format() == "Raw Binary (bulk)"
+
+    def setConnection(self, conn, paramstyle='format', binary=str):
+        """Use an open DB-API connection (e.g. MySQLdb) for bulk mode instead of connecting with umysql"""
+        self.dbapi = conn
+        self.paramstyle = paramstyle
+        self.binary = binary
+
+    def makeTable(self, name):
+        return TraceTable(self.dbapi, name, getattr(self, 'paramstyle', 'format'), getattr(self, 'binary', str))
+
+    def connect(self):
+        """Connect with umysql, unless another DB-API connection was given with setConnection()"""
+        if self.dbapi is None or isinstance(self.dbapi, UMySQLConnection):
+            self.con()
+
+    def detectFormat(self):
+        """
+        Follow the layout of an existing table, whatever format is selected: bulk tables are keyed by TraceIndex,
+        tables of earlier versions by Id with pickled waves.
+        """
+        columns = self.table.columns()
+        if columns is not None:
+            fmt = "Raw Binary (bulk)" if "TraceIndex" in columns else "NumPy Pickle"
+            if fmt != self.format():
+                logging.info('Table %s uses the %s format' % (self.tableName, fmt))
+                self.configParam('traceFormat').setValue(fmt)
 
+    def format(self):
         return self.fmt
 
     def makePrefix(self, mode='prefix'):
@@ -103,16 +144,29 @@ class TraceContainerMySQL(TraceContainer):
         raise ValueError("Invalid mode: %s"%mode)
 
     def prepareDisk(self):
-        self.con()
+        self.connect()
         #CREATE DATABASE `cwtraces` /*!40100 COLLATE 'utf8_unicode_ci' */
-        traceprefix = self.makePrefix(self.getParams.findParam('tableNameType').getValue())
+        traceprefix = self.makePrefix(self.configParam('tableNameType').getValue())
 
         #Check version as simple validation
-        result = self.db.query("SELECT VERSION()")
-        logging.info('MySQL Version: %s' % result.rows[0][0])
+        if self.db is not None:
+            result = self.db.query("SELECT VERSION()")
+            logging.info('MySQL Version: %s' % result.rows[0][0])
 
         self.tableName = traceprefix
-
+        self.configParam('tableName').setValue(self.tableName, ignoreReadonly=True)
+        self.table = self.makeTable(self.tableName)
+        self.detectFormat()
+
+        if self.isBulk():
+            self.table.create()
+            self._numTraces = self.table.count()
+            self.pending = []
+            return
+
+        #Pickled tables are only written through umysql
+        if self.db is None:
+            self.con()
         self.db.query("CREATE TABLE IF NOT EXISTS %s(Id INT PRIMARY KEY AUTO_INCREMENT,\
          Textin VARCHAR(32),\
          EncKey VARCHAR(32),\
@@ -125,28 +179,27 @@ class TraceContainerMySQL(TraceContainer):
 
         db = sql.Connection()
 
-        server = self.getParams.findParam('addr').getValue()
-        port = int(self.getParams.findParam('port').getValue())
-        user = self.getParams.findParam('user').getValue()
-        password = self.getParams.findParam('password').getValue()
-        database = self.getParams.findParam('database').getValue()
+        server = self.configParam('addr').getValue()
+        port = int(self.configParam('port').getValue())
+        user = self.configParam('user').getValue()
+        password = self.configParam('password').getValue()
+        database = self.configParam('database').getValue()
 
         #Connection
         db.connect(server,port,user,password,database)
 
         self.db = db
-
-    def _getTableName(self):
-        return self.getParams.findParam('tableNameList').getValue()
+        if self.dbapi is None or isinstance(self.dbapi, UMySQLConnection):
+            self.dbapi = UMySQLConnection(db)
 
     def listAllTables(self):
         self.con()
-        database = self.getParams.findParam('database').getValue()
+        database = self.configParam('database').getValue()
         results = self.db.query("SHOW TABLES IN %s"%database)
         tables = []
         for r in results.rows:
             tables.append(r[0])
-        self.getParams.findParam('tableNameList').setLimits(tables)
+        self.configParam('tableNameList').setLimits(tables)
 
 
     def updatePointsTraces(self):
@@ -157,9 +210,21 @@ class TraceContainerMySQL(TraceContainer):
         self._numPoints = self.formatWave(wav, read=True).shape[0]
 
     def updateConfigData(self):
-        self.con()
-
-        self.tableName = self.getParams.findParam('tableName').getValue()
+        self.connect()
+
+        self.tableName = self.configParam('tableName').getValue()
+        self.table = self.makeTable(self.tableName)
+        self.detectFormat()
+        if self.isBulk():
+            self.readBlock = {}
+            self._numTraces = self.table.count()
+            self.config.setAttr('numTraces', self._numTraces)
+            self._numPoints = len(self.getTrace(0)) if self._numTraces else 0
+            self.config.setAttr('numPoints', self._numPoints)
+            return
+
+        if self.db is None:
+            self.con()
         res = self.db.query("SELECT COUNT(*) FROM %s" % self.tableName)
         self._numTraces = res.rows[0][0]
         self.config.setAttr('numTraces', self._numTraces)
@@ -179,19 +244,19 @@ class TraceContainerMySQL(TraceContainer):
         return self._numPoints
 
     def loadAllConfig(self):
-        for p in self.getParams.traceParams[0]['children']:
+        for p in self.traceParams[0]['children']:
             try:
                 val = self.config.attr(p["key"], "mysql")
-                self.getParams.findParam(p["key"]).setValue(val)
+                self.configParam(p["key"]).setValue(val, ignoreReadonly=True)
             except ValueError:
                 pass
-            #print "%s to %s=%s"%(p["key"], val, self.getParams.findParam(p["key"]).getValue())
+            #print "%s to %s=%s"%(p["key"], val, self.configParam(p["key"]).getValue())
 
     def loadAllTraces(self, path=None, prefix=None):
         self.updateConfigData()
 
     def formatWave(self, wave, read=False):
-        if self.getParams.format() == "NumPy Pickle":
+        if self.format() == "NumPy Pickle":
             if read == False:
                 return pickle.dumps(wave, protocol=2)
             else:
@@ -200,6 +265,13 @@ class TraceContainerMySQL(TraceContainer):
             raise AttributeError("Invalid Format for MySQL")
 
     def addTrace(self, trace, textin, textout, key, dtype=np.double):
+        if self.isBulk():
+            self.pending.append((textin, textout, key, np.array(trace, dtype=np.double)))
+            self._numPoints = len(trace)
+            if len(self.pending) >= self.batchSize:
+                self.flushPending()
+            return
+
         strTextin = ""
         for t in textin:
             strTextin += "%02X"%t
@@ -217,10 +289,19 @@ class TraceContainerMySQL(TraceContainer):
 
         self.db.query("INSERT INTO %s(Textin, Textout, EncKey, Wave) VALUES('%s', '%s', '%s', "%(self.tableName, strTextin, strTextout,
                                                                                                 strKey) + "%s)", (self.formatWave(trace),))
+
+    def flushPending(self):
+        """Insert the traces added since the last batch, as one multi-row transaction"""
+        if self.table is not None and self.pending:
+            self.table.insertMany(self._numTraces, self.pending)
+            self._numTraces += len(self.pending)
+            self.pending = []
+
     def saveAll(self):
         #Save attributes from config settings
-        for t in self.getParams.traceParams[0]['children']:
-            self.config.setAttr(t["key"],  self.getParams.findParam(t["key"]).getValue() ,"mysql")
+        for t in self.traceParams[0]['children']:
+            if 'value' in t:
+                self.config.setAttr(t["key"],  self.configParam(t["key"]).getValue() ,"mysql")
 
         #Save table name/prefix too
         self.config.setAttr("tableName", self.tableName, "mysql")
@@ -228,6 +309,7 @@ class TraceContainerMySQL(TraceContainer):
 
     def closeAll(self, clearTrace=True, clearText=True, clearKeys=True):
         # self.saveAllTraces(os.path.dirname(self.config.configFilename()), prefix=self.config.attr("prefix"))
+        self.flushPending()
 
         # Release memory associated with data in case this isn't deleted
         if clearTrace:
@@ -245,7 +327,18 @@ class TraceContainerMySQL(TraceContainer):
             self.db.close()
         self.db = None
 
+    def bulkRow(self, n):
+        """Row (TraceIndex, Textin, Textout, EncKey, Wave) of trace n, rows are read readAhead at a time"""
+        if n not in self.readBlock:
+            self.readBlock = dict((r[0], r) for r in self.table.fetch(n, n + self.readAhead))
+        return self.readBlock[n]
+
+    def bulkColumn(self, column, start, stop, decode):
+        return [decode(r[1]) for r in self.table.fetch(start, stop, (column,))]
+
     def getTrace(self, n):
+        if self.isBulk():
+            return TraceTable.decodeWave(self.bulkRow(n)[4])
         wv = self.db.query("SELECT Wave FROM %s LIMIT 1 OFFSET %d"%(self.tableName, n)).rows[0][0]
         return self.formatWave(wv, read=True)
 
@@ -256,15 +349,45 @@ class TraceContainerMySQL(TraceContainer):
         return lst
 
     def getTextin(self, n):
+        if self.isBulk():
+            return list(TraceTable.decodeBytes(self.bulkRow(n)[1]))
         asc = self.db.query("SELECT Textin FROM %s LIMIT 1 OFFSET %d"%(self.tableName, n)).rows[0][0]
         return self.asc2list(asc)
 
     def getTextout(self, n):
+        if self.isBulk():
+            return list(TraceTable.decodeBytes(self.bulkRow(n)[2]))
         asc = self.db.query("SELECT Textout FROM %s LIMIT 1 OFFSET %d"%(self.tableName, n)).rows[0][0]
         return self.asc2list(asc)
 
     def getKnownKey(self, n=None):
         if n is None:
             n = 0
+        if self.isBulk():
+            return list(TraceTable.decodeBytes(self.bulkRow(n)[3]))
         asc = self.db.query("SELECT EncKey FROM %s LIMIT 1 OFFSET %d"%(self.tableName, n)).rows[0][0]
         return self.asc2list(asc)
+
+    def getTraces(self, start, stop, pointRange=None):
+        if self.isBulk():
+            data = np.array(self.bulkColumn("Wave", start, stop, TraceTable.decodeWave))
+        else:
+            data = np.array([self.getTrace(n) for n in range(start, stop)])
+        if pointRange is not None:
+            data = data[:, pointRange[0]:pointRange[1]]
+        return data
+
+    def getTextins(self, start, stop):
+        if self.isBulk():
+            return np.array(self.bulkColumn("Textin", start, stop, TraceTable.decodeBytes))
+        return np.array([self.getTextin(n) for n in range(start, stop)])
+
+    def getTextouts(self, start, stop):
+        if self.isBulk():
+            return np.array(self.bulkColumn("Textout", start, stop, TraceTable.decodeBytes))
+        return np.array([self.getTextout(n) for n in range(start, stop)])
+
+    def getKnownKeys(self, start, stop):
+        if self.isBulk():
+            return [list(k) for k in self.bulkColumn("EncKey", start, stop, TraceTable.decodeBytes)]
+        return [self.getKnownKey(n) for n in range(start, stop)]
@@ -30,6 +30,13 @@ from _base import TraceContainer
 class TraceContainerNative(TraceContainer):
     _name = "ChipWhisperer/Native"
 
+    def useRawPoints(self, scale, offset):
+        if self.traces is not None:
+            if not self.isRaw() or (scale, offset) != self.getPointScaling():
+                return False
+        self.setPointScaling(scale, offset)
+        return True
+
     def copyTo(self, srcTraces=None):
         self.numTrace = srcTraces.numTraces()
         self.numPoint = srcTraces.numPoints()
@@ -51,6 +58,7 @@ class TraceContainerNative(TraceContainer):
             userdtype = np.float
 
         self.traces = np.array(srcTraces.traces, dtype=userdtype)
+        self.setPointScaling(*srcTraces.getPointScaling())
 
         # Traces copied in means not saved
         self.setDirty(True)
@@ -65,6 +73,8 @@ class TraceContainerNative(TraceContainer):
                 prefix = self.config.attr("prefix")
 
         self.traces = np.load(directory + "/%straces.npy" % prefix, mmap_mode='r')
+        self.pointScale = float(self.config.attr("pointScale"))
+        self.pointOffset = float(self.config.attr("pointOffset"))
         self.textins = np.load(directory + "/%stextin.npy" % prefix)
         self.textouts = np.load(directory + "/%stextout.npy" % prefix)
 
@@ -114,10 +124,13 @@ class TraceContainerNative(TraceContainer):
 
     def saveAllTraces(self, directory, prefix=""):
         self.config.saveTrace()
-        np.save(directory + "/%straces.npy" % prefix, self.traces)
-        np.save(directory + "/%stextin.npy" % prefix, self.textins)
-        np.save(directory + "/%stextout.npy" % prefix, self.textouts)
-        np.save(directory + "/%skeylist.npy" % prefix, self.keylist)
+        # Append buffers may have spare rows at the end
+        n = self.numTraces()
+        trim = lambda data: data[:n] if data is not None else None
+        np.save(directory + "/%straces.npy" % prefix, trim(self.traces))
+        np.save(directory + "/%stextin.npy" % prefix, trim(self.textins))
+        np.save(directory + "/%stextout.npy" % prefix, trim(self.textouts))
+        np.save(directory + "/%skeylist.npy" % prefix, trim(self.keylist))
         np.save(directory + "/%sknownkey.npy" % prefix, self.knownkey)
         self.setDirty(False)
 
@@ -30,7 +30,11 @@ except ImportError:
     TraceContainerMySQL = None
 
 import TraceContainerDPAv3
+import TraceContainerChunked
+import TraceContainerCompressed
 
-TraceContainerFormatList = {"native":TraceContainerNative.TraceContainerNative, "dpav3":TraceContainerDPAv3.TraceContainerDPAv3 }
+TraceContainerFormatList = {"native":TraceContainerNative.TraceContainerNative, "dpav3":TraceContainerDPAv3.TraceContainerDPAv3,
+                            "chunked":TraceContainerChunked.TraceContainerChunked,
+                            "compressed":TraceContainerCompressed.TraceContainerCompressed}
 if TraceContainerMySQL is not None:
     TraceContainerFormatList["mysql"] = TraceContainerMySQL.TraceContainerMySQL
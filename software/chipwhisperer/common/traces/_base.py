@@ -31,6 +31,38 @@ from chipwhisperer.common.utils.pluginmanager import Plugin
 from chipwhisperer.common.utils.parameter import Parameterized, Parameter
 
 
+def appendRow(buf, count, row, dtype=np.uint8):
+    """
+    Store row at index count of an append buffer and return the (possibly reallocated) buffer. Rows are kept
+    in a 2-D array of fixed dtype with spare rows, grown geometrically so appending is amortized O(1). Rows
+    that don't fit such an array (None, different lengths) switch the buffer to a plain list.
+    """
+    if isinstance(buf, list) and (len(buf) > 0 or count > 0):
+        del buf[count:]
+        buf.append(row)
+        return buf
+
+    try:
+        arow = np.asarray(row, dtype=dtype)
+    except (TypeError, ValueError):
+        arow = None
+
+    if arow is None or arow.ndim != 1 or (count > 0 and arow.shape[0] != buf.shape[1]):
+        rows = [] if buf is None else list(buf[:count])
+        rows.append(row)
+        return rows
+
+    if count == 0 and (buf is None or isinstance(buf, list) or buf.shape[1] != arow.shape[0]):
+        buf = np.zeros((16, arow.shape[0]), dtype=dtype)
+    elif count >= buf.shape[0]:
+        newbuf = np.zeros((2 * buf.shape[0], buf.shape[1]), dtype=dtype)
+        newbuf[:count] = buf[:count]
+        buf = newbuf
+
+    buf[count] = arow
+    return buf
+
+
 class TraceContainer(Parameterized, Plugin):
     """
     TraceContainer holds traces for the system to operate on. This can include both reading in traces for analysis, and
@@ -56,6 +88,11 @@ class TraceContainer(Parameterized, Plugin):
         self.textins = []
         self.textouts = []
         self.keylist = []
+        self._numTextins = 0
+        self._numTextouts = 0
+        self._numKeys = 0
+        # Buffers last returned by appendRow(), by attribute name
+        self._appendBuffers = {}
         self.knownkey = None
         self.dirty = False
         self.tracedtype = np.double
@@ -64,6 +101,8 @@ class TraceContainer(Parameterized, Plugin):
         self.pointhint = 0
         self._numTraces = 0
         self._isloaded = False
+        self.pointScale = 1.0
+        self.pointOffset = 0.0
 
     def setDirty(self, dirty):
         self.dirty = dirty
@@ -111,24 +150,24 @@ class TraceContainer(Parameterized, Plugin):
                 if dtype is None:
                     dtype = np.double
                 self.tracedtype = dtype
-                self.traces = np.zeros((self.tracehint, len(trace)), dtype=dtype)
+                self.traces = np.zeros((max(self.tracehint, 1), len(trace)), dtype=dtype)
                 self.traces[self._numTraces][:] = trace
             else:
                 # Check can fit this
                 if self.traces.shape[0] <= self._numTraces:
-                    if self._numTraces >= self.tracehint:
-                        # Tracehint wrong - increase by 25
-                        self.tracehint += 25
-
-                    # Do a resize now to allocate more memory
-                    self.traces.resize((self.tracehint, self.traces.shape[1]))
+                    # Grow geometrically (at least to the hint), so appending N traces costs O(N) copies in total.
+                    # A new array is used instead of resize(), which fails while views of the buffer exist.
+                    rows = max(self.tracehint, 2 * self.traces.shape[0], 16)
+                    newtraces = np.zeros((rows, self.traces.shape[1]), dtype=self.traces.dtype)
+                    newtraces[:self._numTraces] = self.traces[:self._numTraces]
+                    self.traces = newtraces
 
                 #Validate traces fit - if too short warn & pad (prevents aborting long captures)
                 pad = self.traces.shape[1] - len(trace)
                 if pad > 0:
                     logging.warning('Trace too short (length=%d)' % len(trace) + " *This MAY SUGGEST DATA CORRUPTION*")
                     logging.warning('Padding with %d zero points' % pad)
-                    trace.extend([0]*pad)
+                    trace = np.append(trace, np.zeros(pad, dtype=self.traces.dtype))
 
                 # Truncate traces that are too long to fit into the array.
                 #
@@ -157,26 +196,73 @@ class TraceContainer(Parameterized, Plugin):
         self.setDirty(True)
         self.writeDataToConfig()
 
+    def useRawPoints(self, scale, offset):
+        """
+        Request storing integer (raw ADC) points, where value = point * scale + offset. Returns False if
+        this container can't do that (e.g. float traces were already added), in which case the caller
+        should add converted traces instead.
+        """
+        return False
+
+    def setPointScaling(self, scale, offset):
+        """Set how stored integer points are converted to values, recorded in the .cfg file"""
+        self.pointScale = scale
+        self.pointOffset = offset
+        self.config.setAttr("pointScale", scale)
+        self.config.setAttr("pointOffset", offset)
+
+    def isRaw(self):
+        """True if traces are stored as integer points, which getTrace()/getTraces() convert on access"""
+        return self.traces is not None and self.traces.dtype.kind in 'iu'
+
+    def scalePoints(self, data):
+        """Convert stored points to values (no-op for float traces)"""
+        if data.dtype.kind in 'iu':
+            return data * self.pointScale + self.pointOffset
+        return data
+
     def setKnownKey(self, key):
         self.knownkey = key
 
+    def appendField(self, attr, counter, row):
+        """
+        Append row to the buffer self.<attr> holding self.<counter> rows. A buffer assigned directly (loaded,
+        copied from another container) rather than built here has all its rows in use, so the count is taken
+        from its length.
+        """
+        buf = getattr(self, attr)
+        count = getattr(self, counter)
+        if buf is not None and buf is not self._appendBuffers.get(attr):
+            count = len(buf)
+        buf = appendRow(buf, count, row)
+        setattr(self, attr, buf)
+        setattr(self, counter, count + 1)
+        self._appendBuffers[attr] = buf
+
     def addKey(self, key):
-        self.keylist.append(key)
+        self.appendField('keylist', '_numKeys', key)
 
     def addTextin(self, data):
-        self.textins.append(data)
+        self.appendField('textins', '_numTextins', data)
         
     def addTextout(self, data):
-        self.textouts.append(data)
+        self.appendField('textouts', '_numTextouts', data)
         
     def getTrace(self, n):
-        data = self.traces[n]
+        data = self.scalePoints(self.traces[n])
 
         #Following line will normalize all traces relative to each
         #other by mean & standard deviation
         #data = (data - np.mean(data)) / np.std(data)
         return data
 
+    def getTraceRaw(self, n):
+        """Return trace n as stored, i.e. integer points for raw traces (see getPointScaling())"""
+        return self.traces[n]
+
+    def getPointScaling(self):
+        return self.pointScale, self.pointOffset
+
     def getTextin(self, n):
         return self.textins[n]
 
@@ -189,6 +275,29 @@ class TraceContainer(Parameterized, Plugin):
                 return self.keylist[n]
 
         return self.knownkey
+
+    def getTraces(self, start, stop, pointRange=None):
+        """Return traces start...stop-1 as a view into the trace buffer (no copy, except for raw traces)"""
+        return self.scalePoints(self.getTracesRaw(start, stop, pointRange))
+
+    def getTracesRaw(self, start, stop, pointRange=None):
+        """Same as getTraces(), but without converting integer points"""
+        if pointRange is None:
+            return self.traces[start:stop]
+        return self.traces[start:stop, pointRange[0]:pointRange[1]]
+
+    def getTextins(self, start, stop):
+        return np.asarray(self.textins[start:stop])
+
+    def getTextouts(self, start, stop):
+        return np.asarray(self.textouts[start:stop])
+
+    def getKnownKeys(self, start, stop):
+        if hasattr(self, 'keylist'):
+            if self.keylist is not None:
+                return self.keylist[start:stop]
+
+        return [self.knownkey] * (stop - start)
     
     def getAuxDataConfig(self, newmodule):
         """
@@ -108,7 +108,9 @@ class TraceContainerConfig(object):
                     "scopeSampleRate":{"order":8, "value":0, "desc":"Sample Rate (s/sec)", "changed":False, "headerLabel":"Sample Rate", "editable":True},
                     "scopeYUnits":{"order":9, "value":0, "desc":"Units of Y Points", "changed":False, "editable":True},
                     "scopeXUnits":{"order":10, "value":0, "desc":"Units of X Points", "changed":False, "editable":True},
-                    "notes":{"order":11, "value":"", "desc":"Additional Notes about Capture Setup", "changed":False, "headerLabel":"Notes", "editable":True}                
+                    "notes":{"order":11, "value":"", "desc":"Additional Notes about Capture Setup", "changed":False, "headerLabel":"Notes", "editable":True},
+                    "pointScale":{"order":12, "value":1.0, "desc":"Scale of stored integer points (value = point * scale + offset)", "changed":False, "editable":False},
+                    "pointOffset":{"order":13, "value":0.0, "desc":"Offset of stored integer points (value = point * scale + offset)", "changed":False, "editable":False}
                     },
                 }
     
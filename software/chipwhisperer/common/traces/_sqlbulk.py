@@ -0,0 +1,172 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016 MARC
+# All rights reserved.
+#
+# Author: MARC
+#
+# Bulk storage of traces in an SQL table, used by TraceContainerMySQL. One row per trace,
+# keyed by the trace index:
+#
+#   TraceIndex  primary key, so a trace is found by direct lookup instead of OFFSET scans
+#   Textin, Textout, EncKey   raw bytes
+#   Wave        raw little-endian float64 points (no pickle)
+#
+# Rows are inserted in batches, each batch one transaction, and read in ranges of many rows per
+# query. TraceTable only needs a DB-API 2 connection (cursor/execute/executemany/commit), so it
+# works on MySQLdb or pymysql, on the umysql connection used by ChipWhisperer (see
+# UMySQLConnection) and on sqlite3 as a local stand-in for testing.
+
+import numpy as np
+
+
+WAVE_DTYPE = np.dtype('<f8')
+COLUMNS = ("Textin", "Textout", "EncKey", "Wave")
+
+
+class UMySQLConnection(object):
+    """
+    DB-API style wrapper around an umysql Connection, inserting executemany() rows with multi-row INSERTs. Each
+    INSERT is kept below maxStatementBytes, as the server rejects statements longer than its max_allowed_packet
+    (1 MB by default before MySQL 5.6, 4 MB since). Rows are split over several INSERTs of one transaction.
+    """
+    paramstyle = 'format'
+
+    def __init__(self, db, maxStatementBytes=1024 * 1024):
+        self.db = db
+        self.maxStatementBytes = maxStatementBytes
+        self.rows = []
+        self.description = None
+        self.intransaction = False
+
+    def cursor(self):
+        return self
+
+    def begin(self):
+        if not self.intransaction:
+            self.db.query("START TRANSACTION")
+            self.intransaction = True
+
+    def execute(self, sql, args=()):
+        self.begin()
+        result = self.db.query(sql, tuple(args))
+        self.rows = getattr(result, 'rows', [])
+        # umysql fields are (name, type), DB-API descriptions have 7 items starting with these
+        self.description = [tuple(f) + (None,) * 5 for f in getattr(result, 'fields', ())] or None
+
+    @staticmethod
+    def rowBytes(args):
+        """Upper bound of the statement length taken by one row, escaping may double binary data"""
+        return sum(2 * len(str(a)) + 4 for a in args) + 4
+
+    def executemany(self, sql, seq):
+        head, values = sql.split(" VALUES ", 1)
+        head = head + " VALUES "
+        rows = []
+        size = len(head)
+        for args in seq:
+            rowSize = self.rowBytes(args)
+            if rows and size + rowSize > self.maxStatementBytes:
+                self.execute(head + ", ".join([values] * len(rows)), [a for r in rows for a in r])
+                rows = []
+                size = len(head)
+            rows.append(args)
+            size += rowSize
+        if rows:
+            self.execute(head + ", ".join([values] * len(rows)), [a for r in rows for a in r])
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+    def commit(self):
+        if self.intransaction:
+            self.db.query("COMMIT")
+            self.intransaction = False
+
+    def rollback(self):
+        if self.intransaction:
+            self.db.query("ROLLBACK")
+            self.intransaction = False
+
+    def close(self):
+        self.db.close()
+
+
+def toBytes(data):
+    """Raw bytes of text/key data, empty for None"""
+    if data is None:
+        return ""
+    return np.asarray(data, dtype=np.uint8).tostring()
+
+
+class TraceTable(object):
+    """
+    Table of traces keyed by trace index. conn is a DB-API 2 connection, paramstyle and binary come from its
+    driver module (e.g. sqlite3.paramstyle, sqlite3.Binary).
+    """
+
+    def __init__(self, conn, name, paramstyle='format', binary=str):
+        self.conn = conn
+        self.name = name
+        self.binary = binary
+        self.mark = '?' if paramstyle == 'qmark' else '%s'
+
+    def sql(self, statement):
+        return statement.replace('%s', self.mark)
+
+    def query(self, statement, args=()):
+        cur = self.conn.cursor()
+        cur.execute(self.sql(statement), args)
+        rows = cur.fetchall()
+        self.conn.commit()
+        return rows
+
+    def create(self):
+        self.query("CREATE TABLE IF NOT EXISTS %s(TraceIndex INTEGER PRIMARY KEY, Textin VARBINARY(64), Textout VARBINARY(64), "
+                   "EncKey VARBINARY(64), Wave LONGBLOB)" % self.name)
+
+    def columns(self):
+        """Column names of the table, None if it does not exist"""
+        cur = self.conn.cursor()
+        try:
+            cur.execute("SELECT * FROM %s WHERE 1 = 0" % self.name)
+            cur.fetchall()
+        except Exception:
+            self.conn.rollback()
+            return None
+        self.conn.commit()
+        return [d[0] for d in cur.description]
+
+    def count(self):
+        return int(self.query("SELECT COUNT(*) FROM %s" % self.name)[0][0])
+
+    def insertMany(self, start, rows):
+        """Insert rows (textin, textout, key, wave) as traces start, start+1, ... in one transaction"""
+        if len(rows) == 0:
+            return
+        values = [(start + i, self.binary(toBytes(textin)), self.binary(toBytes(textout)), self.binary(toBytes(key)),
+                   self.binary(np.asarray(wave, dtype=WAVE_DTYPE).tostring())) for i, (textin, textout, key, wave) in enumerate(rows)]
+        cur = self.conn.cursor()
+        try:
+            cur.executemany(self.sql("INSERT INTO %s(TraceIndex, Textin, Textout, EncKey, Wave) VALUES (%%s, %%s, %%s, %%s, %%s)" % self.name), values)
+            self.conn.commit()
+        except:
+            self.conn.rollback()
+            raise
+
+    def fetch(self, start, stop, columns=COLUMNS):
+        """Rows of traces start...stop-1 (one query), each a tuple of TraceIndex and the columns in order"""
+        return self.query("SELECT TraceIndex, %s FROM %s WHERE TraceIndex >= %%s AND TraceIndex < %%s ORDER BY TraceIndex" %
+                          (", ".join(columns), self.name), (start, stop))
+
+    @staticmethod
+    def decodeWave(blob):
+        return np.frombuffer(bytes(blob), dtype=WAVE_DTYPE)
+
+    @staticmethod
+    def decodeBytes(blob):
+        return np.frombuffer(bytes(blob), dtype=np.uint8)
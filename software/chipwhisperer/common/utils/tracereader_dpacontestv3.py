@@ -26,6 +26,78 @@ import numpy as np
 import os
 import xml.etree.ElementTree as ET
 
+# Lines of the text files parsed at once
+BLOCK_LINES = 1000
+
+# Value of each hex digit character, by character code
+HEX_DIGITS = np.zeros(256, dtype=np.uint8)
+for _i, _c in enumerate("0123456789abcdef"):
+    HEX_DIGITS[ord(_c)] = _i
+    HEX_DIGITS[ord(_c.upper())] = _i
+
+
+def readBlocks(fname, lines=BLOCK_LINES):
+    """Yield the non-empty lines of a text file, a list of up to 'lines' lines at a time"""
+    f = open(fname, "r")
+    try:
+        block = []
+        for line in f:
+            if line.strip():
+                block.append(line)
+                if len(block) >= lines:
+                    yield block
+                    block = []
+        if block:
+            yield block
+    finally:
+        f.close()
+
+
+def parseDecimal(lines):
+    """Lines of space separated numbers to a 2-D float array (one row per line)"""
+    data = np.fromstring("".join(lines), dtype=np.float64, sep=" ")
+    if len(data) % len(lines):
+        raise ValueError("Lines have different number of values")
+    return data.reshape(len(lines), -1)
+
+
+def parseHex(lines):
+    """Lines of space separated hex bytes ('%2X ' per byte) to a 2-D uint8 array (one row per line)"""
+    tokens = np.array("".join(lines).split(), dtype="S2")
+    if len(tokens) % len(lines):
+        raise ValueError("Lines have different number of values")
+    chars = tokens.view(np.uint8).reshape(-1, 2)
+    # Single digit tokens are padded with NUL by the S2 dtype
+    single = chars[:, 1] == 0
+    values = np.where(single, HEX_DIGITS[chars[:, 0]], HEX_DIGITS[chars[:, 0]] * 16 + HEX_DIGITS[chars[:, 1]])
+    return values.astype(np.uint8).reshape(len(lines), -1)
+
+
+def loadText(fname, parse, lines=BLOCK_LINES):
+    """Parse a whole text file block by block, returns None if there is no file"""
+    try:
+        blocks = [parse(b) for b in readBlocks(fname, lines)]
+    except IOError:
+        return None
+    if len(blocks) == 0:
+        return None
+    return np.concatenate(blocks)
+
+
+def removeFiles(fnames):
+    """Delete the files that exist of fnames"""
+    for fname in fnames:
+        if os.path.exists(fname):
+            os.remove(fname)
+
+
+def importDPAv3(directory, cfgfile, prefix, attrs=None, progressBar=None):
+    """Import the DPA contest v3 traces in directory (info.xml, wave.txt, ...) as a native segment, see importToNative()"""
+    reader = tracereader_dpacontestv3()
+    reader.loadInfo(directory)
+    return reader.importToNative(cfgfile, prefix, attrs, progressBar=progressBar)
+
+
 class tracereader_dpacontestv3:
     def __init__(self):
         self.numTrace = None
@@ -60,30 +132,101 @@ class tracereader_dpacontestv3:
         if (self.numTrace == None):
             self.loadInfo(directory)
 
-        self.traces = np.loadtxt(os.path.join(directory, 'wave.txt'), ndmin=2)
+        self.traces = loadText(os.path.join(directory, 'wave.txt'), parseDecimal)
+        self.textins = loadText(os.path.join(directory, 'text_in.txt'), parseHex)
+        self.textouts = loadText(os.path.join(directory, 'text_out.txt'), parseHex)
 
-        try:
-            self.textins = np.loadtxt(os.path.join(directory, 'text_in.txt'), dtype='|S2',  ndmin=2)
-        except IOError:
-            self.textins = None
+        keys = loadText(os.path.join(directory, 'key.txt'), parseHex)
+        if keys is not None:
+            self.knownkey = list(keys[0])
+        else:
+            self.knownkey = None
 
-        try:
-            self.textouts = np.loadtxt(os.path.join(directory, 'text_out.txt'), dtype='|S2',  ndmin=2)
-        except IOError:
-            self.textouts = None
+    def infoAttrs(self):
+        """Trace .cfg attributes found in info.xml"""
+        attrs = {}
+        for tag, attr in (('Date', 'date'), ('Instrument', 'scopeName'), ('Module', 'targetHW'), ('Cipher', 'targetSW'), ('Notes', 'notes')):
+            found = self.xmlroot.findall(tag)
+            if found and found[0].text:
+                attrs[attr] = found[0].text
+        return attrs
 
-        try:
-           knownkey = np.loadtxt(os.path.join(directory, 'key.txt'), dtype='|S2',  ndmin=2)
-        except IOError:
-            knownkey = None
+    def importToNative(self, cfgfile, prefix, attrs=None, lines=BLOCK_LINES, progressBar=None):
+        """
+        Convert to a native ChipWhisperer trace segment, with config file cfgfile and data files <prefix>*.npy in
+        the same directory. wave.txt is parsed a block of lines at a time straight into a memory-mapped
+        <prefix>traces.npy, so the size of the import is not limited by the memory. attrs are extra .cfg
+        attributes (e.g. notes, targetHW). progressBar (e.g. ProgressBarText) is updated with the traces done
+        and can abort the import. Returns the new (unloaded) TraceContainerNative, or None if aborted.
+        """
+        from chipwhisperer.common.traces.TraceContainerNative import TraceContainerNative
 
+        if self.numTrace is None:
+            self.loadInfo()
+        directory = os.path.dirname(os.path.abspath(cfgfile))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        if progressBar:
+            progressBar.setMaximum(self.numTrace)
+            progressBar.setStatusMask("Imported %d of %d traces", (0, self.numTrace))
+
+        # Data files written so far, deleted if the import is aborted or fails, so a retry with the same
+        # prefix does not find a partial segment
+        written = [os.path.join(directory, "%straces.npy" % prefix)]
         try:
-            knownkey = knownkey[0]
-            self.knownkey = []
-            for r in knownkey:
-                self.knownkey.append(int(r, 16))
-        except:
-            self.knownkey = None
+            traces = np.lib.format.open_memmap(written[0], mode='w+', dtype=self.tracedtype, shape=(self.numTrace, self.numPoint))
+            n = 0
+            try:
+                for block in readBlocks(os.path.join(self.directory, 'wave.txt'), lines):
+                    data = parseDecimal(block)[:self.numTrace - n]
+                    traces[n:n + len(data)] = data
+                    n += len(data)
+                    if progressBar:
+                        progressBar.updateStatus(n, (n, self.numTrace))
+                        if progressBar.wasAborted():
+                            break
+                    if n >= self.numTrace:
+                        break
+                traces.flush()
+            finally:
+                # Unmap before the file may get deleted
+                del traces
+            if progressBar and progressBar.wasAborted():
+                removeFiles(written)
+                return None
+            if n < self.numTrace:
+                raise IOError("wave.txt holds %d traces, %d expected" % (n, self.numTrace))
+
+            for fname, field in (('text_in.txt', 'textin'), ('text_out.txt', 'textout')):
+                data = loadText(os.path.join(self.directory, fname), parseHex, lines)
+                if data is None:
+                    data = np.zeros((self.numTrace, 16), dtype=np.uint8)
+                written.append(os.path.join(directory, "%s%s.npy" % (prefix, field)))
+                np.save(written[-1], data[:self.numTrace])
+
+            keys = loadText(os.path.join(self.directory, 'key.txt'), parseHex, lines)
+            if keys is not None:
+                written.append(os.path.join(directory, "%sknownkey.npy" % prefix))
+                np.save(written[-1], keys[0])
+                if len(keys) >= self.numTrace:
+                    written.append(os.path.join(directory, "%skeylist.npy" % prefix))
+                    np.save(written[-1], keys[:self.numTrace])
+        except (IOError, ValueError):
+            removeFiles(written)
+            raise
+
+        ti = TraceContainerNative()
+        ti.config.setConfigFilename(cfgfile)
+        ti.config.setAttr("prefix", prefix)
+        ti.config.setAttr("numTraces", self.numTrace)
+        ti.config.setAttr("numPoints", self.numPoint)
+        info = self.infoAttrs()
+        info.update(attrs or {})
+        for k, v in info.items():
+            ti.config.setAttr(k, v)
+        ti.config.saveTrace()
+        return ti
 
     def numPoints(self):
         return self.numPoint
@@ -101,12 +244,10 @@ class tracereader_dpacontestv3:
         return data
 
     def getTextin(self, n):
-        tin = self.textins[n]
-        return map(int, tin, [16]*len(tin))
+        return list(self.textins[n])
 
     def getTextout(self, n):
-        tout = self.textouts[n]
-        return map(int, tout, [16]*len(tout))
+        return list(self.textouts[n])
 
     def getKnownKey(self):
         return self.knownkey
@@ -25,6 +25,7 @@
 #    along with chipwhisperer.  If not, see <http://www.gnu.org/licenses/>.
 #=================================================
 import logging
+import numpy as np
 
 from chipwhisperer.common.utils import util
 from chipwhisperer.common.utils.parameter import Parameterized, setupSetParam
@@ -72,6 +73,52 @@ class TraceSource(object):
         """Get known-key number n"""
         raise NotImplementedError
 
+    def getTracesIndexed(self, start, stop):
+        """
+        Return (traces, tnums) for traces start...stop-1: a 2-D array with the traces kept by the source, and
+        the trace number of each row. Traces rejected by the source (getTrace() returning None) are left out.
+        """
+        data = []
+        tnums = []
+        for n in range(start, stop):
+            trace = self.getTrace(n)
+            if trace is not None:
+                data.append(trace)
+                tnums.append(n)
+        return np.array(data), np.array(tnums, dtype=np.int)
+
+    def getTraces(self, start, stop, pointRange=None):
+        """Return traces start...stop-1 as a 2-D array, restricted to the points in pointRange=(first, last+1) if given.
+        Traces rejected by the source are left out."""
+        traces = self.getTracesIndexed(start, stop)[0]
+        if pointRange is not None and len(traces) > 0:
+            traces = traces[:, pointRange[0]:pointRange[1]]
+        return traces
+
+    def getTextins(self, start, stop):
+        """Get text-ins start...stop-1 as a 2-D array"""
+        return np.array([self.getTextin(n) for n in range(start, stop)])
+
+    def getTextouts(self, start, stop):
+        """Get text-outs start...stop-1 as a 2-D array"""
+        return np.array([self.getTextout(n) for n in range(start, stop)])
+
+    def getKnownKeys(self, start, stop):
+        """Get known-keys start...stop-1 as a list"""
+        return [self.getKnownKey(n) for n in range(start, stop)]
+
+    def getTraceBlock(self, start, stop, pointRange=None):
+        """
+        Return (traces, textins, textouts, knownkeys) for traces start...stop-1. Traces rejected by the
+        source are dropped from all four, so the rows always line up.
+        """
+        traces, tnums = self.getTracesIndexed(start, stop)
+        if pointRange is not None and len(traces) > 0:
+            traces = traces[:, pointRange[0]:pointRange[1]]
+        rows = tnums - start
+        knownkeys = self.getKnownKeys(start, stop)
+        return traces, self.getTextins(start, stop)[rows], self.getTextouts(start, stop)[rows], [knownkeys[i] for i in rows]
+
     def getSegmentList(self):
         """Return a list of segments."""
         raise NotImplementedError
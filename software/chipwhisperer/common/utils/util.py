@@ -27,6 +27,7 @@ import ast
 import collections
 import os.path
 import shutil
+import time
 import weakref
 
 try:
@@ -262,6 +263,34 @@ def updateUI():
         _uiupdateFunction()
 
 
+class AdaptivePoll(object):
+    """
+    Delay between polls of some status. Starts with a short sleep that grows geometrically up to maxDelay,
+    so fast events are noticed quickly while long waits don't flood the interface with status requests.
+    """
+    def __init__(self, timeout=None, minDelay=0.0005, maxDelay=0.05, factor=2.0):
+        self.minDelay = minDelay
+        self.maxDelay = maxDelay
+        self.factor = factor
+        self.timeout = timeout
+        self.reset()
+
+    def reset(self):
+        self.delay = self.minDelay
+        self.starttime = time.time()
+
+    def elapsed(self):
+        return time.time() - self.starttime
+
+    def expired(self):
+        """True once the timeout given at construction has passed"""
+        return self.timeout is not None and self.elapsed() > self.timeout
+
+    def wait(self):
+        time.sleep(self.delay)
+        self.delay = min(self.delay * self.factor, self.maxDelay)
+
+
 class WeakMethod(object):
     """A callable object. Takes one argument to init: 'object.method'.
     Once created, call this object -- MyWeakMethod() --
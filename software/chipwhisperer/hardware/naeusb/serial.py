@@ -131,14 +131,17 @@ class USART(object):
 
         resp = []
 
-        while dlen and timeout > 0:
+        # Only sleep while nothing is waiting, so back-to-back data (e.g. batched responses) is read without delay
+        deadline = time.time() + timeout / 1000.0
+        while dlen and time.time() < deadline:
             if waiting:
                 newdata = self._usb.usbdev().ctrl_transfer(0xC1, self.CMD_USART0_DATA, 0, 0, min(waiting, dlen), timeout=timeout)
                 resp.extend(newdata)
                 dlen -= len(newdata)
-            waiting = self.inWaiting()
-            timeout -= 1
-            time.sleep(0.001)
+            else:
+                time.sleep(0.001)
+            if dlen:
+                waiting = self.inWaiting()
 
         return resp
 
@@ -0,0 +1,59 @@
+import itertools
+from unittest import TestCase
+from chipwhisperer.capture.utils import GlitchSweep
+
+
+class TestGlitchSweep(TestCase):
+    def setUp(self):
+        # Offset and width as in the glitch tutorial, with a small window somewhere in the grid
+        self.window = [(6, 8), (-14, -12)]
+        self.margin = [2, 2]
+
+    def makeSweep(self, name, repeat=2):
+        params = [GlitchSweep.SweepParameter("Offset", -20, 20), GlitchSweep.SweepParameter("Width", -20, 20)]
+        return GlitchSweep.strategies[name](params, repeat=repeat, seed=1)
+
+    def runStrategy(self, name, stopOnSuccess=False):
+        sweep = self.makeSweep(name)
+        target = GlitchSweep.SimulatedGlitchTarget(self.window, margin=self.margin, seed=2)
+        log = GlitchSweep.runSweep(sweep, target.respond, stopOnSuccess=stopOnSuccess)
+        return sweep, target, log
+
+    def test_findsWindow(self):
+        for name in GlitchSweep.strategies:
+            sweep, target, log = self.runStrategy(name)
+            successes = sweep.successes()
+            self.assertTrue(successes, "%s did not find the window" % name)
+            for values, rate in successes:
+                self.assertTrue(target.inside(values), "%s: %s is outside the window" % (name, values))
+            self.assertEqual(len(log), sweep.attempts)
+            self.assertEqual(target.attempts, sweep.attempts)
+
+    def test_stopOnSuccess(self):
+        for name in GlitchSweep.strategies:
+            sweep, target, log = self.runStrategy(name, stopOnSuccess=True)
+            self.assertTrue(log[-1][3], name)
+            self.assertTrue(target.inside(log[-1][0]), name)
+            self.assertEqual([l for l in log if l[3]], [log[-1]], name)
+
+    def test_fullCoverage(self):
+        for name in ("Linear", "Random"):
+            sweep, target, log = self.runStrategy(name)
+            grid = set(itertools.product(*[range(n) for n in sweep.shape]))
+            self.assertEqual(set(sweep.results.keys()), grid, name)
+            self.assertEqual(len(sweep.results), sweep.total, name)
+            for point, res in sweep.results.items():
+                self.assertEqual(res[0], sweep.repeat, "%s tried %s %d times" % (name, point, res[0]))
+            self.assertEqual(len(log), sweep.total * sweep.repeat, name)
+
+    def test_repeatInARow(self):
+        sweep, target, log = self.runStrategy("Random")
+        for i in range(0, len(log), sweep.repeat):
+            self.assertEqual(len(set(tuple(l[0]) for l in log[i:i + sweep.repeat])), 1)
+
+    def test_maxAttempts(self):
+        params = [GlitchSweep.SweepParameter("Offset", -20, 20)]
+        for name, cls in GlitchSweep.strategies.items():
+            sweep = cls(params, maxAttempts=5, seed=1)
+            log = GlitchSweep.runSweep(sweep, lambda values: "Bad password\n")
+            self.assertEqual(len(log), 5, name)
@@ -0,0 +1,75 @@
+from unittest import TestCase
+from chipwhisperer.capture.targets.SimpleSerial import SimpleSerial
+from chipwhisperer.capture.targets.simpleserial_readers.loopback import SimpleSerial_Loopback
+
+
+def invert(key, text):
+    return bytearray([b ^ 0xff for b in text])
+
+
+class FaultyLoopback(SimpleSerial_Loopback):
+    """Loopback target replying with a bad header to the inputs in 'garble' and not at all to those in 'drop'"""
+
+    def __init__(self, garble=(), drop=()):
+        SimpleSerial_Loopback.__init__(self)
+        self.garble = set(garble)
+        self.drop = set(drop)
+
+    def command(self, line):
+        before = len(self.rxbuf)
+        SimpleSerial_Loopback.command(self, line)
+        text = line[1:]
+        if line.startswith("p") and text in self.drop:
+            self.rxbuf = self.rxbuf[:before]
+        elif line.startswith("p") and text in self.garble:
+            self.rxbuf = self.rxbuf[:before] + "q" + self.rxbuf[before + 1:]
+
+
+class TestSimpleSerialBatch(TestCase):
+    def setUp(self):
+        self.key = bytearray(range(16))
+        self.inputs = [bytearray([i] * 16) for i in range(7)]
+
+    def connect(self, ser, batchsize=3):
+        ser.setResponseFunction(invert)
+        target = SimpleSerial()
+        target.setConnection(ser, addToList=True)
+        target.findParam('batchsize').setValue(batchsize)
+        target.con()
+        return target
+
+    def hexText(self, i):
+        return "".join(["%02x" % b for b in self.inputs[i]])
+
+    def test_batch(self):
+        ser = SimpleSerial_Loopback()
+        target = self.connect(ser)
+        responses = target.runBatch(self.inputs, key=self.key)
+        self.assertEqual(responses, [invert(None, t) for t in self.inputs])
+        # One key command plus one command per input
+        self.assertEqual(ser.stats_commands, 1 + len(self.inputs))
+        self.assertEqual(ser.inWaiting(), 0)
+
+    def test_template_reused(self):
+        target = self.connect(SimpleSerial_Loopback())
+        template = target.outputTemplate(target.outputFormat())
+        target.runBatch(self.inputs, key=self.key)
+        self.assertIs(target.outputTemplate(target.outputFormat())[0], template[0])
+        target.findParam('cmdout').setValue('r$RESPONSE$\\r\\n')
+        self.assertIsNot(target.outputTemplate(target.outputFormat())[0], template[0])
+
+    def test_sync_error(self):
+        target = self.connect(FaultyLoopback(garble=[self.hexText(4)]))
+        responses = target.runBatch(self.inputs, key=self.key)
+        expected = [invert(None, t) for t in self.inputs]
+        expected[4] = None
+        self.assertEqual(responses, expected)
+
+    def test_short_read(self):
+        # No reply to input 4: the second batch (inputs 3-5) is short, the last one is read normally
+        target = self.connect(FaultyLoopback(drop=[self.hexText(4)]))
+        responses = target.runBatch(self.inputs, key=self.key)
+        self.assertEqual(len(responses), len(self.inputs))
+        self.assertEqual(responses[0:3], [invert(None, t) for t in self.inputs[0:3]])
+        self.assertIsNone(responses[5])
+        self.assertEqual(responses[6], invert(None, self.inputs[6]))
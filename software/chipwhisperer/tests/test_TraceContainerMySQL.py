@@ -0,0 +1,114 @@
+import sqlite3
+import unittest
+from unittest import TestCase
+import numpy as np
+from chipwhisperer.common.traces._sqlbulk import TraceTable
+
+try:
+    from chipwhisperer.common.traces.TraceContainerMySQL import TraceContainerMySQL
+except ImportError:
+    TraceContainerMySQL = None
+
+
+@unittest.skipIf(TraceContainerMySQL is None, "umysql not installed")
+class TestTraceContainerMySQLSQLite(TestCase):
+    """Bulk mode of the MySQL container, through a sqlite3 DB-API connection instead of a MySQL server"""
+    tableName = "tracedb_test_"
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.textins = [bytearray([i] * 16) for i in range(25)]
+        self.textouts = [bytearray([i ^ 0xff] * 16) for i in range(25)]
+        self.key = bytearray(range(16))
+        self.waves = [np.arange(50) * 0.25 + i for i in range(25)]
+
+    def tearDown(self):
+        self.conn.close()
+
+    def container(self, openMode=False):
+        tc = TraceContainerMySQL(openMode)
+        tc.setConnection(self.conn, sqlite3.paramstyle, sqlite3.Binary)
+        return tc
+
+    def table(self):
+        return TraceTable(self.conn, self.tableName, sqlite3.paramstyle, sqlite3.Binary)
+
+    def writer(self, batchSize=10):
+        tc = self.container()
+        tc.configParam('batchSize').setValue(batchSize)
+        tc.config.setAttr('prefix', 'test_')
+        tc.prepareDisk()
+        return tc
+
+    def writeAll(self, tc):
+        for i in range(len(self.waves)):
+            tc.addTrace(self.waves[i], self.textins[i], self.textouts[i], self.key)
+
+    def checkRead(self, tc):
+        self.assertTrue(np.array_equal(tc.getTraces(5, 15), self.waves[5:15]))
+        self.assertTrue(np.array_equal(tc.getTraces(20, 25, pointRange=(10, 20)), [w[10:20] for w in self.waves[20:25]]))
+        self.assertTrue(np.array_equal(tc.getTextins(0, 25), self.textins))
+        self.assertTrue(np.array_equal(tc.getTextouts(3, 7), self.textouts[3:7]))
+        self.assertEqual(tc.getKnownKeys(10, 12), [list(self.key)] * 2)
+        self.assertTrue(np.array_equal(tc.getTrace(24), self.waves[24]))
+        self.assertEqual(tc.getTextin(3), list(self.textins[3]))
+        self.assertEqual(tc.getTextout(3), list(self.textouts[3]))
+        self.assertEqual(tc.getKnownKey(), list(self.key))
+
+    def test_writeFlushRead(self):
+        tc = self.writer()
+        self.assertEqual(tc.tableName, self.tableName)
+        self.writeAll(tc)
+        # Two full batches inserted, the last 5 traces still pending
+        self.assertEqual(self.table().count(), 20)
+        tc.closeAll()
+        self.assertEqual(self.table().count(), 25)
+        self.assertEqual(tc.numTraces(), 25)
+        self.checkRead(tc)
+
+    def test_reopen(self):
+        tc = self.writer(batchSize=7)
+        self.writeAll(tc)
+        tc.closeAll()
+
+        reader = self.container(openMode=True)
+        reader.configParam('tableNameList').setLimits([self.tableName])
+        reader.configParam('tableNameList').setValue(self.tableName)
+        reader.loadAllTraces()
+        self.assertEqual(reader.numTraces(), 25)
+        self.assertEqual(reader.numPoints(), 50)
+        self.checkRead(reader)
+
+    def test_appendToTable(self):
+        tc = self.writer()
+        self.writeAll(tc)
+        tc.closeAll()
+        # Writing to the same table again continues after the existing traces
+        tc = self.writer()
+        self.assertEqual(tc.numTraces(), 25)
+        tc.addTrace(self.waves[0], self.textins[0], self.textouts[0], self.key)
+        tc.closeAll()
+        self.assertEqual(self.table().count(), 26)
+        self.assertTrue(np.array_equal(tc.getTraces(25, 26), self.waves[0:1]))
+
+    def test_detectFormat(self):
+        # Tables of earlier versions are keyed by Id and hold pickled waves
+        self.conn.execute("CREATE TABLE %s(Id INTEGER PRIMARY KEY, Textin VARCHAR(32), EncKey VARCHAR(32), "
+                          "Textout VARCHAR(32), Wave MEDIUMBLOB)" % self.tableName)
+        tc = self.container()
+        self.assertTrue(tc.isBulk())
+        tc.tableName = self.tableName
+        tc.table = tc.makeTable(self.tableName)
+        tc.detectFormat()
+        self.assertFalse(tc.isBulk())
+        self.assertEqual(tc.configParam('traceFormat').getValue(), "NumPy Pickle")
+
+        # Bulk tables are read in bulk even if the pickle format is selected
+        tc = self.container()
+        tc.configParam('traceFormat').setValue("NumPy Pickle")
+        tc.table = tc.makeTable("tracedb_bulk")
+        tc.detectFormat()
+        self.assertFalse(tc.isBulk())
+        tc.table.create()
+        tc.detectFormat()
+        self.assertTrue(tc.isBulk())
@@ -0,0 +1,90 @@
+import sqlite3
+from unittest import TestCase
+import numpy as np
+from chipwhisperer.common.traces._sqlbulk import TraceTable, UMySQLConnection
+
+
+def makeRows(start, count, points=50):
+    return [(bytearray([i % 256] * 16), bytearray([(i + 1) % 256] * 16), bytearray(range(16)), np.arange(points) * 0.5 + i)
+            for i in range(start, start + count)]
+
+
+class TestTraceTableSQLite(TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.table = TraceTable(self.conn, "traces", sqlite3.paramstyle, sqlite3.Binary)
+        self.table.create()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_insertFetch(self):
+        self.table.insertMany(0, makeRows(0, 10))
+        self.table.insertMany(10, makeRows(10, 5))
+        self.assertEqual(self.table.count(), 15)
+
+        rows = self.table.fetch(4, 12)
+        self.assertEqual([r[0] for r in rows], range(4, 12))
+        for r in rows:
+            textin, textout, key, wave = makeRows(r[0], 1)[0]
+            self.assertTrue(np.array_equal(TraceTable.decodeBytes(r[1]), textin))
+            self.assertTrue(np.array_equal(TraceTable.decodeBytes(r[2]), textout))
+            self.assertTrue(np.array_equal(TraceTable.decodeBytes(r[3]), key))
+            self.assertTrue(np.array_equal(TraceTable.decodeWave(r[4]), wave))
+
+    def test_fetchColumnsAndRanges(self):
+        self.table.insertMany(0, makeRows(0, 10))
+        rows = self.table.fetch(8, 20, ("Wave",))
+        self.assertEqual([r[0] for r in rows], [8, 9])
+        self.assertEqual(len(rows[0]), 2)
+        self.assertEqual(self.table.fetch(10, 20), [])
+        self.assertEqual(self.table.fetch(5, 5), [])
+
+    def test_emptyText(self):
+        self.table.insertMany(0, [(None, None, None, np.zeros(4))])
+        row = self.table.fetch(0, 1)[0]
+        self.assertEqual(len(TraceTable.decodeBytes(row[1])), 0)
+        self.assertEqual(TraceTable.decodeWave(row[4]).dtype, np.float64)
+
+    def test_rollback(self):
+        self.table.insertMany(0, makeRows(0, 10))
+        # Trace 9 exists already, so the whole batch fails
+        self.assertRaises(sqlite3.IntegrityError, self.table.insertMany, 5, makeRows(5, 10))
+        self.assertEqual(self.table.count(), 10)
+        self.table.insertMany(10, makeRows(10, 3))
+        self.assertEqual(self.table.count(), 13)
+
+
+class RecordingDB(object):
+    """Stands in for an umysql Connection, recording the statements"""
+
+    def __init__(self):
+        self.queries = []
+
+    def query(self, sql, args=()):
+        self.queries.append((sql, args))
+
+
+class TestUMySQLConnection(TestCase):
+    def test_splitInserts(self):
+        db = RecordingDB()
+        conn = UMySQLConnection(db, maxStatementBytes=8 * 1024)
+        table = TraceTable(conn, "traces")
+        rows = makeRows(0, 40, points=100)
+        table.insertMany(0, rows)
+
+        inserts = [q for q in db.queries if q[0].startswith("INSERT")]
+        self.assertTrue(len(inserts) > 1)
+        for sql, args in inserts:
+            self.assertTrue(len(sql) + sum(2 * len(str(a)) for a in args) <= conn.maxStatementBytes)
+            self.assertEqual(sql.count("(%s, %s, %s, %s, %s)"), len(args) // 5)
+        # Every row once, in order, all in one transaction
+        indexes = [args[i] for _, args in inserts for i in range(0, len(args), 5)]
+        self.assertEqual(indexes, range(40))
+        self.assertEqual([q[0] for q in db.queries if not q[0].startswith("INSERT")], ["START TRANSACTION", "COMMIT"])
+
+    def test_singleInsert(self):
+        db = RecordingDB()
+        table = TraceTable(UMySQLConnection(db), "traces")
+        table.insertMany(0, makeRows(0, 10))
+        self.assertEqual(len([q for q in db.queries if q[0].startswith("INSERT")]), 1)